@@ -2,22 +2,32 @@
 # SPDX-License-Identifier: MIT
 #
 """This module coordinates the query span approximation and the generation of new optimizer configurations for a query"""
+import os
+import statistics
+import time
 import connectors.connector
 import storage
+from autosteer.execution_scheduler import ExecutionScheduler, HintSetResult
+from autosteer.exploration_strategies import ExplorationReport, exploration_report
+from autosteer.model_guidance import get_model_guidance
 from autosteer.optimizer_config import HintSetExploration
+from autosteer.query_span import N_THREADS, explain_hint_sets
+from autosteer.sequential_test import WORSE, SequentialTest, get_sequential_test
+from connectors.connector_pool import ConnectorPool
 from utils.custom_logging import logger
 from utils.config import read_config
-from utils.util import read_sql_file, hash_sql_result, hash_query_plan
+from utils.util import read_sql_file, hash_sql_result
 
 
-def register_query_config_and_measurement(query_path, disabled_rules, logical_plan, timed_result=None, initial_call=False) -> bool:
-    """Register a new optimizer configuration and return whether the plan was already known"""
+def register_query_config_and_measurement(query_path, disabled_rules, logical_plan, plan_fingerprint: str, timed_result=None, initial_call=False) -> bool:
+    """Register a new optimizer configuration and return whether the plan was already known, plans are compared by their canonical fingerprint"""
 
     result_fingerprint = hash_sql_result(timed_result.result) if timed_result is not None else None
     if timed_result is not None and not storage.register_query_fingerprint(query_path, result_fingerprint):
         logger.warning('Result fingerprint=%s does not match existing fingerprint!', result_fingerprint)
 
-    plan_hash = int(hash_query_plan(str(logical_plan)), 16) & ((1 << 31) - 1)
+    # The hash column is a signed 64-bit integer in both schemas, 63 bits of the fingerprint make collisions negligible
+    plan_hash = int(plan_fingerprint, 16) & ((1 << 63) - 1)
 
     is_duplicate = storage.register_query_config(query_path, disabled_rules, logical_plan, plan_hash)
     if is_duplicate:
@@ -27,34 +37,178 @@ def register_query_config_and_measurement(query_path, disabled_rules, logical_pl
     return is_duplicate
 
 
-def explore_optimizer_configs(connector: connectors.connector.DBConnector, query_path):
-    """Use dynamic programming to find good optimizer configs"""
-    logger.info('Start exploring optimizer configs for query %s', query_path)
-    sql_query = read_sql_file(query_path)
+class QueryExploration:
+    """The exploration of a query in steps, each step executes some hint-sets of the current DP level such that the explorations
+    of several queries can be interleaved. The first step of a DP level explains all its hint-sets concurrently on separate
+    connections of the explain pool, only new query plans are executed. The exploration state is checkpointed after every executed hint-set, a resumed
+    exploration continues from the last checkpoint and executes only the missing repetitions of each hint-set. With adaptive_repeats,
+    a sequential test against the baseline decides how often a hint-set is executed."""
 
-    hint_set_exploration = HintSetExploration(query_path)
-    num_duplicate_plans = 0
-    while hint_set_exploration.has_next():
-        connector.set_disabled_knobs(hint_set_exploration.next())
-        query_plan = connector.explain(sql_query)
-        # Check if a new query plan is generated
-        if register_query_config_and_measurement(query_path, hint_set_exploration.get_disabled_opts_rules(), query_plan, timed_result=None, initial_call=True):
-            num_duplicate_plans += 1
-            continue
-        execute_hint_set(hint_set_exploration, connector, query_path, sql_query, query_plan)
-    logger.info('Found %s duplicated query plans!', num_duplicate_plans)
+    def __init__(self, connector: connectors.connector.DBConnector, explain_pool: ConnectorPool, query_path, resume=False, model_guidance=None):
+        self.connector = connector
+        self.explain_pool = explain_pool  # shared by the explorations of a benchmark
+        self.model_guidance = model_guidance  # shared by the explorations of a benchmark as well, None for an unguided exploration
+        self.query_path = query_path
+        self.resume = resume
+        self.sql_query = read_sql_file(query_path)
+        self.repeats = int(read_config()['autosteer']['repeats'])
+        self.hint_set_exploration = None
+        checkpoint = storage.load_exploration_checkpoint(query_path) if resume else None
+        self.completed = checkpoint is not None and checkpoint.completed
+        if self.completed:
+            logger.info('Exploration of query %s is complete, skip it', query_path)
+            return
+        logger.info('Start exploring optimizer configs for query %s', query_path)
+        if checkpoint is not None:
+            logger.info('Resume exploration of query %s at DP level %s with %s pending hint-sets', query_path, checkpoint.dp_level, len(checkpoint.pending))
+        self.hint_set_exploration = HintSetExploration(query_path, checkpoint)
+        self.num_duplicate_plans = 0
+        self.pending = []  # the hint-sets of the current DP level that are not measured yet
+        self.scheduled = []  # (hint-set, knobs, disabled rules, query plan, repetitions, sequential test) of new plans of the current DP level
+        self.timeout_usecs = None
 
+    def has_next(self) -> bool:
+        """Whether there are hint-sets left to execute, this proceeds to the next DP level if necessary.
+        The budget is checked before every hint-set, the scheduled hint-sets are dropped once it is exhausted."""
+        if self.completed:
+            return False
+        if len(self.scheduled) > 0 and self.hint_set_exploration.budget_exhausted():
+            logger.info('The exploration budget of query %s is exhausted, skip %s scheduled hint-sets', self.query_path, len(self.scheduled))
+            self.scheduled = []
+        return len(self.scheduled) > 0 or self.hint_set_exploration.has_next()
 
-def execute_hint_set(config: HintSetExploration, connector: connectors.connector.DBConnector, query_path: str, sql_query: str, query_plan: str):
-    """Execute and register measurements for an optimizer configuration"""
-    for _ in range(int(read_config()['autosteer']['repeats'])):
+    def num_scheduled(self) -> int:
+        """The number of hint-sets of the current DP level waiting for their execution"""
+        return len(self.scheduled)
+
+    def step(self, scheduler: ExecutionScheduler, max_hint_sets=None) -> int:
+        """Execute up to max_hint_sets hint-sets of the current DP level and return their number, the level is explained first. None executes
+        all hint-sets of the level or, with a time budget, one hint-set per worker.
+        The time spent in the steps counts against the exploration budget of the query."""
+        if max_hint_sets is None and self.hint_set_exploration.budget.max_secs > 0:
+            # The time budget is checked between the steps, a step executes one hint-set per worker
+            max_hint_sets = max(len(scheduler.workers), 1)
+        begin = time.monotonic()
         try:
-            timed_result = connector.execute(sql_query)
-        # pylint: disable=broad-except
-        except Exception as e:
-            logger.fatal('Optimizer %s cannot be disabled for %s - skip this config. The error: %s', config.get_disabled_opts_rules(), query_path, e)
-            break
+            return self._step(scheduler, max_hint_sets)
+        finally:
+            self.hint_set_exploration.budget.spend(time.monotonic() - begin)
+
+    def _step(self, scheduler: ExecutionScheduler, max_hint_sets) -> int:
+        if len(self.scheduled) == 0:
+            self._explain_level()
+        batch = self.scheduled if max_hint_sets is None else self.scheduled[:max_hint_sets]
+        self.scheduled = self.scheduled[len(batch):]
+        # The next DP level depends on the measurements of this level, register them before proceeding
+        results = scheduler.run(self.sql_query, [knobs for _, knobs, _, _, _, _ in batch], [repetitions for _, _, _, _, repetitions, _ in batch],
+                                [sequential_test for _, _, _, _, _, sequential_test in batch], self.timeout_usecs)
+        for (hint_set, _, disabled_rules, query_plan, _, _), result in zip(batch, results):
+            register_hint_set_result(result, self.hint_set_exploration, self.query_path, disabled_rules, query_plan,
+                                     self.connector.plan_fingerprint(query_plan))
+            self.hint_set_exploration.budget.record(len(result.timed_results) + (1 if result.timeout_usecs is not None else 0))
+            if self.model_guidance is not None:
+                self.model_guidance.observe(len(result.timed_results))
+            self.pending.remove(hint_set)
+            storage.save_exploration_checkpoint(self.query_path, self.hint_set_exploration.get_checkpoint(self.pending))
+        return len(batch)
+
+    def _explain_level(self) -> None:
+        exploration = self.hint_set_exploration
+        self.pending = list(exploration.hint_sets[exploration.iterator + 1:])
+        storage.save_exploration_checkpoint(self.query_path, exploration.get_checkpoint(self.pending))
+        baseline = storage.baseline_runtimes(self.query_path) if exploration.current_dp_level > 1 else None
+        self.timeout_usecs = get_timeout(baseline)
+        level = []
+        while exploration.has_next_in_level():
+            knobs = exploration.next()
+            level.append((exploration.get_hint_set(), knobs, exploration.get_disabled_opts_rules()))
+        level_plans = explain_hint_sets(self.explain_pool, self.sql_query, [knobs for _, knobs, _ in level])
+        for (hint_set, knobs, disabled_rules), query_plan in zip(level, level_plans):
+            # Check if a new query plan is generated, plans of the same level are compared by their hash as well
+            plan_fingerprint = self.connector.plan_fingerprint(query_plan)
+            if register_query_config_and_measurement(self.query_path, disabled_rules, query_plan, plan_fingerprint, timed_result=None, initial_call=True):
+                self.num_duplicate_plans += 1
+                self.pending.remove(hint_set)
+                continue
+            sequential_test = get_sequential_test(baseline)
+            remaining_repetitions = get_remaining_repetitions(self.query_path, disabled_rules, self.repeats, sequential_test, self.resume)
+            if remaining_repetitions == 0:
+                logger.info('Hint-set [%s] is measured already, skip it', disabled_rules)
+                self.pending.remove(hint_set)
+                continue
+            self.scheduled.append((hint_set, knobs, disabled_rules, query_plan, remaining_repetitions, sequential_test))
+        if self.model_guidance is not None:
+            # Execute the plans predicted to be fastest first and skip those predicted to be far slower than the baseline
+            query_plans = [query_plan for _, _, _, query_plan, _, _ in self.scheduled]
+            order, skipped = self.model_guidance.rank(query_plans, statistics.median(baseline) if baseline else None)
+            for i in skipped:
+                logger.info('Hint-set [%s] is predicted to be slower than the baseline, skip it', self.scheduled[i][2])
+                self.pending.remove(self.scheduled[i][0])
+            self.scheduled = [self.scheduled[i] for i in order]
+
+    def report(self) -> ExplorationReport:
+        return exploration_report(self.hint_set_exploration)
+
+    def finish(self) -> ExplorationReport:
+        """Checkpoint the completed exploration and report its savings"""
+        storage.save_exploration_checkpoint(self.query_path, self.hint_set_exploration.get_checkpoint([], completed=True))
+        self.completed = True
+        logger.info('Found %s duplicated query plans!', self.num_duplicate_plans)
+        report = self.report()
+        logger.info('%s', report)
+        return report
+
+
+def explore_optimizer_configs(connector: connectors.connector.DBConnector, query_path, resume=False) -> ExplorationReport:
+    """Use dynamic programming or the configured strategy to find good optimizer configs within the exploration budget and report
+    the savings found, the hint-sets of a DP level are executed by the execution scheduler, optionally in the order predicted by the TCNN."""
+    with ConnectorPool(connector.clone, N_THREADS, type(connector)) as explain_pool:
+        exploration = QueryExploration(connector, explain_pool, query_path, resume, get_model_guidance(connector, os.path.dirname(query_path)))
+        if exploration.completed:
+            return None
+        with ExecutionScheduler(connector) as scheduler:
+            while exploration.has_next():
+                exploration.step(scheduler)
+        return exploration.finish()
+
+
+def get_timeout(baseline: list):
+    """The deadline of the executions in usecs relative to the median runtime of the baseline or None if there is no deadline"""
+    config = read_config()['autosteer']
+    timeout_factor = float(config.get('timeout_factor', '0'))
+    if baseline is None or len(baseline) == 0 or timeout_factor <= 0:
+        return None
+    return int(max(timeout_factor * statistics.median(baseline), float(config.get('min_timeout_secs', '0')) * 1_000_000))
+
+
+def get_remaining_repetitions(query_path, disabled_rules, repeats, sequential_test: SequentialTest, resume) -> int:
+    """The number of executions left for a hint-set, the measurements of an interrupted training run count if the exploration is resumed"""
+    if resume and len(storage.hint_set_runtimes(query_path, disabled_rules, censored=True)) > 0:
+        return 0  # the hint-set was cancelled at its deadline
+    previous_runtimes = storage.hint_set_runtimes(query_path, disabled_rules) if resume else []
+    if sequential_test is None:
+        return max(repeats - len(previous_runtimes), 0)
+    sequential_test.previous = previous_runtimes
+    if len(previous_runtimes) > 0 and sequential_test.decide([]) is not None:
+        return 0
+    return max(sequential_test.max_repeats - len(previous_runtimes), 0)
+
 
-        if register_query_config_and_measurement(query_path, config.get_disabled_opts_rules(), query_plan, timed_result):
+def register_hint_set_result(result: HintSetResult, exploration: HintSetExploration, query_path: str, disabled_rules: str, query_plan: str,
+                             plan_fingerprint: str):
+    """Register the measurements of an optimizer configuration in the order of their execution, a hint-set that the sequential test
+    decides to be worse than the baseline is blacklisted"""
+    for timed_result in result.timed_results:
+        if register_query_config_and_measurement(query_path, disabled_rules, query_plan, plan_fingerprint, timed_result):
             logger.info('config results in already known query plan!')
-            break
+            return
+    if result.timeout_usecs is not None:
+        # The deadline is a lower bound of the runtime, a censored measurement blacklists the hint-set
+        logger.info('Hint-set [%s] is cancelled at its deadline of %s usecs', disabled_rules, result.timeout_usecs)
+        storage.register_measurement(query_path, disabled_rules, walltime=result.timeout_usecs, input_data_size=0, nodes=1, censored=True)
+    if result.decision is not None:
+        logger.info('Hint-set [%s] is %s after %s repetitions', disabled_rules, result.decision, len(result.timed_results))
+    if result.decision == WORSE:
+        exploration.blacklisted_hint_sets.add(frozenset(disabled_rules.split(',')))
+    if result.error is not None:
+        logger.fatal('Optimizer %s cannot be disabled for %s - skip this config. The error: %s', disabled_rules, query_path, result.error)
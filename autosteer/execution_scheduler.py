@@ -0,0 +1,157 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""This module executes the hint-sets of a DP level on a pool of database workers, each worker is a process bound to one database instance"""
+import multiprocessing
+import multiprocessing.connection
+from typing import Type
+import connectors.connector
+from autosteer.sequential_test import SequentialTest
+from utils.config import read_config
+from utils.custom_logging import logger
+
+
+class ExecutionTarget:
+    """A database instance or replica, given by a section of the connector's config file, running at most concurrency queries at a time"""
+
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+
+
+class HintSetResult:
+    """The timed results of the repeated executions of a hint-set and the error that stopped them, if any"""
+
+    def __init__(self, timed_results: list, error: str = None, target: str = None, decision: str = None, timeout_usecs: int = None):
+        self.timed_results = timed_results
+        self.error = error
+        self.target = target
+        self.decision = decision  # the decision of the sequential test stopping the repetitions
+        self.timeout_usecs = timeout_usecs  # the deadline of the last repetition if it was cancelled
+
+
+def get_execution_targets() -> list[ExecutionTarget]:
+    config = read_config()['autosteer']
+    concurrency = int(config.get('target_concurrency', '1'))
+    return [ExecutionTarget(name.strip(), concurrency) for name in config.get('execution_targets', 'DEFAULT').split(',') if len(name.strip()) > 0]
+
+
+def execute_repeatedly(connector: connectors.connector.DBConnector, sql_query: str, knobs: list, repeats: int,
+                       sequential_test: SequentialTest = None, timeout_usecs: int = None) -> HintSetResult:
+    """Execute a query repeatedly using the disabled knobs, stop at the first failed or cancelled execution or once the sequential test decides"""
+    timed_results = []
+    try:
+        connector.set_disabled_knobs(knobs)
+        for _ in range(repeats):
+            if timeout_usecs is None:
+                timed_results.append(connector.execute(sql_query))
+            else:
+                timed_results.append(connector.execute_with_timeout(sql_query, timeout_usecs))
+            decision = sequential_test.decide([result.time_usecs for result in timed_results]) if sequential_test is not None else None
+            if decision is not None:
+                return HintSetResult(timed_results, decision=decision)
+    except connectors.connector.QueryTimeout:
+        return HintSetResult(timed_results, timeout_usecs=timeout_usecs)
+    except Exception as e:  # pylint: disable=broad-except
+        return HintSetResult(timed_results, str(e))
+    return HintSetResult(timed_results)
+
+
+def _run_worker(connector_type: Type[connectors.connector.DBConnector], target: str, current, tasks, results):
+    """Execute tasks using a connector to the target until receiving None and send their results through the pipe results,
+    current holds the index of the task being executed or -1"""
+    try:
+        connector, error = connector_type(target), None
+    # pylint: disable=broad-except
+    except Exception as e:
+        connector, error = None, f'Cannot connect to target {target}: {e}'
+    for index, sql_query, knobs, repeats, sequential_test, timeout_usecs in iter(tasks.get, None):
+        current.value = index
+        result = HintSetResult([], error) if connector is None else execute_repeatedly(connector, sql_query, knobs, repeats, sequential_test, timeout_usecs)
+        result.target = target
+        results.send((index, result))
+        current.value = -1
+    if connector is not None:
+        connector.close()
+
+
+class ExecutionScheduler:
+    """Runs hint-sets on the worker processes of the execution targets and returns their results in the order of the hint-sets.
+    With a single worker, hint-sets run on the passed connector instead. The hint-set of a crashed worker fails with an error."""
+
+    def __init__(self, connector: connectors.connector.DBConnector, targets: list[ExecutionTarget] = None):
+        self.connector = connector
+        self.targets = get_execution_targets() if targets is None else targets
+        self.workers = []
+        self.worker_targets = []
+        self.current_tasks = []  # shared with the workers, the index of the hint-set a worker executes or -1
+        self.results = []  # the receiving ends of the pipes of the workers, a pipe is closed once its worker exits
+        if sum(target.concurrency for target in self.targets) > 1:
+            # Workers are spawned to not inherit the database connections of this process
+            context = multiprocessing.get_context('spawn')
+            self.tasks = context.Queue()
+            for target in self.targets:
+                for _ in range(target.concurrency):
+                    current = context.Value('i', -1, lock=False)
+                    receiver, sender = context.Pipe(duplex=False)
+                    worker = context.Process(target=_run_worker, args=(type(connector), target.name, current, self.tasks, sender), daemon=True)
+                    worker.start()
+                    sender.close()
+                    self.current_tasks.append(current)
+                    self.results.append(receiver)
+                    self.workers.append(worker)
+                    self.worker_targets.append(target.name)
+            logger.info('Execute hint-sets on %s workers of the targets %s', len(self.workers), [target.name for target in self.targets])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def run(self, sql_query: str, hint_sets: list[list], repeats: list[int], sequential_tests: list[SequentialTest] = None, timeout_usecs: int = None):
+        """Execute each hint-set at most the given number of times and cancel executions at the timeout, yield the result of each hint-set
+        in order as soon as the results of all previous hint-sets are available. The generator has to be exhausted before run is called again."""
+        tasks = list(zip(hint_sets, repeats, sequential_tests if sequential_tests is not None else [None] * len(hint_sets)))
+        if len(self.workers) == 0:
+            for knobs, num_repetitions, sequential_test in tasks:
+                yield execute_repeatedly(self.connector, sql_query, knobs, num_repetitions, sequential_test, timeout_usecs)
+            return
+        for index, (knobs, num_repetitions, sequential_test) in enumerate(tasks):
+            self.tasks.put((index, sql_query, knobs, num_repetitions, sequential_test, timeout_usecs))
+        finished_results = {}
+        next_index = 0
+        while next_index < len(tasks):
+            # The pipe of a worker becomes readable with its results and once the worker exits
+            receivers = [receiver for receiver in self.results if not receiver.closed]
+            if len(receivers) == 0:
+                finished_results.update({index: HintSetResult([], 'No worker is alive') for index in range(next_index, len(tasks))
+                                         if index not in finished_results})
+            for receiver in multiprocessing.connection.wait(receivers) if len(receivers) > 0 else []:
+                try:
+                    index, result = receiver.recv()
+                    finished_results[index] = result
+                except EOFError:
+                    receiver.close()
+                    finished_results.update(self._lost_result(self.results.index(receiver), set(range(next_index, len(tasks)))))
+            while next_index in finished_results:
+                yield finished_results.pop(next_index)
+                next_index += 1
+
+    def _lost_result(self, worker: int, unfinished: set) -> dict:
+        """The error result of the unfinished hint-set a crashed worker was executing, if any"""
+        process, index = self.workers[worker], self.current_tasks[worker].value
+        process.join()
+        if index not in unfinished:
+            return {}
+        logger.error('The worker executing hint-set %s on target %s exited with code %s', index, self.worker_targets[worker], process.exitcode)
+        return {index: HintSetResult([], f'The worker exited with code {process.exitcode}', self.worker_targets[worker])}
+
+    def close(self):
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+        for receiver in self.results:
+            receiver.close()
+        self.workers = []
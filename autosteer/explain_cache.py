@@ -0,0 +1,121 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""A persistent LRU cache of query plans stored next to the results database, repeated training runs do not explain the same queries again"""
+import atexit
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import storage
+from utils.config import read_config
+from utils.custom_logging import logger
+
+_SCHEMA = ['CREATE TABLE IF NOT EXISTS explain_cache (key TEXT PRIMARY KEY, compression TEXT NOT NULL, plan BLOB NOT NULL, last_used INTEGER NOT NULL)',
+           'CREATE INDEX IF NOT EXISTS explain_cache_last_used ON explain_cache (last_used)',
+           'CREATE TABLE IF NOT EXISTS explain_cache_version (version TEXT NOT NULL)']
+_SQL_TOKENS = re.compile(r"('(?:[^']|'')*')|\s+")
+MAX_ENTRIES = int(read_config()['autosteer'].get('explain_cache_size', '0'))  # 0 disables the cache
+VERSION = read_config()['autosteer'].get('explain_cache_version', '')  # the user-supplied version of the schema and statistics
+EXPLAIN_CACHES = {}  # cache file -> ExplainCache
+_LOCK = threading.Lock()
+
+
+def normalize_sql(sql_query: str) -> str:
+    """Collapse whitespace outside of string literals and drop trailing semicolons"""
+    return _SQL_TOKENS.sub(lambda match: match.group(1) or ' ', sql_query).strip().rstrip(';').rstrip()
+
+
+class ExplainCache:
+    """Maps the normalized query, the sorted disabled knobs, and the connector to the query plan. The cache holds at most
+    max_entries plans and evicts the least recently used ones. All plans are dropped once the schema/statistics version changes."""
+
+    def __init__(self, filename: str, connector_name: str, version: str, max_entries: int):
+        self.connector_name = connector_name
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        for statement in _SCHEMA:
+            self.connection.execute(statement)
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            stored_version = self.connection.execute('SELECT version FROM explain_cache_version').fetchone()
+            if stored_version is None or stored_version[0] != version:
+                if stored_version is not None:
+                    logger.info('The schema/statistics version changed from %s to %s, invalidate the explain cache', stored_version[0], version)
+                self.connection.execute('DELETE FROM explain_cache')
+                self.connection.execute('DELETE FROM explain_cache_version')
+                self.connection.execute('INSERT INTO explain_cache_version (version) VALUES (?)', (version,))
+        self.clock, self.num_entries = self.connection.execute('SELECT coalesce(max(last_used), 0), count(*) FROM explain_cache').fetchone()
+
+    def key(self, sql_query: str, knobs: list) -> str:
+        key = [self.connector_name, self.version, normalize_sql(sql_query), sorted(set(knobs))]
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    def get(self, sql_query: str, knobs: list):
+        """The cached plan of the query with the knobs disabled or None"""
+        key = self.key(sql_query, knobs)
+        with self.lock:
+            row = self.connection.execute('SELECT compression, plan FROM explain_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.clock += 1
+            self.connection.execute('UPDATE explain_cache SET last_used = ? WHERE key = ?', (self.clock, key))
+        return storage.decompress_plan(row[1], row[0])
+
+    def put(self, sql_query: str, knobs: list, plan: str) -> None:
+        compression, data = storage.encode_plan(plan)
+        with self.lock:
+            self.clock += 1
+            with self.connection:
+                self.connection.execute('BEGIN IMMEDIATE')
+                cursor = self.connection.execute('INSERT OR REPLACE INTO explain_cache (key, compression, plan, last_used) VALUES (?, ?, ?, ?)',
+                                                 (self.key(sql_query, knobs), compression, data, self.clock))
+                self.num_entries += cursor.rowcount
+                if self.num_entries > self.max_entries:
+                    # Other processes may share the cache file, evict based on the actual number of entries
+                    self.num_entries = self.connection.execute('SELECT count(*) FROM explain_cache').fetchone()[0]
+                    excess = self.num_entries - self.max_entries
+                    if excess > 0:
+                        self.connection.execute('DELETE FROM explain_cache WHERE key IN (SELECT key FROM explain_cache ORDER BY last_used LIMIT ?)', (excess,))
+                        self.num_entries -= excess
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __str__(self):
+        return f'Explain cache: {self.hits} hits, {self.misses} misses, {self.num_entries} of at most {self.max_entries} plans cached'
+
+
+def get_explain_cache(connector_type):
+    """The explain cache of the connector in the results directory or None if the cache is disabled"""
+    if MAX_ENTRIES <= 0:
+        return None
+    filename = f'{storage.RESULTS_DIRECTORY}/{connector_type.get_name()}_explain_cache.sqlite'
+    cache = EXPLAIN_CACHES.get(filename)
+    if cache is None or cache.version != VERSION or cache.max_entries != MAX_ENTRIES:
+        with _LOCK:
+            cache = EXPLAIN_CACHES.get(filename)
+            if cache is None or cache.version != VERSION or cache.max_entries != MAX_ENTRIES:
+                if cache is not None:
+                    cache.close()
+                cache = EXPLAIN_CACHES[filename] = ExplainCache(filename, connector_type.get_name(), VERSION, MAX_ENTRIES)
+    return cache
+
+
+def close() -> None:
+    """Close all explain caches"""
+    for cache in EXPLAIN_CACHES.values():
+        logger.info('%s', cache)
+        cache.close()
+    EXPLAIN_CACHES.clear()
+
+
+atexit.register(close)
@@ -0,0 +1,213 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""This module provides the strategies choosing the hint-sets that the HintSetExploration executes after the default plan and the single knobs,
+and the budget bounding the exploration of a query"""
+import math
+import numpy as np
+import storage
+from utils.config import read_config
+
+
+class ExplorationBudget:
+    """Bounds the exploration of a query by the time spent on it and its number of executions, a limit of 0 means unbounded.
+    The time spent on other queries while the explorations of a benchmark are interleaved does not count."""
+
+    def __init__(self, max_secs=0.0, max_executions=0, executions_per_hint_set=1):
+        self.max_secs = max_secs
+        self.max_executions = max_executions
+        self.executions_per_hint_set = executions_per_hint_set
+        self.seconds = 0.0
+        self.executions = 0
+
+    def record(self, num_executions: int) -> None:
+        self.executions += num_executions
+
+    def spend(self, seconds: float) -> None:
+        self.seconds += seconds
+
+    def elapsed_secs(self) -> float:
+        return self.seconds
+
+    def exhausted(self) -> bool:
+        return 0 < self.max_secs <= self.elapsed_secs() or 0 < self.max_executions <= self.executions
+
+    def truncate(self, hint_sets: list) -> list:
+        """The hint-sets that fit into the remaining executions"""
+        if self.max_executions <= 0:
+            return hint_sets
+        return hint_sets[:max((self.max_executions - self.executions) // self.executions_per_hint_set, 1)]
+
+
+class ExplorationStrategy:
+    """Chooses the hint-sets of the next level from the measurements of the previous levels.
+    Level 0 executes the default plan and level 1 disables single knobs, the strategy takes over from level 2."""
+    name = None
+
+    def __init__(self, exploration, max_levels: int):
+        self.exploration = exploration  # the HintSetExploration
+        self.max_levels = max_levels
+
+    def next_hint_sets(self, level: int, baseline_median: float, baseline_mean: float):
+        """The hint-sets of the level or None to stop the exploration"""
+        raise NotImplementedError
+
+    def _single_knobs(self, baseline_median, baseline_mean) -> list:
+        """The promising single knobs and the alternative knobs that only become effective in combination with their dependencies"""
+        return self.exploration.get_promising_measurements_by_num_rules(1, baseline_median, baseline_mean) + \
+            [[knob] for knob in self.exploration.query_span.dependencies]
+
+    def _ranked(self, num_disabled_rules, baseline_median, baseline_mean) -> list:
+        """The promising hint-sets disabling num_disabled_rules knobs, fastest first"""
+        promising = self.exploration.get_promising_measurements_by_num_rules(num_disabled_rules, baseline_median, baseline_mean)
+        statistics = storage.measurement_index(self.exploration.query_path).statistics(num_disabled_rules)
+        return sorted(promising, key=lambda hint_set: (statistics[','.join(hint_set)][0], hint_set))
+
+
+class DPStrategy(ExplorationStrategy):
+    """AutoSteer's dynamic programming: combine all promising hint-sets of the previous level with all promising single knobs"""
+    name = 'dp'
+
+    def next_hint_sets(self, level, baseline_median, baseline_mean):
+        if level > self.max_levels or level > len(self.exploration.tunable_knobs):
+            return None
+        combinations_previous_run = self.exploration.get_promising_measurements_by_num_rules(level - 1, baseline_median, baseline_mean)
+        return self.exploration.dp_combine(self._single_knobs(baseline_median, baseline_mean), combinations_previous_run)
+
+
+class BeamSearchStrategy(ExplorationStrategy):
+    """Like the dynamic programming, but only the beam_width fastest hint-sets of the previous level are extended"""
+    name = 'beam'
+
+    def __init__(self, exploration, max_levels: int, beam_width: int):
+        super().__init__(exploration, max_levels)
+        self.beam_width = beam_width
+
+    def next_hint_sets(self, level, baseline_median, baseline_mean):
+        if level > self.max_levels or level > len(self.exploration.tunable_knobs):
+            return None
+        beam = self._ranked(level - 1, baseline_median, baseline_mean)[:self.beam_width]
+        return self.exploration.dp_combine(self._single_knobs(baseline_median, baseline_mean), beam)
+
+
+class GreedyForwardStrategy(BeamSearchStrategy):
+    """Forward selection: extend the fastest hint-set by one knob per level and stop once a level does not improve on the previous one"""
+    name = 'greedy'
+
+    def __init__(self, exploration, max_levels: int):
+        super().__init__(exploration, max_levels, beam_width=1)
+        self.best_median = None
+
+    def next_hint_sets(self, level, baseline_median, baseline_mean):
+        ranked = self._ranked(level - 1, baseline_median, baseline_mean)
+        if len(ranked) == 0:
+            return None
+        median = storage.measurement_index(self.exploration.query_path).statistics(level - 1)[','.join(ranked[0])][0]
+        if self.best_median is not None and median >= self.best_median:
+            return None
+        self.best_median = median
+        return super().next_hint_sets(level, baseline_median, baseline_mean)
+
+
+class UCBStrategy(ExplorationStrategy):
+    """A bandit over hint-sets: every level (a round) executes the arms_per_round hint-sets with the highest upper confidence bound
+    of their relative savings. The arms are the measured hint-sets that are not blacklisted and their untried combinations with the
+    promising single knobs, an untried arm is executed before any arm is executed again. Arms proposed before are not untried anymore,
+    even if they were skipped or their plan is a duplicate and they never got a runtime."""
+    name = 'ucb'
+
+    def __init__(self, exploration, max_levels: int, arms_per_round: int, exploration_weight: float):
+        super().__init__(exploration, max_levels)
+        self.arms_per_round = arms_per_round
+        self.exploration_weight = exploration_weight
+        self.proposed = set()  # the disabled rules of the arms proposed so far
+
+    def next_hint_sets(self, level, baseline_median, baseline_mean):
+        if level > self.max_levels:
+            return None
+        index = storage.measurement_index(self.exploration.query_path)
+        promising = []
+        for num_disabled_rules in sorted(set(index.num_disabled_rules.values()) - {0}):
+            promising += self.exploration.get_promising_measurements_by_num_rules(num_disabled_rules, baseline_median, baseline_mean)
+        knob_index, blacklist = self.exploration.knob_index, self.exploration.blacklisted_hint_sets
+        arms = {disabled_rules: np.array(runtimes, dtype=float) for disabled_rules, runtimes in index.runtimes.items()
+                if disabled_rules is not None and len(runtimes) > 0 and not blacklist.prunes(knob_index.mask(disabled_rules.split(',')))}
+        untried = [hint_set for hint_set in self.exploration.dp_combine(self._single_knobs(baseline_median, baseline_mean), promising)
+                   if ','.join(hint_set) not in index.runtimes and ','.join(hint_set) not in self.proposed]
+        total_pulls = sum(len(runtimes) for runtimes in arms.values())
+        scores = []
+        for disabled_rules, runtimes in arms.items():
+            savings = np.clip(1 - runtimes / baseline_median, -1, 1)
+            bound = savings.mean() + self.exploration_weight * math.sqrt(2 * math.log(max(total_pulls, 1)) / len(runtimes))
+            scores.append((-bound, disabled_rules.split(',')))
+        hint_sets = (untried + [hint_set for _, hint_set in sorted(scores)])[:self.arms_per_round]
+        self.proposed.update(','.join(hint_set) for hint_set in hint_sets)
+        return hint_sets or None
+
+
+STRATEGIES = {strategy.name: strategy for strategy in [DPStrategy, BeamSearchStrategy, GreedyForwardStrategy, UCBStrategy]}
+
+
+def get_exploration_strategy(exploration) -> ExplorationStrategy:
+    """The strategy configured in the autosteer section of config.cfg"""
+    config = read_config()['autosteer']
+    name = config.get('strategy', 'dp')
+    if name not in STRATEGIES:
+        raise ValueError(f'Unknown exploration strategy {name}, choose one of {", ".join(STRATEGIES)}')
+    max_levels = int(config.get('max_dp_depth', '3'))
+    if name == BeamSearchStrategy.name:
+        return BeamSearchStrategy(exploration, max_levels, int(config.get('beam_width', '4')))
+    if name == GreedyForwardStrategy.name:
+        return GreedyForwardStrategy(exploration, max_levels)
+    if name == UCBStrategy.name:
+        # The levels of the bandit are its rounds, the first round starts at level 2
+        return UCBStrategy(exploration, int(config.get('ucb_rounds', '10')) + 1, int(config.get('beam_width', '4')),
+                           float(config.get('ucb_exploration', '1.0')))
+    return DPStrategy(exploration, max_levels)
+
+
+def get_exploration_budget() -> ExplorationBudget:
+    """The budget configured in the autosteer section of config.cfg"""
+    config = read_config()['autosteer']
+    return ExplorationBudget(float(config.get('budget_secs', '0')), int(config.get('budget_executions', '0')), int(config['repeats']))
+
+
+class ExplorationReport:
+    """Summarizes the exploration of a query: the savings of the fastest hint-set found relative to the time spent"""
+
+    def __init__(self, query_path, strategy, seconds, executions, baseline_median, best_hint_set, best_median):
+        self.query_path = query_path
+        self.strategy = strategy
+        self.seconds = seconds
+        self.executions = executions
+        self.baseline_median = baseline_median
+        self.best_hint_set = best_hint_set  # the disabled rules of the fastest hint-set, None for the default plan
+        self.best_median = best_median
+
+    def savings_usecs(self) -> float:
+        """The median runtime saved per execution of the query"""
+        if self.baseline_median is None or self.best_median is None:
+            return 0.0
+        return max(self.baseline_median - self.best_median, 0.0)
+
+    def savings_per_second(self) -> float:
+        """The savings per second spent on the exploration"""
+        return self.savings_usecs() / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return f'Exploration of {self.query_path} with strategy {self.strategy}: [{self.best_hint_set}] saves {self.savings_usecs():.0f} of ' \
+               f'{self.baseline_median} usecs after {self.executions} executions in {self.seconds:.1f}s ({self.savings_per_second():.1f} usecs/s)'
+
+
+def exploration_report(exploration) -> ExplorationReport:
+    """The report of a HintSetExploration, the fastest hint-set has the lowest median runtime and no censored measurement"""
+    index = storage.measurement_index(exploration.query_path)
+    baseline = index.summary(None)
+    baseline_median = baseline[0] if baseline is not None else None
+    best_hint_set, best_median = None, baseline_median
+    for num_disabled_rules in sorted(set(index.num_disabled_rules.values()) - {0}):
+        for disabled_rules, (median, _, num_censored) in index.statistics(num_disabled_rules).items():
+            if num_censored == 0 and (best_median is None or median < best_median):
+                best_hint_set, best_median = disabled_rules, median
+    return ExplorationReport(exploration.query_path, exploration.strategy.name, exploration.budget.elapsed_secs(), exploration.budget.executions,
+                             baseline_median, best_hint_set, best_median)
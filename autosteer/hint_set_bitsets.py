@@ -0,0 +1,109 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""This module represents hint-sets as integer bitmasks over the knobs of a query, the DP exploration combines and prunes them with bit operations"""
+
+
+class KnobIndex:
+    """Assigns a bit to every knob of a query, knobs that are not known yet get the next free bit"""
+
+    def __init__(self, knobs=()):
+        self.bits = {}  # knob -> bit
+        self.knobs = []  # bit position -> knob
+        for knob in knobs:
+            self.bit(knob)
+
+    def bit(self, knob) -> int:
+        if knob not in self.bits:
+            self.bits[knob] = 1 << len(self.knobs)
+            self.knobs.append(knob)
+        return self.bits[knob]
+
+    def mask(self, knobs) -> int:
+        """The bitmask of a hint-set given by its knobs"""
+        mask = 0
+        for knob in knobs:
+            mask |= self.bit(knob)
+        return mask
+
+    def get_knobs(self, mask) -> list:
+        """The sorted knobs of a bitmask"""
+        knobs = []
+        while mask:
+            lowest = mask & -mask
+            knobs.append(self.knobs[lowest.bit_length() - 1])
+            mask ^= lowest
+        return sorted(knobs)
+
+
+class HintSetBlacklist:
+    """The blacklisted hint-sets, a hint-set is pruned if it contains any of them.
+    Only the minimal blacklisted bitmasks are indexed, they are grouped by their lowest bit such that a check only visits
+    the groups of the bits set in the candidate."""
+
+    def __init__(self, knob_index: KnobIndex, hint_sets=()):
+        self.knob_index = knob_index
+        self.hint_sets = set()  # all blacklisted hint-sets as frozensets of knobs, e.g. for checkpoints
+        self.minimal = {}  # lowest bit -> minimal blacklisted bitmasks
+        for hint_set in hint_sets:
+            self.add(hint_set)
+
+    def __iter__(self):
+        return iter(self.hint_sets)
+
+    def __len__(self):
+        return len(self.hint_sets)
+
+    def add(self, hint_set) -> None:
+        hint_set = frozenset(hint_set)
+        if hint_set in self.hint_sets:
+            return
+        self.hint_sets.add(hint_set)
+        mask = self.knob_index.mask(hint_set)
+        if self.prunes(mask):
+            return  # a subset is blacklisted already
+        # The new hint-set makes all blacklisted supersets redundant
+        for lowest, masks in self.minimal.items():
+            self.minimal[lowest] = [blacklisted for blacklisted in masks if blacklisted & mask != mask]
+        self.minimal.setdefault(mask & -mask, []).append(mask)
+
+    def prunes(self, mask) -> bool:
+        """Whether the hint-set given by its bitmask contains a blacklisted hint-set"""
+        if 0 in self.minimal:
+            return True  # the empty hint-set is contained in every hint-set
+        remaining = mask
+        while remaining:
+            lowest = remaining & -remaining
+            for blacklisted in self.minimal.get(lowest, ()):
+                if blacklisted & mask == blacklisted:
+                    return True
+            remaining ^= lowest
+        return False
+
+
+def combine(knob_index: KnobIndex, promising_knobs: list, previous_hint_sets: list, blacklist: HintSetBlacklist) -> list:
+    """Extend every hint-set of the previous DP level by one promising knob unless the result contains a blacklisted hint-set,
+    returns the new hint-sets as sorted lists of knobs"""
+    previous_masks = [knob_index.mask(hint_set) for hint_set in previous_hint_sets]
+    candidates, result = set(), []
+    for knobs in promising_knobs:
+        first_bit, knobs_mask = knob_index.bit(knobs[0]), knob_index.mask(knobs)
+        for previous_mask in previous_masks:
+            if previous_mask & first_bit:
+                continue
+            candidate = previous_mask | knobs_mask
+            if candidate not in candidates:
+                candidates.add(candidate)
+                if not blacklist.prunes(candidate):
+                    result.append(candidate)
+    return sorted(knob_index.get_knobs(mask) for mask in result)
+
+
+def dependency_masks(knob_index: KnobIndex, dependencies: dict) -> list:
+    """The pairs of an alternative knob's bit and the bitmask of the knobs it depends on"""
+    return [(knob_index.bit(knob), knob_index.mask(dependent_knobs)) for knob, dependent_knobs in dependencies.items()]
+
+
+def satisfies_dependencies(mask, dependencies: list) -> bool:
+    """Whether the hint-set given by its bitmask disables all dependencies of the alternative knobs it disables"""
+    return all(not mask & bit or dependent_mask & mask == dependent_mask for bit, dependent_mask in dependencies)
@@ -0,0 +1,68 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""This module lets the TCNN guide the exploration: the hint-sets of a DP level are executed in the order of the runtimes predicted for their plans"""
+import json
+import os
+import numpy as np
+from utils.config import read_config
+from utils.custom_logging import logger
+
+
+class ModelGuidance:
+    """Orders the new plans of a DP level by their predicted runtime and skips plans predicted to be far slower than the baseline.
+    After every retrain_interval new measurements, the model is retrained on all measurements (active learning)."""
+
+    def __init__(self, model, skip_factor=0.0, retrain_interval=0, retrain=None):
+        self.model = model  # a trained BaoRegressionModel or None until the first retraining
+        self.skip_factor = skip_factor  # 0 never skips a plan
+        self.retrain_interval = retrain_interval  # 0 never retrains the model
+        self.retrain = retrain  # returns a model trained on all measurements
+        self.new_measurements = 0
+
+    def rank(self, query_plans: list, baseline_median=None) -> tuple:
+        """The indexes of the plans in the order of their predicted runtimes and the indexes of the plans to skip"""
+        if self.model is None or len(query_plans) == 0:
+            return list(range(len(query_plans))), []
+        predictions = np.array(self.model.predict([json.loads(plan) if isinstance(plan, str) else plan for plan in query_plans]), dtype=float).reshape(-1)
+        order = [int(i) for i in np.argsort(predictions, kind='stable')]
+        if self.skip_factor <= 0 or baseline_median is None:
+            return order, []
+        skipped = [i for i in order if predictions[i] > self.skip_factor * baseline_median]
+        return [i for i in order if i not in skipped], skipped
+
+    def observe(self, num_measurements: int) -> None:
+        """Count new measurements and retrain the model once enough of them are collected"""
+        self.new_measurements += num_measurements
+        if self.retrain is None or self.retrain_interval <= 0 or self.new_measurements < self.retrain_interval:
+            return
+        logger.info('Retrain the model after %s new measurements', self.new_measurements)
+        self.new_measurements = 0
+        try:
+            self.model = self.retrain()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning('Cannot retrain the model, keep the previous one: %s', e)
+
+
+def get_model_guidance(connector, benchmark: str):
+    """The model guidance configured in the autosteer section of config.cfg or None if the exploration is not guided by the model
+    or the connector has no plan preprocessor. The model is shared by the explorations of the benchmark and retrained on its measurements."""
+    config = read_config()['autosteer']
+    if not config.getboolean('model_guidance', fallback=False):
+        return None
+    try:
+        preprocessor_type = connector.get_plan_preprocessor()
+    except NotImplementedError:
+        logger.warning('The connector %s has no plan preprocessor, the exploration is not guided by the model', type(connector).__name__)
+        return None
+    # The inference modules depend on torch, import them only for a guided exploration
+    from inference import model, train  # pylint: disable=import-outside-toplevel
+    model_name = f'nn/model/{connector.get_name()}_model'
+    bao_model = None
+    if os.path.isdir(model_name):
+        bao_model = model.BaoRegressionModel(preprocessor_type())
+        bao_model.load(model_name)
+    else:
+        logger.info('There is no model %s yet, the exploration is guided once it is trained', model_name)
+    return ModelGuidance(bao_model, float(config.get('model_skip_factor', '0')), int(config.get('model_retrain_interval', '0')),
+                         lambda: train.retrain_model(preprocessor_type(), model_name, bench=benchmark))
@@ -2,14 +2,12 @@
 # SPDX-License-Identifier: MIT
 #
 """This module provides the HintSetExploration that runs AutoSteers dynamic-programming based exploration"""
+from autosteer.exploration_strategies import get_exploration_budget, get_exploration_strategy
+from autosteer.hint_set_bitsets import KnobIndex, HintSetBlacklist, combine, dependency_masks, satisfies_dependencies
 from autosteer.query_span import QuerySpan
 import storage
-import pandasql as pdsql
-import statistics
 from utils.custom_logging import logger
 
-MAX_DP_DEPTH = 3  # Define early termination of the dynamic-programming exploration.
-
 
 def tuple_to_list(t):
     return [t[0]] if len(t) == 1 else list(t)
@@ -17,122 +15,106 @@ def tuple_to_list(t):
 
 class HintSetExploration:
     """An OptimizerConfiguration coordinates the exploration of the hint-sets search space.
-      It uses a dynamic programming-based approach to find promising hint-sets."""
+      It uses a dynamic programming-based approach to find promising hint-sets by default, the strategy and the budget are configurable."""
 
-    def __init__(self, query_path):
+    def __init__(self, query_path, checkpoint: storage.ExplorationCheckpoint = None):
         self.query_span = QuerySpan(query_path)
         self.query_path = query_path
         self.tunable_knobs = self.query_span.get_tunable_knobs()  # the effective query optimizer knobs
-        self.current_dp_level = 0
-        self.blacklisted_hint_sets = set()  # store configs that resulted in running times worse than the baseline
-        self.hint_sets = self.get_next_hint_sets()
+        self.knob_index = KnobIndex(self.tunable_knobs)  # hint-sets are combined as bitmasks over the knobs
+        self.dependency_masks = dependency_masks(self.knob_index, self.query_span.dependencies)
+        self.strategy = get_exploration_strategy(self)
+        self.budget = get_exploration_budget()
+        if checkpoint is None:
+            self.current_dp_level = 0
+            self.blacklisted_hint_sets = HintSetBlacklist(self.knob_index)  # store configs that resulted in running times worse than the baseline
+            self.hint_sets = self.get_next_hint_sets()
+        else:
+            # Continue with the pending hint-sets of the checkpoint's DP level
+            self.current_dp_level = checkpoint.dp_level
+            self.blacklisted_hint_sets = HintSetBlacklist(self.knob_index, checkpoint.blacklist)
+            self.hint_sets = checkpoint.pending
         self.iterator = -1
         logger.info('Run %s different configs', len(self.hint_sets))
 
     def dp_combine(self, promising_disabled_opts, previous_configs):
-        result = set()
-        # Based on the results in previous stages, DP builds new promising configurations (a.k.a. hint-sets)
-        for optimizer in promising_disabled_opts:
-            # Combine with other results
-            for conf in previous_configs:
-                if optimizer[0] not in conf:
-                    new_config = frozenset(conf + optimizer)
-                    execute_config = True
-                    for bad_config in self.blacklisted_hint_sets:
-                        if bad_config.issubset(new_config):
-                            execute_config = False
-                            break
-                    if execute_config:
-                        result.add(new_config)
-        return sorted([sorted(list(x)) for x in result])
+        """Based on the results in previous stages, DP builds new promising configurations (a.k.a. hint-sets) that contain no blacklisted hint-set"""
+        return combine(self.knob_index, promising_disabled_opts, previous_configs, self.blacklisted_hint_sets)
 
     def check_config_for_dependencies(self, config):
         """Check if there is an alternative optimizer in the config. If yes, check that all dependencies are disabled as well."""
-        for optimizer in config:
-            if optimizer in self.query_span.dependencies:
-                if not frozenset(self.query_span.dependencies[optimizer]).issubset(config):
-                    return False
-        return True
+        return satisfies_dependencies(self.knob_index.mask(config), self.dependency_masks)
 
     def __repr__(self):
         return f'Config {{\n\toptimizers:{self.tunable_knobs}}}'
 
-    def get_measurements(self):
-        """Get all measurements collected so far for the current query"""
-        stmt = '''
-            SELECT walltime as total_runtime, qoc.disabled_rules, m.time, qoc.num_disabled_rules
-            FROM queries q,
-                 measurements m,
-                 query_optimizer_configs qoc
-            WHERE m.query_optimizer_config_id = qoc.id
-              AND qoc.query_id = q.id
-              AND q.query_path = :query_path
-            order by m.time asc;
-            '''
-        return storage.get_df(stmt, {'query_path': self.query_path})
-
     def get_baseline(self):
         """Get all measurements of the default plan"""
-        df = self.get_measurements()  # pylint: disable=possibly-unused-variable
-        runs = pdsql.sqldf('SELECT total_runtime FROM df WHERE disabled_rules = \'None\'', locals())
-        runtimes = runs['total_runtime'].to_list()
-        return runtimes
+        return storage.baseline_runtimes(self.query_path)
 
     def get_promising_measurements_by_num_rules(self, num_disabled_rules, baseline_median, baseline_mean):
-        """Get all measurements for hint-sets having a specific size"""
-        measurements = self.get_measurements()
-        stmt = f'''SELECT total_runtime, disabled_rules, time
-        FROM measurements
-        WHERE num_disabled_rules = {num_disabled_rules};'''
-        df = pdsql.sqldf(stmt, locals())
-        measurements = df.groupby(['disabled_rules'])['total_runtime'].agg(['median', 'mean'])
-
-        # Identify bad hint-sets and blacklist them for later DP stages
-        bad_hint_sets = measurements[(measurements['median'] > baseline_median) | (measurements['mean'] > baseline_mean)]
-        for config in bad_hint_sets.index.values.tolist():
-            self.blacklisted_hint_sets.add(frozenset(config.split(',')))
-
-        # Find hint-sets performing better than the default plan
-        good_hint_sets = measurements[(measurements['median'] < baseline_median) & (measurements['mean'] <= baseline_mean)]
-        configs = good_hint_sets.index.values.tolist()
-        configs = filter(lambda n: n != 'None', configs)
-        return [conf.split(',') for conf in configs]
-
-    # Create the next hint-sets (a.k.a. configs) starting with one disabled optimizer and switch to dynamic programming later
+        """Get all hint-sets having a specific size that perform better than the baseline, the statistics come from the measurement index"""
+        promising_hint_sets = []
+        for disabled_rules, (median, mean, num_censored) in storage.measurement_index(self.query_path).statistics(num_disabled_rules).items():
+            if disabled_rules is None:
+                continue
+            # Identify bad hint-sets and blacklist them for later DP stages, including all hint-sets cancelled at their deadline
+            if median > baseline_median or mean > baseline_mean or num_censored > 0:
+                self.blacklisted_hint_sets.add(frozenset(disabled_rules.split(',')))
+            # Find hint-sets performing better than the default plan
+            elif median < baseline_median:
+                promising_hint_sets.append(disabled_rules.split(','))
+        return sorted(promising_hint_sets)
+
+    # Create the next hint-sets (a.k.a. configs) starting with one disabled optimizer and switch to the exploration strategy later
     def get_next_hint_sets(self):
         n = self.current_dp_level
-        if n > len(self.tunable_knobs) or n > MAX_DP_DEPTH:
+        if n > 0 and self.budget.exhausted():
+            logger.info('The exploration budget of query %s is exhausted after %s executions', self.query_path, self.budget.executions)
             return None
-        elif n == 0:
+        if n == 0:
             configs = [[]]
         elif n == 1:
+            if len(self.tunable_knobs) == 0:
+                return None
             configs = [[opt] for opt in self.tunable_knobs]
         else:
-            baseline = self.get_baseline()
-            try:
-                # Basic statistics of the default plan (= baseline)
-                median = statistics.median(baseline)
-                mean = statistics.mean(baseline)
-                # Fetch results from previous runs, consider only those hint-sets that were better than the baseline
-                single_optimizers = self.get_promising_measurements_by_num_rules(1, median, mean) + [[key] for key in self.query_span.dependencies]
-                combinations_previous_run = self.get_promising_measurements_by_num_rules(n - 1, median, mean)
-                # Leverage hint-sets from n-1 and combine with n=1
-                configs = self.dp_combine(single_optimizers, combinations_previous_run)
-            except statistics.StatisticsError as err:
-                logger.warning('DP: get_next_hint_sets() results in an ArithmeticError %s', err)
-                configs = None
+            baseline = storage.baseline_statistics(self.query_path)
+            if baseline is None:
+                logger.warning('DP: get_next_hint_sets() finds no measurements of the default plan')
+                return None
+            # Basic statistics of the default plan (= baseline), the strategy considers only those hint-sets that were better than the baseline
+            configs = self.strategy.next_hint_sets(n, baseline[0], baseline[1])
+            if configs is None:
+                return None
         self.current_dp_level += 1
         # Remove these configs where a knob has unmet dependencies (e.g. its dependent optimizers are not part of the config)
         configs = list(filter(self.check_config_for_dependencies, configs))
-        return configs
+        return self.budget.truncate(configs)
 
     def get_disabled_opts_rules(self):
         if self.hint_sets is None or len(self.hint_sets) == 0 or len(self.hint_sets[self.iterator]) == 0:
             return None
         return ','.join(sorted(tuple_to_list(self.hint_sets[self.iterator])))
 
+    def get_checkpoint(self, pending: list, completed=False) -> storage.ExplorationCheckpoint:
+        """The exploration state given the hint-sets of the current DP level that are not measured yet"""
+        return storage.ExplorationCheckpoint(self.current_dp_level, sorted(sorted(hint_set) for hint_set in self.blacklisted_hint_sets), pending, completed)
+
+    def get_hint_set(self):
+        """Returns the current hint-set including knobs that are not tunable"""
+        return self.hint_sets[self.iterator]
+
+    def has_next_in_level(self):
+        """Whether the current DP level has hint-sets left, other than has_next() this does not proceed to the next level"""
+        return self.iterator < len(self.hint_sets) - 1
+
+    def budget_exhausted(self) -> bool:
+        """Whether the budget stops the exploration before the next hint-set, the default plan is executed in any case"""
+        return self.current_dp_level > 1 and self.budget.exhausted()
+
     def has_next(self):
-        if self.iterator < len(self.hint_sets) - 1:
+        if self.iterator < len(self.hint_sets) - 1 and not self.budget_exhausted():
             return True
         # Proceed to the next dynamic-programming level
         self.hint_sets = self.get_next_hint_sets()
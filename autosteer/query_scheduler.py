@@ -0,0 +1,110 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""This module interleaves the explorations of all queries of a benchmark, the query with the highest expected savings executes next"""
+import math
+import os
+import time
+import connectors.connector
+import storage
+from autosteer.dp_exploration import QueryExploration
+from autosteer.exploration_strategies import ExplorationReport
+from autosteer.execution_scheduler import ExecutionScheduler
+from autosteer.model_guidance import get_model_guidance
+from autosteer.query_span import N_THREADS
+from connectors.connector_pool import ConnectorPool
+from utils.config import read_config
+from utils.custom_logging import logger
+
+
+class ExplorationProgress:
+    """The progress of the explorations of a benchmark, the ETA covers the hint-sets scheduled in the current DP levels"""
+
+    def __init__(self, num_queries, num_completed, num_executed, num_scheduled, elapsed_secs, eta_secs, budget_secs):
+        self.num_queries = num_queries
+        self.num_completed = num_completed
+        self.num_executed = num_executed  # executed hint-sets
+        self.num_scheduled = num_scheduled
+        self.elapsed_secs = elapsed_secs
+        self.eta_secs = eta_secs
+        self.budget_secs = budget_secs
+
+    def __str__(self):
+        budget = f' of a budget of {self.budget_secs:.0f}s' if self.budget_secs > 0 else ''
+        return f'Progress: {self.num_completed}/{self.num_queries} queries explored, {self.num_executed} hint-sets executed and ' \
+               f'{self.num_scheduled} scheduled, {self.elapsed_secs:.0f}s elapsed{budget}, ETA of the scheduled hint-sets {self.eta_secs:.0f}s'
+
+
+def expected_savings(query_path) -> float:
+    """The median runtime of the default plan (usecs) times the estimated probability that a hint-set improves on it.
+    The probability is the share of the measured hint-sets that are faster than the default plan with a uniform prior,
+    queries without measurements of the default plan come first."""
+    index = storage.measurement_index(query_path)
+    baseline = index.summary(None)
+    if baseline is None:
+        return math.inf
+    baseline_median = baseline[0]
+    num_measured, num_improved = 0, 0
+    for num_disabled_rules in set(index.num_disabled_rules.values()) - {0}:
+        for median, _, num_censored in index.statistics(num_disabled_rules).values():
+            num_measured += 1
+            num_improved += 1 if median < baseline_median and num_censored == 0 else 0
+    return baseline_median * (num_improved + 1) / (num_measured + 2)
+
+
+class QueryScheduler:
+    """Keeps the exploration state of all queries of a benchmark and interleaves them: the query with the highest expected savings
+    executes its next interleave_hint_sets hint-sets until all queries are explored or the time budget is exhausted.
+    Queries that are not explored completely are checkpointed and continue with --resume."""
+
+    def __init__(self, connector: connectors.connector.DBConnector, query_paths: list, resume=False, budget_secs=0.0, interleave_hint_sets=1):
+        self.connector = connector
+        self.query_paths = query_paths
+        self.resume = resume
+        self.budget_secs = budget_secs  # 0 is unbounded
+        self.interleave_hint_sets = interleave_hint_sets
+        self.explorations = []
+        self.num_executed = 0
+        self.begin = None
+
+    def elapsed_secs(self) -> float:
+        return time.monotonic() - self.begin
+
+    def progress(self) -> ExplorationProgress:
+        active = [exploration for exploration in self.explorations if not exploration.completed]
+        eta_usecs = 0.0
+        for exploration in active:
+            baseline = storage.baseline_statistics(exploration.query_path)
+            eta_usecs += exploration.num_scheduled() * exploration.repeats * (baseline[0] if baseline is not None else 0.0)
+        return ExplorationProgress(len(self.explorations), len(self.explorations) - len(active), self.num_executed,
+                                   sum(exploration.num_scheduled() for exploration in active), self.elapsed_secs(), eta_usecs / 1_000_000, self.budget_secs)
+
+    def run(self) -> list[ExplorationReport]:
+        """Explore the queries and return the reports of the explorations in the order of the query paths, the explorations share
+        the model guidance of the benchmark"""
+        self.begin = time.monotonic()
+        benchmark = os.path.dirname(self.query_paths[0]) if len(self.query_paths) > 0 else None
+        model_guidance = get_model_guidance(self.connector, benchmark)
+        with ConnectorPool(self.connector.clone, N_THREADS, type(self.connector)) as explain_pool, ExecutionScheduler(self.connector) as scheduler:
+            self.explorations = [QueryExploration(self.connector, explain_pool, query_path, self.resume, model_guidance) for query_path in self.query_paths]
+            while True:
+                for exploration in self.explorations:
+                    if not exploration.completed and not exploration.has_next():
+                        exploration.finish()
+                active = [exploration for exploration in self.explorations if not exploration.completed]
+                if len(active) == 0:
+                    break
+                if 0 < self.budget_secs <= self.elapsed_secs():
+                    logger.info('The time budget of %ss is exhausted, %s queries are not explored completely', self.budget_secs, len(active))
+                    break
+                # The first query with the highest expected savings executes next
+                exploration = max(active, key=lambda e: expected_savings(e.query_path))
+                self.num_executed += exploration.step(scheduler, self.interleave_hint_sets)
+                logger.info('%s', self.progress())
+        return [exploration.report() for exploration in self.explorations if exploration.hint_set_exploration is not None]
+
+
+def get_query_scheduler(connector, query_paths: list, resume=False) -> QueryScheduler:
+    """The query scheduler configured in the autosteer section of config.cfg"""
+    config = read_config()['autosteer']
+    return QueryScheduler(connector, query_paths, resume, float(config.get('benchmark_budget_secs', '0')), int(config.get('interleave_hint_sets', '1')))
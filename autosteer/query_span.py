@@ -2,15 +2,18 @@
 # SPDX-License-Identifier: MIT
 #
 """This module implements a generic but naive approach to approximate the query span. A system integration will be much more efficient."""
+import hashlib
 import queue
 from multiprocessing.pool import ThreadPool as Pool
-import numpy as np
 import storage
+from autosteer.explain_cache import get_explain_cache, normalize_sql
+from connectors.connector_pool import ConnectorPool
 from utils.custom_logging import logger
 from utils.config import read_config
 from utils.util import flatten
 
 N_THREADS = int(read_config()['autosteer']['explain_threads'])
+SPAN_GROUP_SIZE = int(read_config()['autosteer'].get('span_group_size', '0'))  # 0 explains the query once per knob
 FAILED = 'FAILED'
 
 
@@ -34,93 +37,148 @@ class HintSet:
 
 
 def get_query_plan(args: tuple) -> HintSet:
-    connector_type, sql_query, hintset = args
-    connector = connector_type()
+    """Explain the query for a hint-set on a connector of the pool unless the explain cache has its plan"""
+    connector_pool, sql_query, hintset = args
     knobs = hintset.get_all_knobs()
-    connector.set_disabled_knobs(knobs)
-    hintset.plan = connector.explain(sql_query)
+    explain_cache = get_explain_cache(connector_pool.connector_type)
+    hintset.plan = explain_cache.get(sql_query, knobs) if explain_cache is not None else None
+    if hintset.plan is None:
+        with connector_pool.connector() as connector:
+            connector.set_disabled_knobs(knobs)
+            hintset.plan = connector.explain(sql_query)
+        if explain_cache is not None:
+            explain_cache.put(sql_query, knobs, hintset.plan)
     return hintset
 
 
-def approximate_query_span(connector_type, sql_query: str, get_json_query_plan, find_alternative_knobs=False, batch_wise=False) -> list[HintSet]:
-    # Create singleton hint-sets
-    knobs = np.array(connector_type.get_knobs())
-    hint_sets = np.array([HintSet({knob}, None) for knob in knobs])
-    # To speed up the query span approximation, we can submit multiple queries in parallel
-    with Pool(N_THREADS) as thread_pool:
-        query_span: list[HintSet] = []
-        default_plan = get_json_query_plan((connector_type, sql_query, HintSet(set(), None)))
-        query_span.append(default_plan)
+def explain_hint_sets(connector_pool: ConnectorPool, sql_query: str, hint_sets: list) -> list:
+    """Explain the query for all hint-sets (lists of knobs) concurrently on the connectors of the pool, return the plans in the same order"""
+    if len(hint_sets) == 0:
+        return []
+    with Pool(min(N_THREADS, len(hint_sets))) as thread_pool:
+        args = [(connector_pool, sql_query, HintSet(set(knobs), None)) for knobs in hint_sets]
+        return [hint_set.plan for hint_set in thread_pool.map(get_query_plan, args)]
 
-        args = [(connector_type, sql_query, knob) for knob in hint_sets]
-        results = np.array(list(thread_pool.map(get_json_query_plan, args)))
 
-        default_plan_hash = hash(str(default_plan.plan))
-        logger.info('Default plan hash: #%s', default_plan_hash)
-        failed_plan_hash = hash(FAILED)
-        logger.info('Failed query hash: #%s', failed_plan_hash)
+def _find_effective_knobs(thread_pool, connector_pool, sql_query: str, get_json_query_plan, knobs: list, dependencies, reference_hash: str, group_size=0):
+    """Explain the query with each knob disabled on top of the dependencies and return the singleton hint-sets whose plan differs from
+    the reference plan and those whose plan failed, both in the order of the knobs. With group_size > 0 (group testing), disjoint groups
+    of knobs are disabled at once and only groups whose plan differs are split in halves until single knobs remain. Knobs whose effects
+    cancel out within a group are not found."""
+    fingerprint = connector_pool.connector_type.plan_fingerprint
+    failed_plan_hash = fingerprint(FAILED)
+    size = max(group_size, 1)
+    groups = [knobs[i:i + size] for i in range(0, len(knobs), size)]
+    effective, failed = [], []
+    while len(groups) > 0:
+        results = thread_pool.map(get_json_query_plan, [(connector_pool, sql_query, HintSet(set(group), dependencies)) for group in groups])
+        split_groups = []
+        for group, result in zip(groups, results):
+            plan_hash = fingerprint(result.plan)
+            if plan_hash == reference_hash:
+                continue
+            if len(group) > 1:
+                split_groups += [group[:len(group) // 2], group[len(group) // 2:]]
+            elif plan_hash == failed_plan_hash:
+                failed.append(result)
+            else:
+                effective.append(result)
+        groups = split_groups
+    position = {knob: i for i, knob in enumerate(knobs)}
+    return sorted(effective, key=lambda hs: position[next(iter(hs.knobs))]), sorted(failed, key=lambda hs: position[next(iter(hs.knobs))])
 
-        hashes = np.array(list(thread_pool.map(lambda res: hash(str(res.plan)), results)))
-        effective_knobs_indexes = np.where((hashes != default_plan_hash) & (hashes != failed_plan_hash))
-        required_knobs_indexes = np.where(hashes == failed_plan_hash)
-        logger.info('There are %s alternative plans', effective_knobs_indexes[0].size)
 
-        new_effective_knobs = queue.Queue()
-        for optimizer in results[effective_knobs_indexes]:
-            new_effective_knobs.put(optimizer)
+def approximate_query_span(connector_type, sql_query: str, get_json_query_plan, find_alternative_knobs=False, batch_wise=False, group_size=0,
+                           connector_factory=None) -> list[HintSet]:
+    """Find the required knobs and the (alternative) knobs that change the query plan, group_size > 0 tests groups of knobs at once.
+    The connector factory creates the pooled connectors, by default the connector type is called without arguments."""
+    knobs = list(connector_type.get_knobs())
+    fingerprint = connector_type.plan_fingerprint
+    # To speed up the query span approximation, we can submit multiple queries in parallel, the threads share a pool of connectors
+    with Pool(N_THREADS) as thread_pool, ConnectorPool(connector_factory or connector_type, N_THREADS, connector_type) as connector_pool:
+        query_span: list[HintSet] = []
+        default_plan = get_json_query_plan((connector_pool, sql_query, HintSet(set(), None)))
+        query_span.append(default_plan)
+
+        default_plan_hash = fingerprint(default_plan.plan)
+        logger.info('Default plan hash: #%s', default_plan_hash)
+        logger.info('Failed query hash: #%s', fingerprint(FAILED))
 
-        required_optimizers = results[required_knobs_indexes]
-        for required_optimizer in required_optimizers:
+        effective_knobs, required_knobs = _find_effective_knobs(thread_pool, connector_pool, sql_query, get_json_query_plan, knobs, None,
+                                                                default_plan_hash, group_size)
+        logger.info('There are %s alternative plans', len(effective_knobs))
+        for required_optimizer in required_knobs:
             required_optimizer.required = True
             query_span.append(required_optimizer)
 
-        # Note that indices change after delete
-        hint_sets = np.delete(hint_sets, np.concatenate([effective_knobs_indexes, required_knobs_indexes], axis=1))
+        found = set(flatten([hs.knobs for hs in effective_knobs + required_knobs]))
+        remaining_knobs = [knob for knob in knobs if knob not in found]
 
         # Detect rules that become effective only if other rules are disabled
         if find_alternative_knobs:
             if batch_wise:  # Batch approximation: according to Negi et al. 2021 "Steering query optimizers: A practical take on big data workloads"
-                found_new_knobs = True
-                effective_knobs = [results[index] for index in effective_knobs_indexes[0]]
-                disabled_knobs = flatten([hs.knobs for hs in effective_knobs])
-                all_effective_knobs = HintSet(set(disabled_knobs), None)
-
-                while found_new_knobs:
-                    for optimizer in results[effective_knobs_indexes]:
-                        query_span.append(optimizer)
-                    default_plan = get_json_query_plan((connector_type, sql_query, all_effective_knobs))
-                    default_plan_hash = hash(default_plan.plan)
-                    args = [(connector_type, sql_query, HintSet(set(hs.knobs), all_effective_knobs)) for hs in hint_sets]
-                    results = np.array(list(thread_pool.map(get_json_query_plan, args)))
-                    hashes = np.array(list(thread_pool.map(lambda res: hash(res.plan), results)))
-                    effective_knobs_indexes = np.where((hashes != default_plan_hash) & (hashes != failed_plan_hash))
-                    new_alternative_knobs = results[effective_knobs_indexes]
+                all_effective_knobs = HintSet(set(flatten([hs.knobs for hs in effective_knobs])), None)
+                new_alternative_knobs = effective_knobs
+                while len(new_alternative_knobs) > 0:
+                    query_span += new_alternative_knobs
+                    default_plan = get_json_query_plan((connector_pool, sql_query, all_effective_knobs))
+                    new_alternative_knobs, _ = _find_effective_knobs(thread_pool, connector_pool, sql_query, get_json_query_plan, remaining_knobs,
+                                                                     all_effective_knobs, fingerprint(default_plan.plan), group_size)
                     for new_alternative_knob in new_alternative_knobs:
                         all_effective_knobs = HintSet(new_alternative_knob.knobs, all_effective_knobs)
-
-                    found_new_knobs = len(effective_knobs_indexes[0]) > 0
+                        remaining_knobs.remove(next(iter(new_alternative_knob.knobs)))
             else:  # Iterative approximation: disable one knob at a time and check if other knobs become effective
+                new_effective_knobs = queue.Queue()
+                for optimizer in effective_knobs:
+                    new_effective_knobs.put(optimizer)
                 while not new_effective_knobs.empty():
                     effective_knob = new_effective_knobs.get()
                     query_span.append(effective_knob)
-                    default_plan_hash = hash(effective_knob.plan)
-                    args = [(connector_type, sql_query, HintSet(hs.knobs, effective_knob)) for hs in hint_sets]
-                    results = np.array(list(thread_pool.map(get_json_query_plan, args)))
-                    hashes = np.array(list(thread_pool.map(lambda res: hash(res.plan), results)))
-                    effective_knobs_indexes = np.where((hashes != default_plan_hash) & (hashes != failed_plan_hash))
-                    new_alternative_knobs = results[effective_knobs_indexes]
-
+                    alternative_knobs, _ = _find_effective_knobs(thread_pool, connector_pool, sql_query, get_json_query_plan, remaining_knobs,
+                                                                 effective_knob, fingerprint(effective_knob.plan), group_size)
                     # Add new alternative optimizers to the queue, remove them from the knobs
-                    for alternative_optimizer in new_alternative_knobs:
+                    for alternative_optimizer in alternative_knobs:
                         new_effective_knobs.put(alternative_optimizer)
-                        for i in reversed(range(len(hint_sets))):
-                            if hint_sets[i] == alternative_optimizer:
-                                hint_sets = np.delete(hint_sets, i)
-                                break
+                        remaining_knobs.remove(next(iter(alternative_optimizer.knobs)))
         else:
-            while not new_effective_knobs.empty():
-                new_effective_optimizer = new_effective_knobs.get()
-                query_span.append(new_effective_optimizer)
+            query_span += effective_knobs
+    return query_span
+
+
+def update_query_span(connector_type, sql_query: str, get_json_query_plan, new_knobs: list, effective_hint_sets: list, inert_knobs: list,
+                      group_size=0, connector_factory=None) -> list[HintSet]:
+    """Probe only the new knobs against the known query span and return the new hint-sets: the new knobs are tested against the default plan
+    and the plans of the known effective hint-sets. The new effective knobs are tested with all knobs that do not change the plan so far.
+    The connector factory creates the pooled connectors as in approximate_query_span."""
+    fingerprint = connector_type.plan_fingerprint
+    new_knobs, inert_knobs = list(new_knobs), list(inert_knobs)
+    with Pool(N_THREADS) as thread_pool, ConnectorPool(connector_factory or connector_type, N_THREADS, connector_type) as connector_pool:
+        default_plan = get_json_query_plan((connector_pool, sql_query, HintSet(set(), None)))
+        effective_knobs, required_knobs = _find_effective_knobs(thread_pool, connector_pool, sql_query, get_json_query_plan, new_knobs, None,
+                                                                fingerprint(default_plan.plan), group_size)
+        query_span: list[HintSet] = []
+        for required_optimizer in required_knobs:
+            required_optimizer.required = True
+            query_span.append(required_optimizer)
+        found = set(flatten([hs.knobs for hs in effective_knobs + required_knobs]))
+        new_knobs = [knob for knob in new_knobs if knob not in found]
+
+        new_effective_knobs = queue.Queue()
+        for known_knob in thread_pool.map(get_json_query_plan, [(connector_pool, sql_query, hs) for hs in effective_hint_sets]):
+            new_effective_knobs.put((known_knob, False))
+        for effective_knob in effective_knobs:
+            new_effective_knobs.put((effective_knob, True))
+        while not new_effective_knobs.empty():
+            effective_knob, is_new = new_effective_knobs.get()
+            if is_new:
+                query_span.append(effective_knob)
+            alternative_knobs, _ = _find_effective_knobs(thread_pool, connector_pool, sql_query, get_json_query_plan,
+                                                         inert_knobs + new_knobs if is_new else new_knobs, effective_knob,
+                                                         fingerprint(effective_knob.plan), group_size)
+            for alternative_optimizer in alternative_knobs:
+                new_effective_knobs.put((alternative_optimizer, True))
+                knob = next(iter(alternative_optimizer.knobs))
+                (inert_knobs if knob in inert_knobs else new_knobs).remove(knob)
     return query_span
 
 
@@ -130,19 +188,53 @@ def serialize_dependencies(query_path: str, hint_set: HintSet):
             storage.register_optimizer_dependency(query_path, ','.join(sorted(hint_set.knobs)), knob)
 
 
+def query_span_version(connector_type, sql_query: str) -> storage.QuerySpanVersion:
+    knobs = sorted(connector_type.get_knobs())
+    return storage.QuerySpanVersion(hashlib.sha256(normalize_sql(sql_query).encode()).hexdigest(), hashlib.sha256('\n'.join(knobs).encode()).hexdigest(), knobs)
+
+
+def _known_effective_hint_sets(query_path) -> list[HintSet]:
+    dependencies = {}
+    for optimizer, dependency in storage.get_effective_optimizers_depedencies(query_path):
+        dependencies.setdefault(optimizer, set()).add(dependency)
+    return [HintSet({optimizer}, HintSet(dependencies[optimizer], None) if optimizer in dependencies else None)
+            for optimizer in storage.get_effective_optimizers(query_path)]
+
+
 def run_get_query_span(connector_type, benchmark, query):
+    """Approximate the query span of a query if the query changed, if only the knobs changed, probe the new knobs and remove the old ones"""
     query_path = f'{benchmark}/{query}'
-    logger.info('Approximate query span for query: %s', query_path)
     storage.register_query(query_path)
 
     sql = storage.read_sql_file(query_path)
-    query_span = approximate_query_span(connector_type, sql, get_query_plan, find_alternative_knobs=True, batch_wise=False)
+    version = query_span_version(connector_type, sql)
+    previous_version = storage.load_query_span_version(query_path)
+    if version == previous_version:
+        logger.info('The query and the knobs did not change, skip the query span of query: %s', query_path)
+        return
+    if previous_version is None or previous_version.query_hash != version.query_hash:
+        logger.info('Approximate query span for query: %s', query_path)
+        storage.remove_optimizers(query_path, None)
+        query_span = approximate_query_span(connector_type, sql, get_query_plan, find_alternative_knobs=True, batch_wise=False, group_size=SPAN_GROUP_SIZE)
+    else:
+        previous_knobs = set(previous_version.knobs)
+        removed_knobs = sorted(previous_knobs - set(version.knobs))
+        known_knobs = set(storage.get_effective_optimizers(query_path) + storage.get_required_optimizers(query_path))
+        storage.remove_optimizers(query_path, removed_knobs)
+        # Knobs that depended on a removed knob are probed again like new knobs
+        remaining_knobs = set(storage.get_effective_optimizers(query_path) + storage.get_required_optimizers(query_path))
+        new_knobs = [knob for knob in connector_type.get_knobs() if knob not in previous_knobs or (knob in known_knobs and knob not in remaining_knobs)]
+        inert_knobs = [knob for knob in connector_type.get_knobs() if knob in previous_knobs and knob not in known_knobs]
+        logger.info('Update query span for query: %s, %s new and %s removed knobs', query_path, len(new_knobs), len(removed_knobs))
+        query_span = update_query_span(connector_type, sql, get_query_plan, new_knobs, _known_effective_hint_sets(query_path), inert_knobs,
+                                       SPAN_GROUP_SIZE)
 
     # Serialize the approximated query span in the database
     for optimizer in query_span:  # pylint: disable=not-an-iterable
         logger.info('Found new hint-set: %s', optimizer)
         storage.register_optimizer(query_path, ','.join(sorted(optimizer.knobs)), optimizer.required)
         serialize_dependencies(query_path, optimizer)
+    storage.save_query_span_version(query_path, version)
 
 
 class QuerySpan:
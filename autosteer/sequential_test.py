@@ -0,0 +1,88 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""This module decides when a hint-set is measured often enough: a sequential test compares its runtimes to the runtimes of the baseline"""
+import math
+import numpy as np
+from utils.config import read_config
+
+BETTER = 'better'
+WORSE = 'worse'
+EQUAL = 'equal'
+PRECISE = 'precise'  # the baseline is known precisely enough
+
+
+def t_quantile(p: float, df: float) -> float:
+    """Quantile of Student's t-distribution with (possibly fractional) degrees of freedom"""
+    # scipy is only needed for adaptive repetitions, import it on first use
+    from scipy import stats  # pylint: disable=import-outside-toplevel
+    return float(stats.t.ppf(p, df))
+
+
+def spent_alpha(alpha: float, fraction: float) -> float:
+    """The error probability spent once the given fraction of the repetitions is measured, by the Pocock-type spending function of Lan and
+    DeMets. It spends alpha in total and early looks get a large share such that clear differences still stop after few repetitions."""
+    return alpha * math.log1p((math.e - 1) * min(max(fraction, 0.0), 1.0))
+
+
+class SequentialTest:
+    """Welch's confidence interval of the difference of the mean log-runtimes of a hint-set and the baseline, i.e. of their runtime ratio.
+    Sampling stops once the interval shows that the hint-set is better, worse, or equal within the equivalence margin.
+    Without baseline runtimes, sampling stops once the interval of the mean log-runtime is narrower than the equivalence margin.
+    Every repetition is a look at the data, the error probability 1 - confidence is spread over the looks by an alpha-spending function."""
+
+    def __init__(self, baseline: list, min_repeats: int, max_repeats: int, confidence=0.95, equivalence_margin=0.05, clearly_worse_factor=2.0):
+        self.baseline = np.log(np.maximum(np.array(baseline, dtype=float), 1.0)) if baseline is not None else None
+        self.min_repeats = min_repeats
+        self.max_repeats = max_repeats
+        self.confidence = confidence
+        self.margin = math.log1p(equivalence_margin)
+        self.clearly_worse = math.log(clearly_worse_factor)
+        self.previous = []  # runtimes measured before, e.g. by an interrupted training run
+
+    def quantile(self, num_samples: int) -> float:
+        """The quantile of the t-distribution bounding the two-sided interval at the look after num_samples repetitions"""
+        first_look = max(self.min_repeats, 2)
+        look = min(num_samples, max(self.max_repeats, first_look))
+        alpha = 1 - self.confidence
+        # The error probability of a look is the increase of the spent error probability since the previous look
+        previous = spent_alpha(alpha, (look - 1) / self.max_repeats) if look > first_look else 0.0
+        return 1 - (spent_alpha(alpha, look / self.max_repeats) - previous) / 2
+
+    def decide(self, runtimes: list):
+        """Return the decision for the runtimes (usecs) or None if more repetitions are necessary"""
+        samples = np.log(np.maximum(np.array(self.previous + runtimes, dtype=float), 1.0))
+        if self.baseline is not None and len(self.baseline) > 0 and len(samples) > 0 and samples.min() - np.median(self.baseline) > self.clearly_worse:
+            return WORSE  # even the fastest repetition is far slower than the baseline
+        if len(samples) < max(self.min_repeats, 2):
+            return None
+        if self.baseline is None or len(self.baseline) < 2:
+            deviation = np.std(samples, ddof=1)
+            half_width = t_quantile(self.quantile(len(samples)), len(samples) - 1) * deviation / math.sqrt(len(samples)) if deviation > 0 else 0.0
+            return PRECISE if half_width <= self.margin else None
+
+        difference = samples.mean() - self.baseline.mean()
+        var_samples, var_baseline = np.var(samples, ddof=1) / len(samples), np.var(self.baseline, ddof=1) / len(self.baseline)
+        standard_error = math.sqrt(var_samples + var_baseline)
+        if standard_error == 0:
+            half_width = 0.0
+        else:
+            # Welch-Satterthwaite degrees of freedom
+            df = standard_error ** 4 / (var_samples ** 2 / (len(samples) - 1) + var_baseline ** 2 / (len(self.baseline) - 1))
+            half_width = t_quantile(self.quantile(len(samples)), df) * standard_error
+        if difference - half_width > 0:
+            return WORSE
+        if difference + half_width < 0:
+            return BETTER
+        if -self.margin <= difference - half_width and difference + half_width <= self.margin:
+            return EQUAL
+        return None
+
+
+def get_sequential_test(baseline):
+    """The sequential test configured in the autosteer section of config.cfg or None if the number of repetitions is fixed"""
+    config = read_config()['autosteer']
+    if not config.getboolean('adaptive_repeats', fallback=False):
+        return None
+    return SequentialTest(baseline, int(config['repeats']), int(config['max_repeats']), float(config['confidence']),
+                          float(config['equivalence_margin']), float(config['clearly_worse_factor']))
@@ -1,42 +1,40 @@
 
-
-WITH default_plans (query_path, walltime) AS
-  (SELECT q.query_path,
-          median(walltime)
-   FROM queries q,
-        query_optimizer_configs qoc,
+WITH default_plans (query_id, walltime) AS
+  (SELECT qoc.query_id,
+          {statistic}(walltime)
+   FROM query_optimizer_configs qoc,
         measurements m
-   WHERE q.id = qoc.query_id
-     AND qoc.id = m.query_optimizer_config_id
-     AND qoc.num_disabled_rules = 0
-     AND qoc.disabled_rules = 'None'
-   GROUP BY q.query_path,
-            qoc.num_disabled_rules,
-            qoc.disabled_rules), -- default for queries that timed out
+   WHERE qoc.id = m.query_optimizer_config_id
+     AND qoc.hint_set_id = 0 -- the default hint-set
+     AND NOT m.censored -- the deadline of a cancelled execution is no runtime
+   GROUP BY qoc.query_id), -- default for queries that timed out
      results(query_path, num_disabled_rules, runtime, runtime_baseline, savings, disabled_rules, rank) AS
   (SELECT q.query_path,
-          qoc.num_disabled_rules,
-          median(m.walltime),
+          hs.num_disabled_rules,
+          {statistic}(m.walltime),
           dp.walltime,
-          (dp.walltime * 1.0 - median(m.walltime)) / dp.walltime  AS savings,
-          qoc.disabled_rules,
+          (dp.walltime * 1.0 - {statistic}(m.walltime)) / dp.walltime  AS savings,
+          hs.disabled_rules,
           dense_rank() OVER (PARTITION BY q.query_path
-                             ORDER BY (dp.walltime - median(m.walltime)) / dp.walltime DESC) AS ranki
+                             ORDER BY (dp.walltime - {statistic}(m.walltime)) / dp.walltime DESC) AS ranki
    FROM queries q,
         query_optimizer_configs qoc,
+        hint_sets hs,
         measurements m,
         default_plans dp
    WHERE q.id = qoc.query_id
+     AND hs.id = qoc.hint_set_id
      AND qoc.id = m.query_optimizer_config_id
-     AND dp.query_path = q.query_path
-     AND qoc.num_disabled_rules > 0
+     AND NOT m.censored
+     AND dp.query_id = q.id
+     AND qoc.hint_set_id != 0
+     AND q.query_path like '%' || :path || '%'
    GROUP BY q.query_path,
-            qoc.num_disabled_rules,
-            qoc.disabled_rules,
+            hs.num_disabled_rules,
+            hs.disabled_rules,
             dp.walltime
    ORDER BY savings DESC)
 SELECT *
 FROM results
 WHERE rank = 1
-  AND query_path like '%%:path%%'
-ORDER BY savings DESC;
\ No newline at end of file
+ORDER BY savings DESC;
@@ -0,0 +1,29 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Roll up old measurements of a results database into per-config statistics, prune them, and vacuum the database file.
+Run from the repository root: python compact_results.py --database <tested database, e.g. postgres> [--max-age-days D] [--keep-recent N]"""
+import argparse
+import os
+import sys
+
+import storage
+from utils.custom_logging import logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Roll up, prune, and vacuum the measurements of a results database')
+    parser.add_argument('--database', type=str, required=True, help='the tested database, i.e. the name of the results database')
+    parser.add_argument('--max-age-days', type=float, default=storage.ROLLUP_AFTER_DAYS, help='roll up measurements older than this')
+    parser.add_argument('--keep-recent', type=int, default=storage.ROLLUP_KEEP_RECENT,
+                        help='roll up all but this many of the most recent measurements per query and hint-set')
+    args = parser.parse_args()
+    storage.TESTED_DATABASE = args.database
+    if not os.path.isfile(storage.BACKENDS[storage.BACKEND].database_file()):
+        logger.fatal('Cannot find the results database %s', storage.BACKENDS[storage.BACKEND].database_file())
+        sys.exit(1)
+    storage.compact_measurements(args.max_age_days, args.keep_recent)
+
+
+if __name__ == '__main__':
+    main()
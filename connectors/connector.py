@@ -2,8 +2,15 @@
 # SPDX-License-Identifier: MIT
 #
 """Base class for AutoSteer-G connectors"""
+import threading
+from time import monotonic_ns
 from typing import Type
 from inference.preprocessing.preprocessor import QueryPlanPreprocessor
+from utils.util import plan_fingerprint
+
+
+class QueryTimeout(Exception):
+    """The execution of a query was cancelled at its deadline"""
 
 
 class DBConnector:
@@ -41,11 +48,48 @@ class DBConnector:
         """Execute the query and return its timed result"""
         raise NotImplementedError()
 
+    def execute_with_timeout(self, query: str, timeout_usecs: int) -> TimedResult:
+        """Execute the query and cancel it at the deadline, raises QueryTimeout. A query that cannot be cancelled times out once it finished."""
+        timed_out = threading.Event()
+
+        def cancel():
+            timed_out.set()
+            self.cancel()
+
+        timer = threading.Timer(timeout_usecs / 1_000_000, cancel)
+        begin = monotonic_ns()
+        timer.start()
+        try:
+            timed_result = self.execute(query)
+        except Exception as err:
+            if timed_out.is_set():
+                raise QueryTimeout(f'Query cancelled after {timeout_usecs} usecs') from err
+            raise
+        finally:
+            timer.cancel()
+        if (monotonic_ns() - begin) / 1_000 > timeout_usecs:
+            raise QueryTimeout(f'Query finished after its deadline of {timeout_usecs} usecs')
+        return timed_result
+
+    def clone(self) -> 'DBConnector':
+        """Return a new connector to the same database instance, e.g. for a connector pool. Connectors whose constructor takes
+        arguments override this."""
+        return type(self)()
+
+    def cancel(self) -> None:
+        """Cancel the running query, called by another thread"""
+        raise NotImplementedError()
+
     @staticmethod
     def get_plan_preprocessor() -> Type[QueryPlanPreprocessor]:
         """Return the type of the query plan preprocessor. The preprocessor transforms query plans into a form accepted by TCNNs."""
         raise NotImplementedError()
 
+    @staticmethod
+    def plan_fingerprint(plan: str) -> str:
+        """Return the canonical fingerprint of a query plan, plans that differ only in volatile fields have the same fingerprint"""
+        return plan_fingerprint(plan)
+
     @staticmethod
     def get_name() -> str:
         """Return the name of the database connector"""
@@ -0,0 +1,61 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""A bounded pool of database connectors shared by the threads explaining queries"""
+import contextlib
+import queue
+import threading
+from typing import Callable, Type
+from connectors.connector import DBConnector
+from utils.custom_logging import logger
+
+
+class ConnectorPool:
+    """Threads check connectors out of the pool and return them, at most max_size connectors are open at a time.
+    A returned connector has all knobs enabled again, a connector that raised an error is closed instead of reused.
+    The factory creates the connectors, e.g. a connector type or the clone method of a connector."""
+
+    def __init__(self, factory: Callable[[], DBConnector], max_size: int, connector_type: Type[DBConnector] = None):
+        self.factory = factory
+        self.connector_type = factory if connector_type is None else connector_type  # e.g. for the explain cache
+        self.max_size = max_size
+        self.idle = queue.LifoQueue()
+        self.available = threading.BoundedSemaphore(max_size)
+        self.lock = threading.Lock()
+        self.num_created = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @contextlib.contextmanager
+    def connector(self):
+        """Check out a connector, a new one is created if none is idle"""
+        with self.available:
+            try:
+                connector = self.idle.get_nowait()
+            except queue.Empty:
+                connector = self.factory()
+                with self.lock:
+                    self.num_created += 1
+            try:
+                yield connector
+                connector.set_disabled_knobs([])
+            except Exception:
+                _close(connector)
+                raise
+            self.idle.put(connector)
+
+    def close(self) -> None:
+        """Close all idle connectors"""
+        while not self.idle.empty():
+            _close(self.idle.get_nowait())
+
+
+def _close(connector: DBConnector) -> None:
+    try:
+        connector.close()
+    except Exception as e:  # pylint: disable=broad-except
+        logger.warning('Cannot close a pooled connector: %s', e)
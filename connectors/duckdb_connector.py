@@ -12,19 +12,24 @@ import os
 class DuckDBConnector(DBConnector):
     """This class handles the connection to the benchmarked PostgreSQL database"""
 
-    def __init__(self):
+    def __init__(self, target: str = 'DEFAULT'):
         super().__init__()
+        self.target = target  # the section of the config file describing the database instance
         self.config = configparser.ConfigParser()
         self.config.read(os.path.dirname(__file__) + '/../configs/duckdb.cfg')
         self.connection = None
         self.connect()
 
     def connect(self) -> None:
-        defaults = self.config['DEFAULT']
-        self.connection = duckdb.connect(defaults['DATABASE'])
+        defaults = self.config[self.target]
+        # Several processes can open a database file at the same time only if all of them open it read-only
+        self.connection = duckdb.connect(defaults['DATABASE'], read_only=defaults.getboolean('READ_ONLY', fallback=False))
         self.connection.execute(f'PRAGMA memory_limit=\'{defaults["MEMORY_LIMIT"]}\';')
         self.connection.execute(f'PRAGMA threads={defaults["THREADS"]}')
 
+    def clone(self) -> DBConnector:
+        return type(self)(self.target)
+
     def close(self) -> None:
         self.connection.close()
 
@@ -34,6 +39,11 @@ class DuckDBConnector(DBConnector):
         elapsed_time_usecs = int((time.time_ns() - begin) / 1_000)
         return DBConnector.TimedResult(str(result), elapsed_time_usecs)
 
+    def cancel(self) -> None:
+        # Connections can be interrupted since DuckDB 0.8, earlier versions finish the query and time out afterwards
+        if hasattr(self.connection, 'interrupt'):
+            self.connection.interrupt()
+
     def explain(self, query) -> str:
         result = self.connection.execute(f'EXPLAIN {query}').fetchone()
         return result[1]  # return the actual plan
@@ -3,22 +3,26 @@
 #
 """This module provides a connection to the MySql database for benchmarking"""
 import os
-from connectors.connector import DBConnector
+from connectors.connector import DBConnector, QueryTimeout
+from utils.util import plan_fingerprint
 import time
 import mysql.connector
 import configparser
 
+MAX_EXECUTION_TIME_EXCEEDED = 3024  # error number of queries interrupted by max_execution_time
+
 
 class MySqlConnector(DBConnector):
     """This class handles the connection to the benchmarked MySQL database"""
 
-    def __init__(self):
+    def __init__(self, target: str = 'DEFAULT'):
         # connection details
         super().__init__()
+        self.target = target  # the section of the config file describing the database instance
         # get connection config from config-file
         self.config = configparser.ConfigParser()
         self.config.read(os.path.dirname(__file__) + '/../configs/mysql.cfg')
-        defaults = self.config['DEFAULT']
+        defaults = self.config[target]
 
         self.user = defaults['USER']
         self.database = defaults['DATABASE']
@@ -32,6 +36,9 @@ class MySqlConnector(DBConnector):
         self.cursor = self.connection.cursor(buffered=True)
         self.cursor.execute('SET GLOBAL interactive_timeout=40000')
 
+    def clone(self) -> DBConnector:
+        return type(self)(self.target)
+
     def close(self) -> None:
         self.cursor.close()
         self.connection.close()
@@ -76,6 +83,23 @@ class MySqlConnector(DBConnector):
         elapsed_time_usec = int((time.time_ns() - begin) / 1_000)
         return DBConnector.TimedResult(result, elapsed_time_usec)
 
+    def execute_with_timeout(self, query: str, timeout_usecs: int) -> DBConnector.TimedResult:
+        """MySQL cancels read-only queries at the deadline given by max_execution_time"""
+        self.cursor.execute(f'SET SESSION max_execution_time = {max(timeout_usecs // 1_000, 1)}')
+        try:
+            return self.execute(query)
+        except mysql.connector.errors.DatabaseError as err:
+            if err.errno == MAX_EXECUTION_TIME_EXCEEDED:
+                raise QueryTimeout(f'Query cancelled after {timeout_usecs} usecs') from err
+            raise
+        finally:
+            self.cursor.execute('SET SESSION max_execution_time = 0')
+
+    @staticmethod
+    def plan_fingerprint(plan: str) -> str:
+        """The costs and cardinalities are estimates of the optimizer and rounded"""
+        return plan_fingerprint(plan, estimate_keys={'cost_info', 'rows_examined_per_scan', 'rows_produced_per_join', 'filtered'})
+
     @staticmethod
     def get_name() -> str:
         return 'mysql'
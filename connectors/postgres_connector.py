@@ -3,7 +3,10 @@
 #
 """This module provides a connection to the PostgreSQL database for benchmarking"""
 import psycopg2
-from connectors.connector import DBConnector
+import psycopg2.errors
+import psycopg2.extensions
+from connectors.connector import DBConnector, QueryTimeout
+from utils.util import plan_fingerprint
 import configparser
 import time
 import os
@@ -13,17 +16,19 @@ import json
 class PostgresConnector(DBConnector):
     """This class handles the connection to the tested PostgreSQL database"""
 
-    def __init__(self):
+    def __init__(self, target: str = 'DEFAULT'):
         super().__init__()
+        self.target = target  # the section of the config file describing the database instance
         # get connection config from config-file
         self.config = configparser.ConfigParser()
         self.config.read(os.path.dirname(__file__) + '/../configs/postgres.cfg')
-        defaults = self.config['DEFAULT']
+        defaults = self.config[target]
         user = defaults['DB_USER']
         database = defaults['DB_NAME']
         password = defaults['DB_PASSWORD']
         host = defaults['DB_HOST']
         self.timeout = defaults['TIMEOUT_MS']
+        self.disabled_knobs = []
         self.postgres_connection_string = f'postgresql://{user}:{password}@{host}:5432/{database}'
         self.connect()
 
@@ -32,12 +37,16 @@ class PostgresConnector(DBConnector):
         self.cursor = self.connection.cursor()
         self.cursor.execute(f'set statement_timeout to {self.timeout}; commit;')
 
+    def clone(self) -> DBConnector:
+        return type(self)(self.target)
+
     def close(self) -> None:
         self.cursor.close()
         self.connection.close()
 
     def set_disabled_knobs(self, knobs: list) -> None:
         # todo enable all others rules before
+        self.disabled_knobs = knobs
         all_knobs = set(PostgresConnector.get_knobs())
         statements = ''
         for knob in all_knobs:
@@ -67,6 +76,28 @@ class PostgresConnector(DBConnector):
 
         return DBConnector.TimedResult(result, elapsed_time_usec)
 
+    def execute_with_timeout(self, query: str, timeout_usecs: int) -> DBConnector.TimedResult:
+        """Postgres cancels the query at the deadline given by its statement timeout"""
+        self.cursor.execute(f'SET statement_timeout TO {max(timeout_usecs // 1_000, 1)}')
+        try:
+            return self.execute(query)
+        except psycopg2.errors.QueryCanceled as err:
+            # The rollback resets the knobs of the failed transaction
+            self.connection.rollback()
+            self.set_disabled_knobs(self.disabled_knobs)
+            raise QueryTimeout(f'Query cancelled after {timeout_usecs} usecs') from err
+        finally:
+            if not self.connection.closed and self.connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+                self.cursor.execute(f'SET statement_timeout TO {self.timeout}')
+
+    def cancel(self) -> None:
+        self.connection.cancel()
+
+    @staticmethod
+    def plan_fingerprint(plan: str) -> str:
+        """The costs and cardinalities are estimates of the optimizer and rounded"""
+        return plan_fingerprint(plan, estimate_keys={'Startup Cost', 'Total Cost', 'Plan Rows', 'Plan Width'})
+
     @staticmethod
     def get_name() -> str:
         return 'postgres'
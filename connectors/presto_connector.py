@@ -10,20 +10,23 @@ import configparser
 import os
 from inference.preprocessing.preprocess_presto_plans import PrestoPlanPreprocessor
 from inference.preprocessing.preprocessor import QueryPlanPreprocessor
+from utils.util import plan_fingerprint
 
 
 class PrestoConnector(DBConnector):
     """This class wraps a Presto session"""
 
-    def __init__(self):
+    def __init__(self, target: str = 'DEFAULT'):
         super().__init__()
+        self.target = target  # the section of the config file describing the database instance
         self.config = configparser.ConfigParser()
         self.config.read(os.path.dirname(__file__) + '/../configs/presto.cfg')
         self.session_properties = {}
+        self.cursor = None  # the cursor of the running query
         self.connect()
 
     def connect(self) -> None:
-        defaults = self.config['DEFAULT']
+        defaults = self.config[self.target]
         self.session_properties['query_max_execution_time'] = defaults['execution_timeout']
         self.connection: prestodb.dbapi.Connection = prestodb.dbapi.connect(
             host=defaults['host'],
@@ -35,15 +38,23 @@ class PrestoConnector(DBConnector):
             session_properties=self.session_properties,
         )
 
+    def clone(self) -> DBConnector:
+        return type(self)(self.target)
+
     def close(self) -> None:
         self.connection.close()
 
     def execute(self, query) -> connectors.connector.DBConnector.TimedResult:
         cur = self.connection.cursor()
+        self.cursor = cur
         cur.execute(query)
         result = cur.fetchall()
         return connectors.connector.DBConnector.TimedResult(result, cur.stats['elapsedTimeMillis'] * 1_000)
 
+    def cancel(self) -> None:
+        if self.cursor is not None:
+            self.cursor.cancel()
+
     def set_disabled_knobs(self, knobs: list) -> None:
         all_knobs = PrestoConnector.get_knobs()
         for knob in all_knobs:
@@ -73,6 +84,11 @@ class PrestoConnector(DBConnector):
         """Return the type of the query plan preprocessor"""
         return PrestoPlanPreprocessor
 
+    @staticmethod
+    def plan_fingerprint(plan: str) -> str:
+        """The ids of the plan nodes are generated by the planner, the estimates of the cost-based optimizer are rounded"""
+        return plan_fingerprint(plan, volatile_keys={'id'}, estimate_keys={'estimates'})
+
     @staticmethod
     def get_name() -> str:
         return 'presto'
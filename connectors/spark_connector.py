@@ -8,29 +8,31 @@ import time
 import re
 import os
 from utils.custom_logging import logger
+from utils.util import plan_fingerprint
 from connectors.connector import DBConnector
 import configparser
 
 APP_ID = 0
 PLAN_ID = 0
 EXCLUDED_RULES = 'spark.sql.optimizer.excludedRules'
+PLAN_IDS = re.compile(r'#\d+L?|\(\d+\)|\[\d+]')
 
 
 def _postprocess_plan(plan) -> str:
     """Remove random ids from the explained query plan"""
-    pattern = re.compile(r'#\d+L?|\(\d+\)|\[\d+]')
-    return re.sub(pattern, '', plan)
+    return re.sub(PLAN_IDS, '', plan)
 
 
 class SparkConnector(DBConnector):
     """This class implements the AutoSteer-G connector for a Spark cluster accepting SQL statements"""
 
-    def __init__(self):
+    def __init__(self, target: str = 'DEFAULT'):
         super().__init__()
+        self.target = target  # the section of the config file describing the database instance
         # get connection config from config-file
         self.config = configparser.ConfigParser()
         self.config.read(os.path.dirname(__file__) + '/../configs/spark.cfg')
-        defaults = self.config['DEFAULT']
+        defaults = self.config[target]
         logger.info('SparkSQL connector conntects to %s', defaults['SPARK_MASTER_URL'])
         self.spark_master_url = defaults['SPARK_MASTER_URL']
         self.data_location = defaults['DATA_LOCATION']
@@ -50,6 +52,9 @@ class SparkConnector(DBConnector):
             self.spark_session = SparkSession.builder.master(self.spark_master_url).appName(self.app_name).getOrCreate()
         SparkSession.getActiveSession()
 
+    def clone(self) -> DBConnector:
+        return type(self)(self.target)
+
     def close(self) -> None:
         if self.spark_session is not None:
             self.spark_session.stop()
@@ -67,6 +72,8 @@ class SparkConnector(DBConnector):
             logger.fatal('SparkConnector cannot find the data directory containing the parquet files')
 
     def execute(self, query) -> DBConnector.TimedResult:
+        # Jobs of the query belong to the connector's job group, i.e. they can be cancelled by another thread
+        self.spark_session.sparkContext.setJobGroup(self._job_group(), 'AutoSteer query', interruptOnCancel=True)
         begin = time.time_ns()
         collection = self.spark_session.sql(query).collect()
         elapsed_time_usecs = int((time.time_ns() - begin) / 1_000)
@@ -76,6 +83,12 @@ class SparkConnector(DBConnector):
 
         return DBConnector.TimedResult(collection, elapsed_time_usecs)
 
+    def cancel(self) -> None:
+        self.spark_session.sparkContext.cancelJobGroup(self._job_group())
+
+    def _job_group(self) -> str:
+        return f'autosteer-{self.app_name}'
+
     def explain(self, query) -> str:
         timed_result = self.execute(f'EXPLAIN FORMATTED {query}')
         return _postprocess_plan(timed_result.result[0])
@@ -96,6 +109,11 @@ class SparkConnector(DBConnector):
         else:
             return not knob in exluded_rules
 
+    @staticmethod
+    def plan_fingerprint(plan: str) -> str:
+        """Plans explained before the ids were removed by _postprocess_plan have the same fingerprint"""
+        return plan_fingerprint(plan, volatile_pattern=PLAN_IDS)
+
     @staticmethod
     def get_name() -> str:
         return 'spark'
@@ -20,13 +20,19 @@ class AutoSteerInferenceException(Exception):
 
 
 def _load_data(bench=None, training_ratio=0.8):
-    """Load the training and test data for a specific benchmark"""
-    training_data, test_data = storage.experience(bench, training_ratio)
-
-    x_train = [config.plan_json for config in training_data]
-    y_train = [config.walltime for config in training_data]
-    x_test = [config.plan_json for config in test_data]
-    y_test = [config.walltime for config in test_data]
+    """Load the training and test data for a specific benchmark, the experience is streamed and split by query"""
+    training_queries, _ = storage.split_experience(bench, training_ratio)
+    x_train, y_train, training_data = [], [], []
+    x_test, y_test, test_data = [], [], []
+
+    for config in storage.stream_experience(bench):
+        if config.query_id in training_queries:
+            x, y, data = x_train, y_train, training_data
+        else:
+            x, y, data = x_test, y_test, test_data
+        x.append(config.plan_json)
+        y.append(config.walltime)
+        data.append(config)
 
     return x_train, y_train, x_test, y_test, training_data, test_data
 
@@ -80,6 +86,13 @@ def _train_and_save_model(preprocessor, filename, x_train, y_train, x_test, y_te
     return regression_model, losses
 
 
+def retrain_model(preprocessor, filename, bench=None):
+    """Train a TCNN model on all measurements collected so far, e.g. during the exploration, and save it"""
+    x_train, y_train, x_test, y_test, _, _ = _load_data(bench)
+    regression_model, _ = _train_and_save_model(preprocessor, filename, x_train, y_train, x_test, y_test)
+    return regression_model
+
+
 def _evaluate_prediction(y, predictions, plans, query_path, is_training) -> PerformancePrediction:
     default_plan = list(filter(lambda x: x.num_disabled_rules == 0, plans))[0]
 
@@ -11,15 +11,21 @@ import connectors.connector
 from connectors import mysql_connector, duckdb_connector, postgres_connector, presto_connector, spark_connector
 from utils.arguments_parser import get_parser
 from utils.custom_logging import logger
-from autosteer.dp_exploration import explore_optimizer_configs
+from autosteer.query_scheduler import get_query_scheduler
 from autosteer.query_span import run_get_query_span
 from inference.train import train_tcnn
 
 
-def approx_query_span_and_run(connector: Type[connectors.connector.DBConnector], benchmark: str, query: str):
-    run_get_query_span(connector, benchmark, query)
-    connector = connector()
-    explore_optimizer_configs(connector, f'{benchmark}/{query}')
+def approx_query_span(connector: Type[connectors.connector.DBConnector], benchmark: str, query: str, resume: bool) -> bool:
+    """Approximate the query span of a query and return whether the query needs to be explored"""
+    checkpoint = storage.load_exploration_checkpoint(f'{benchmark}/{query}') if resume else None
+    if checkpoint is not None and checkpoint.completed:
+        logger.info('Skip the explored query %s', query)
+        return False
+    # The query span is stored before the exploration saves its first checkpoint
+    if checkpoint is None:
+        run_get_query_span(connector, benchmark, query)
+    return True
 
 
 def inference_mode(connector, benchmark: str, retrain: bool, create_datasets: bool):
@@ -62,6 +68,12 @@ if __name__ == '__main__':
         logger.info('Run AutoSteer\'s training mode')
         queries = sorted(list(filter(lambda q: q.endswith('.sql'), os.listdir(args.benchmark))))
         logger.info('Found the following SQL files: %s', queries)
+        query_paths = []
         for query in queries:
-            logger.info('run Q%s...', query)
-            approx_query_span_and_run(ConnectorType, args.benchmark, query)
+            logger.info('Approximate the query span of Q%s...', query)
+            if approx_query_span(ConnectorType, args.benchmark, query, args.resume):
+                query_paths.append(f'{args.benchmark}/{query}')
+        # The explorations of all queries are interleaved, the queries with the highest expected savings are explored first
+        reports = get_query_scheduler(ConnectorType(), query_paths, args.resume).run()
+        for report in reports:
+            logger.info('%s', report)
@@ -0,0 +1,80 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Copy the SQLite results database results/<database>.sqlite into the DuckDB results database results/<database>.duckdb.
+Run from the repository root: python migrate_results.py --database <tested database, e.g. postgres> [--chunk-size N]"""
+import argparse
+import os
+import sqlite3
+import sys
+import pandas as pd
+
+import storage
+from utils.custom_logging import logger
+
+# Tables in the order of their references; sequences generate the ids of the tables having one
+TABLES = [('benchmarks', 'benchmarks_id'), ('queries', 'queries_id'), ('hint_sets', 'hint_sets_id'), ('query_plans', None),
+          ('query_optimizer_configs', 'query_optimizer_configs_id'), ('measurements', 'measurements_id'), ('query_required_optimizers', None),
+          ('query_effective_optimizers', None), ('query_effective_optimizers_dependencies', None), ('hint_set_summary', None),
+          ('measurement_rollups', None), ('exploration_checkpoints', None), ('query_spans', None)]
+
+# Nullable pandas types for the DuckDB column types, e.g. 64-bit fingerprints must not be converted to floats because of NULLs
+PANDAS_TYPES = {'INTEGER': 'Int64', 'BIGINT': 'Int64', 'BOOLEAN': 'boolean', 'DOUBLE': 'float64'}
+
+
+def copy_results(database, chunk_size=100_000) -> dict:
+    """Copy all tables chunk-wise using pandas data frames scanned by DuckDB, returns the number of copied rows per table"""
+    previous_settings = storage.BACKEND, storage.TESTED_DATABASE
+    storage.TESTED_DATABASE = database
+    try:
+        # Bring the SQLite database to the schema version of the DuckDB database first
+        storage.BACKEND = 'sqlite'
+        storage.select_query('SELECT count(*) FROM benchmarks', {})
+        storage.close()
+
+        storage.BACKEND = 'duckdb'
+        if os.path.isfile(f'{storage.RESULTS_DIRECTORY}/{database}.duckdb'):
+            raise FileExistsError(f'The DuckDB results database {storage.RESULTS_DIRECTORY}/{database}.duckdb exists already')
+        num_rows = {}
+        with sqlite3.connect(f'{storage.RESULTS_DIRECTORY}/{database}.sqlite') as source, storage._db() as target:  # pylint: disable=protected-access
+            target.execute('DELETE FROM hint_sets')  # the default hint-set is copied as well
+            for table, sequence in TABLES:
+                num_rows[table] = 0
+                cursor = source.execute(f'SELECT * FROM {table}')
+                columns = [column[0] for column in cursor.description]
+                types = dict(target.execute('SELECT column_name, data_type FROM information_schema.columns WHERE table_name = :table',
+                                           table=table).fetchall())
+                rows = cursor.fetchmany(chunk_size)
+                while len(rows) > 0:
+                    df = pd.DataFrame({column: pd.array([row[i] for row in rows], dtype=PANDAS_TYPES.get(types[column], object))
+                                       for i, column in enumerate(columns)})
+                    target.cursor.register('source_rows', df)
+                    target.execute(f'INSERT INTO {table} ({", ".join(columns)}) SELECT * FROM source_rows')
+                    target.cursor.unregister('source_rows')
+                    num_rows[table] += len(rows)
+                    rows = cursor.fetchmany(chunk_size)
+                if sequence is not None:
+                    # DuckDB cannot restart a sequence, skip the ids of the copied rows instead
+                    max_id = target.execute(f'SELECT coalesce(max(id), 0) FROM {table}').fetchone()[0]
+                    target.execute(f"SELECT max(nextval('{sequence}')) FROM range(:max_id)", max_id=max_id)
+                logger.info('Copied %s rows of table %s', num_rows[table], table)
+        return num_rows
+    finally:
+        storage.close()
+        storage.BACKEND, storage.TESTED_DATABASE = previous_settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy a SQLite results database into a DuckDB results database')
+    parser.add_argument('--database', type=str, required=True, help='the tested database, i.e. the name of the results database')
+    parser.add_argument('--chunk-size', type=int, default=100_000, help='number of rows copied at once')
+    args = parser.parse_args()
+    if not os.path.isfile(f'{storage.RESULTS_DIRECTORY}/{args.database}.sqlite'):
+        logger.fatal('Cannot find the results database %s/%s.sqlite', storage.RESULTS_DIRECTORY, args.database)
+        sys.exit(1)
+    copy_results(args.database, args.chunk_size)
+    logger.info('Set backend=duckdb in the [storage] section of config.cfg to use the DuckDB results database')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+-- Schema version 2: normalize hint-sets to integer ids and add covering indexes for the analytical queries
+--------------------------------------------------------------------------------
+-- Every hint-set is stored once and shared by all queries, the default plan (no disabled knobs) has id 0
+CREATE TABLE hint_sets
+(
+    id                  INTEGER PRIMARY KEY NOT NULL,
+    disabled_rules      TEXT UNIQUE NOT NULL, -- comma-separated and sorted knobs
+    num_disabled_rules  INTEGER NOT NULL
+);
+INSERT INTO hint_sets (id, disabled_rules, num_disabled_rules) VALUES (0, 'None', 0);
+INSERT INTO hint_sets (disabled_rules, num_disabled_rules)
+SELECT DISTINCT disabled_rules, num_disabled_rules FROM query_optimizer_configs WHERE disabled_rules != 'None';
+--------------------------------------------------------------------------------
+-- register_query() inserted a new row for every training run, keep the first one per query_path
+CREATE TEMP TABLE canonical_queries AS
+SELECT q.id AS query_id, (SELECT min(d.id) FROM queries d WHERE d.query_path = q.query_path) AS canonical_id
+FROM queries q;
+UPDATE queries SET result_fingerprint = (SELECT max(d.result_fingerprint) FROM queries d WHERE d.query_path = queries.query_path)
+WHERE result_fingerprint IS NULL;
+--------------------------------------------------------------------------------
+CREATE TABLE query_optimizer_configs_v2
+(
+    id                   INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL ,
+    query_id             INTEGER REFERENCES queries NOT NULL,
+    hint_set_id          INTEGER REFERENCES hint_sets NOT NULL,
+    query_plan           TEXT NOT NULL,
+    hash                 INTEGER NOT NULL, -- the hash value of the optimizer query plan
+    duplicated_plan      BOOLEAN DEFAULT FALSE NOT NULL,
+    UNIQUE (query_id, hint_set_id)
+);
+INSERT OR IGNORE INTO query_optimizer_configs_v2 (id, query_id, hint_set_id, query_plan, hash, duplicated_plan)
+SELECT qoc.id, cq.canonical_id, hs.id, qoc.query_plan, qoc.hash, qoc.duplicated_plan
+FROM query_optimizer_configs qoc, canonical_queries cq, hint_sets hs
+WHERE cq.query_id = qoc.query_id AND hs.disabled_rules = qoc.disabled_rules
+ORDER BY qoc.id;
+-- Measurements of configs belonging to a duplicated query row move to the config of the first query row
+UPDATE measurements SET query_optimizer_config_id = (
+    SELECT v2.id
+    FROM query_optimizer_configs qoc, canonical_queries cq, hint_sets hs, query_optimizer_configs_v2 v2
+    WHERE qoc.id = measurements.query_optimizer_config_id
+      AND cq.query_id = qoc.query_id
+      AND hs.disabled_rules = qoc.disabled_rules
+      AND v2.query_id = cq.canonical_id
+      AND v2.hint_set_id = hs.id)
+WHERE query_optimizer_config_id NOT IN (SELECT id FROM query_optimizer_configs_v2);
+DROP TABLE query_optimizer_configs;
+ALTER TABLE query_optimizer_configs_v2 RENAME TO query_optimizer_configs;
+--------------------------------------------------------------------------------
+UPDATE OR IGNORE query_required_optimizers SET query_id = (SELECT canonical_id FROM canonical_queries WHERE query_id = query_required_optimizers.query_id);
+UPDATE OR IGNORE query_effective_optimizers SET query_id = (SELECT canonical_id FROM canonical_queries WHERE query_id = query_effective_optimizers.query_id);
+UPDATE OR IGNORE query_effective_optimizers_dependencies
+SET query_id = (SELECT canonical_id FROM canonical_queries WHERE query_id = query_effective_optimizers_dependencies.query_id);
+DELETE FROM query_required_optimizers WHERE query_id NOT IN (SELECT canonical_id FROM canonical_queries);
+DELETE FROM query_effective_optimizers WHERE query_id NOT IN (SELECT canonical_id FROM canonical_queries);
+DELETE FROM query_effective_optimizers_dependencies WHERE query_id NOT IN (SELECT canonical_id FROM canonical_queries);
+DELETE FROM queries WHERE id NOT IN (SELECT canonical_id FROM canonical_queries);
+DROP TABLE canonical_queries;
+--------------------------------------------------------------------------------
+-- Indexes; SQLite appends the rowid to every index, i.e. they cover the id lookups
+CREATE UNIQUE INDEX queries_query_path ON queries (query_path);
+CREATE INDEX query_optimizer_configs_hash ON query_optimizer_configs (query_id, hash, hint_set_id);
+CREATE INDEX hint_sets_num_disabled_rules ON hint_sets (num_disabled_rules);
+CREATE INDEX measurements_query_optimizer_config_id ON measurements (query_optimizer_config_id, walltime);
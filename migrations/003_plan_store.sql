@@ -0,0 +1,31 @@
+-- Schema version 3: content-addressed and compressed query plans
+-- plan_digest(), plan_compression(), and compress_plan() are provided by storage._migrate
+--------------------------------------------------------------------------------
+CREATE TABLE query_plans
+(
+    digest               TEXT PRIMARY KEY NOT NULL, -- sha256 of the canonical plan
+    compression          TEXT NOT NULL, -- none, zlib, or lzma
+    plan                 BLOB NOT NULL,
+    plan_size            INTEGER NOT NULL -- size of the uncompressed plan in bytes
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO query_plans (digest, compression, plan, plan_size)
+SELECT plan_digest(query_plan), plan_compression(query_plan), compress_plan(query_plan), length(CAST(query_plan AS BLOB))
+FROM query_optimizer_configs
+ORDER BY id;
+--------------------------------------------------------------------------------
+CREATE TABLE query_optimizer_configs_v3
+(
+    id                   INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL ,
+    query_id             INTEGER REFERENCES queries NOT NULL,
+    hint_set_id          INTEGER REFERENCES hint_sets NOT NULL,
+    plan_digest          TEXT REFERENCES query_plans NOT NULL,
+    hash                 INTEGER NOT NULL, -- the hash value of the optimizer query plan
+    duplicated_plan      BOOLEAN DEFAULT FALSE NOT NULL,
+    UNIQUE (query_id, hint_set_id)
+);
+INSERT INTO query_optimizer_configs_v3 (id, query_id, hint_set_id, plan_digest, hash, duplicated_plan)
+SELECT id, query_id, hint_set_id, plan_digest(query_plan), hash, duplicated_plan
+FROM query_optimizer_configs;
+DROP TABLE query_optimizer_configs;
+ALTER TABLE query_optimizer_configs_v3 RENAME TO query_optimizer_configs;
+CREATE INDEX query_optimizer_configs_hash ON query_optimizer_configs (query_id, hash, hint_set_id);
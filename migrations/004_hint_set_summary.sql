@@ -0,0 +1,32 @@
+-- Schema version 4: incrementally maintained summary of the median runtimes, savings, and ranks of all hint-sets per query
+--------------------------------------------------------------------------------
+CREATE TABLE hint_set_summary
+(
+    query_optimizer_config_id INTEGER PRIMARY KEY REFERENCES query_optimizer_configs NOT NULL,
+    query_id                  INTEGER REFERENCES queries NOT NULL,
+    hint_set_id               INTEGER REFERENCES hint_sets NOT NULL,
+    num_measurements          INTEGER NOT NULL,
+    median_walltime           REAL NOT NULL,
+    baseline_median           REAL, -- median walltime of the default hint-set of the query
+    savings                   REAL, -- relative savings wrt. the baseline
+    rank                      INTEGER -- dense rank of the alternative hint-sets of a query by savings, 1 is the best
+);
+CREATE INDEX hint_set_summary_query_rank ON hint_set_summary (query_id, rank, hint_set_id);
+CREATE INDEX hint_set_summary_rank ON hint_set_summary (rank);
+--------------------------------------------------------------------------------
+INSERT INTO hint_set_summary (query_optimizer_config_id, query_id, hint_set_id, num_measurements, median_walltime)
+SELECT qoc.id, qoc.query_id, qoc.hint_set_id, count(*), median(m.walltime)
+FROM query_optimizer_configs qoc, measurements m
+WHERE m.query_optimizer_config_id = qoc.id
+GROUP BY qoc.id, qoc.query_id, qoc.hint_set_id;
+UPDATE hint_set_summary
+SET baseline_median = (SELECT b.median_walltime FROM hint_set_summary b WHERE b.query_id = hint_set_summary.query_id AND b.hint_set_id = 0);
+UPDATE hint_set_summary
+SET savings = (baseline_median - median_walltime) / baseline_median;
+UPDATE hint_set_summary
+SET rank = (SELECT count(DISTINCT o.median_walltime) + 1
+            FROM hint_set_summary o
+            WHERE o.query_id = hint_set_summary.query_id
+              AND o.hint_set_id != 0
+              AND o.median_walltime < hint_set_summary.median_walltime)
+WHERE hint_set_id != 0 AND baseline_median IS NOT NULL;
@@ -0,0 +1,31 @@
+-- Schema version 5: roll-ups of old measurements and a view combining them with the recent raw measurements
+--------------------------------------------------------------------------------
+CREATE TABLE measurement_rollups
+(
+    query_optimizer_config_id INTEGER PRIMARY KEY REFERENCES query_optimizer_configs NOT NULL,
+    num_measurements          INTEGER NOT NULL,
+    median_walltime           REAL NOT NULL,
+    mad_walltime              REAL NOT NULL, -- median absolute deviation from the median
+    min_walltime              REAL NOT NULL,
+    max_walltime              REAL NOT NULL,
+    last_time                 TIMESTAMP NOT NULL -- time of the newest rolled-up measurement
+);
+--------------------------------------------------------------------------------
+-- A roll-up of n measurements appears as its minimum, its maximum, and n - 2 times its median,
+-- i.e. the number of measurements, the minimum, the maximum, and the median are kept exactly.
+CREATE VIEW rolled_up_measurements (query_optimizer_config_id, walltime, time) AS
+WITH RECURSIVE copies (i) AS
+  (SELECT 1
+   UNION ALL
+   SELECT i + 1 FROM copies WHERE i < (SELECT max(num_measurements) - 2 FROM measurement_rollups))
+SELECT query_optimizer_config_id, min_walltime, last_time FROM measurement_rollups
+UNION ALL
+SELECT query_optimizer_config_id, max_walltime, last_time FROM measurement_rollups WHERE num_measurements > 1
+UNION ALL
+SELECT r.query_optimizer_config_id, r.median_walltime, r.last_time FROM measurement_rollups r, copies c WHERE c.i <= r.num_measurements - 2;
+--------------------------------------------------------------------------------
+-- Readers of measurements use this view to see the recent raw measurements and the roll-ups of the old ones
+CREATE VIEW all_measurements (query_optimizer_config_id, walltime, time) AS
+SELECT query_optimizer_config_id, walltime, time FROM measurements
+UNION ALL
+SELECT query_optimizer_config_id, walltime, time FROM rolled_up_measurements;
@@ -0,0 +1,11 @@
+-- Schema version 6: checkpoints of the dynamic-programming exploration of each query, interrupted training runs resume from them
+--------------------------------------------------------------------------------
+CREATE TABLE exploration_checkpoints
+(
+    query_id  INTEGER PRIMARY KEY REFERENCES queries NOT NULL,
+    dp_level  INTEGER NOT NULL, -- the next DP level to enter after the pending hint-sets
+    blacklist TEXT NOT NULL, -- JSON list of the hint-sets performing worse than the baseline
+    pending   TEXT NOT NULL, -- JSON list of the hint-sets of the current DP level that are not measured yet
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    time      TEXT NOT NULL
+);
@@ -0,0 +1,10 @@
+-- Schema version 7: measurements of queries cancelled at their deadline, their walltime is the deadline, i.e. a lower bound
+--------------------------------------------------------------------------------
+ALTER TABLE measurements ADD COLUMN censored BOOLEAN NOT NULL DEFAULT FALSE;
+--------------------------------------------------------------------------------
+-- Censored measurements are not rolled up
+DROP VIEW all_measurements;
+CREATE VIEW all_measurements (query_optimizer_config_id, walltime, time, censored) AS
+SELECT query_optimizer_config_id, walltime, time, censored FROM measurements
+UNION ALL
+SELECT query_optimizer_config_id, walltime, time, FALSE FROM rolled_up_measurements;
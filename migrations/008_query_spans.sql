@@ -0,0 +1,10 @@
+-- Schema version 8: the version of the approximated query span of each query, a query span is only updated if the query or the knobs change
+--------------------------------------------------------------------------------
+CREATE TABLE query_spans
+(
+    query_id   INTEGER PRIMARY KEY REFERENCES queries NOT NULL,
+    query_hash TEXT NOT NULL, -- SHA-256 of the normalized query
+    knobs_hash TEXT NOT NULL, -- SHA-256 of the sorted knobs
+    knobs      TEXT NOT NULL, -- JSON list of the knobs that were probed
+    time       TEXT NOT NULL
+);
@@ -0,0 +1,23 @@
+-- Schema version 9: roll-ups keep the mean instead of the median absolute deviation, readers combine the roll-ups with the raw measurements
+-- by their statistics instead of rebuilding a row per rolled-up measurement
+--------------------------------------------------------------------------------
+DROP VIEW all_measurements;
+DROP VIEW rolled_up_measurements;
+--------------------------------------------------------------------------------
+CREATE TABLE rollup_statistics
+(
+    query_optimizer_config_id INTEGER PRIMARY KEY REFERENCES query_optimizer_configs NOT NULL,
+    num_measurements          INTEGER NOT NULL,
+    median_walltime           REAL NOT NULL,
+    mean_walltime             REAL NOT NULL,
+    min_walltime              REAL NOT NULL,
+    max_walltime              REAL NOT NULL,
+    last_time                 TIMESTAMP NOT NULL -- time of the newest rolled-up measurement
+);
+-- The mean of existing roll-ups is the mean readers saw so far: the minimum, the maximum, and n - 2 times the median
+INSERT INTO rollup_statistics (query_optimizer_config_id, num_measurements, median_walltime, mean_walltime, min_walltime, max_walltime, last_time)
+SELECT query_optimizer_config_id, num_measurements, median_walltime,
+       (min_walltime + max_walltime + (num_measurements - 2) * median_walltime) / num_measurements, min_walltime, max_walltime, last_time
+FROM measurement_rollups;
+DROP TABLE measurement_rollups;
+ALTER TABLE rollup_statistics RENAME TO measurement_rollups;
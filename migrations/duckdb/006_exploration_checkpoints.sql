@@ -0,0 +1,12 @@
+-- Schema version 6: checkpoints of the dynamic-programming exploration of each query, interrupted training runs resume from them
+--------------------------------------------------------------------------------
+-- Checkpoints are replaced by deleting and inserting them in one transaction, which DuckDB does not allow for keys
+CREATE TABLE exploration_checkpoints
+(
+    query_id  INTEGER NOT NULL,
+    dp_level  INTEGER NOT NULL, -- the next DP level to enter after the pending hint-sets
+    blacklist VARCHAR NOT NULL, -- JSON list of the hint-sets performing worse than the baseline
+    pending   VARCHAR NOT NULL, -- JSON list of the hint-sets of the current DP level that are not measured yet
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    time      VARCHAR NOT NULL
+);
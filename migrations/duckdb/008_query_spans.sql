@@ -0,0 +1,11 @@
+-- Schema version 8: the version of the approximated query span of each query, a query span is only updated if the query or the knobs change
+--------------------------------------------------------------------------------
+-- Versions are replaced by deleting and inserting them in one transaction, which DuckDB does not allow for keys
+CREATE TABLE query_spans
+(
+    query_id   INTEGER NOT NULL,
+    query_hash VARCHAR NOT NULL, -- SHA-256 of the normalized query
+    knobs_hash VARCHAR NOT NULL, -- SHA-256 of the sorted knobs
+    knobs      VARCHAR NOT NULL, -- JSON list of the knobs that were probed
+    time       VARCHAR NOT NULL
+);
@@ -0,0 +1,14 @@
+-- Schema version 9: roll-ups keep the mean instead of the median absolute deviation, readers combine the roll-ups with the raw measurements
+-- by their statistics instead of rebuilding a row per rolled-up measurement
+--------------------------------------------------------------------------------
+DROP VIEW all_measurements;
+DROP VIEW rolled_up_measurements;
+--------------------------------------------------------------------------------
+-- The mean of existing roll-ups is the mean readers saw so far: the minimum, the maximum, and n - 2 times the median
+CREATE TABLE rollup_statistics AS
+SELECT query_optimizer_config_id, num_measurements, median_walltime,
+       (min_walltime + max_walltime + (num_measurements - 2) * median_walltime) / num_measurements AS mean_walltime,
+       min_walltime, max_walltime, last_time
+FROM measurement_rollups;
+DROP TABLE measurement_rollups;
+ALTER TABLE rollup_statistics RENAME TO measurement_rollups;
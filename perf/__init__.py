@@ -0,0 +1,3 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
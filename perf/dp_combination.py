@@ -0,0 +1,56 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Micro-benchmark for the DP combination of hint-sets on the Presto knobs, DP levels 2-6.
+Run from the repository root: python -m perf.dp_combination [--promising N] [--previous N] [--blacklist N]"""
+import argparse
+import random
+import time
+
+from autosteer.hint_set_bitsets import KnobIndex, HintSetBlacklist, combine
+
+
+def _combine_frozensets(promising_knobs, previous_hint_sets, blacklist):
+    """Previous behaviour: frozensets of knob names, every candidate scans the whole blacklist"""
+    result = set()
+    for knobs in promising_knobs:
+        for hint_set in previous_hint_sets:
+            if knobs[0] not in hint_set:
+                new_hint_set = frozenset(hint_set + knobs)
+                if all(not blacklisted.issubset(new_hint_set) for blacklisted in blacklist):
+                    result.add(new_hint_set)
+    return sorted(sorted(hint_set) for hint_set in result)
+
+
+def _seconds(function, *args) -> tuple:
+    begin = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - begin, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the DP combination of hint-sets')
+    parser.add_argument('--knobs', help='file with one knob per line', default='knobs/presto.txt')
+    parser.add_argument('--promising', help='number of promising single knobs', type=int, default=60)
+    parser.add_argument('--previous', help='number of promising hint-sets of the previous level', type=int, default=400)
+    parser.add_argument('--blacklist', help='number of blacklisted hint-sets', type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(args.knobs, encoding='utf-8') as f:
+        knobs = [line.strip() for line in f if line.strip()]
+    rng = random.Random(42)
+    print(f'{len(knobs)} knobs')
+    for level in range(2, 7):
+        promising_knobs = [[knob] for knob in rng.sample(knobs, args.promising)]
+        previous_hint_sets = [rng.sample(knobs, level - 1) for _ in range(args.previous)]
+        blacklist = [rng.sample(knobs, rng.randint(1, level)) for _ in range(args.blacklist)]
+
+        frozenset_secs, expected = _seconds(_combine_frozensets, promising_knobs, previous_hint_sets, [frozenset(b) for b in blacklist])
+        knob_index = KnobIndex(knobs)
+        bitset_secs, result = _seconds(combine, knob_index, promising_knobs, previous_hint_sets, HintSetBlacklist(knob_index, blacklist))
+        assert result == expected
+        print(f'level {level}: {len(result):7d} hint-sets   frozensets: {frozenset_secs:8.3f}s   bitsets: {bitset_secs:8.3f}s')
+
+
+if __name__ == '__main__':
+    main()
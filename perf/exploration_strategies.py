@@ -0,0 +1,103 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Compare the exploration strategies on the same simulated workload: every knob changes the runtime by a random factor,
+pairs of knobs interact, and the executions are simulated without sleeping.
+Run from the repository root: python -m perf.exploration_strategies [--queries N] [--knobs N] [--budget-executions N]"""
+import argparse
+import logging
+import random
+import shutil
+import tempfile
+from unittest import mock
+
+import storage
+from autosteer.dp_exploration import explore_optimizer_configs
+from autosteer.exploration_strategies import ExplorationBudget, DPStrategy, BeamSearchStrategy, GreedyForwardStrategy, UCBStrategy
+from connectors.connector import DBConnector
+from utils.custom_logging import logger
+
+
+class SimulatedConnector(DBConnector):
+    """Runtimes are the product of the factors of the disabled knobs and their pairs, with 2% noise"""
+
+    def __init__(self, factors: dict, interactions: dict, rng: random.Random):
+        super().__init__()
+        self.factors = factors
+        self.interactions = interactions
+        self.rng = rng
+        self.knobs = []
+
+    def clone(self) -> DBConnector:
+        return SimulatedConnector(self.factors, self.interactions, self.rng)
+
+    def close(self) -> None:
+        pass
+
+    def set_disabled_knobs(self, knobs: list) -> None:
+        self.knobs = sorted(knobs)
+
+    def explain(self, query: str) -> str:
+        return f'{{"plan": "{",".join(self.knobs)}"}}'
+
+    def _runtime(self) -> float:
+        runtime = 1_000_000.0
+        for i, knob in enumerate(self.knobs):
+            runtime *= self.factors[knob]
+            for other in self.knobs[i + 1:]:
+                runtime *= self.interactions.get((knob, other), 1.0)
+        return runtime * self.rng.gauss(1.0, 0.02)
+
+    def execute(self, query: str) -> DBConnector.TimedResult:
+        return DBConnector.TimedResult('[(42,)]', int(self._runtime()))
+
+    def execute_with_timeout(self, query: str, timeout_usecs: int) -> DBConnector.TimedResult:
+        return self.execute(query)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the exploration strategies on a simulated workload')
+    parser.add_argument('--queries', help='number of simulated queries', type=int, default=5)
+    parser.add_argument('--knobs', help='number of knobs per query', type=int, default=12)
+    parser.add_argument('--budget-executions', help='executions per query, 0 is unbounded', type=int, default=0)
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    strategies = {'dp': lambda exploration: DPStrategy(exploration, 4),
+                  'beam': lambda exploration: BeamSearchStrategy(exploration, 4, 3),
+                  'greedy': lambda exploration: GreedyForwardStrategy(exploration, 4),
+                  'ucb': lambda exploration: UCBStrategy(exploration, 11, 3, 1.0)}
+    directory = tempfile.mkdtemp()
+    storage.RESULTS_DIRECTORY = directory
+    try:
+        for name, strategy in strategies.items():
+            rng = random.Random(42)  # the same workload for every strategy
+            storage.TESTED_DATABASE = name
+            storage.BENCHMARK_ID = storage.register_benchmark(directory)
+            savings, seconds, executions = 0.0, 0.0, 0
+            for query in range(args.queries):
+                query_path = f'{directory}/{query}.sql'
+                with open(query_path, 'w', encoding='utf-8') as f:
+                    f.write('SELECT 42;')
+                knobs = [f'knob_{i}' for i in range(args.knobs)]
+                storage.register_query(query_path)
+                for knob in knobs:
+                    storage.register_optimizer(query_path, knob, required=False)
+                factors = {knob: rng.choice([0.7, 0.9, 0.95, 1.0, 1.1, 1.5]) for knob in knobs}
+                interactions = {(a, b): rng.choice([0.8, 1.0, 1.0, 1.3]) for a in knobs for b in knobs if a < b}
+                connector = SimulatedConnector(factors, interactions, random.Random(query))
+                with mock.patch('autosteer.optimizer_config.get_exploration_strategy', strategy), \
+                        mock.patch('autosteer.optimizer_config.get_exploration_budget', lambda: ExplorationBudget(0, args.budget_executions, 2)):
+                    report = explore_optimizer_configs(connector, query_path)
+                savings += report.savings_usecs()
+                seconds += report.seconds
+                executions += report.executions
+            print(f'{name:8s} saves {savings / args.queries / 1000:8.1f} ms per query with {executions / args.queries:7.1f} executions '
+                  f'in {seconds:6.2f}s')
+            storage.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Micro-benchmark for the median aggregates of the results database.
+Run from the repository root: python -m perf.median_aggregates [--rows N]"""
+import argparse
+import random
+import sqlite3
+import time
+
+import storage
+from utils.sqlite_aggregates import register_aggregates
+
+
+def _median_query_time(connection) -> float:
+    begin = time.perf_counter()
+    connection.execute('SELECT config, median(walltime), percentile_99(walltime) FROM measurements GROUP BY config').fetchall()
+    return time.perf_counter() - begin
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the median aggregates per config')
+    parser.add_argument('--rows', help='number of measurements', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE measurements (config INTEGER, walltime INTEGER)')
+    connection.executemany('INSERT INTO measurements VALUES (?, ?)', ((i % 1000, random.randint(0, 10**6)) for i in range(args.rows)))
+
+    register_aggregates(connection)
+    print(f'native aggregates:  {_median_query_time(connection):8.3f}s')
+    if storage._use_extension():  # pylint: disable=protected-access
+        connection.enable_load_extension(True)
+        connection.load_extension(storage.EXTENSION_PATH)
+        print(f'sqlean extension:   {_median_query_time(connection):8.3f}s')
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Count the explains of the query span approximation with one explain per knob and with group testing on simulated queries:
+a few knobs change the plan, some only if another knob is disabled as well, and one knob is required.
+Run from the repository root: python -m perf.query_span_explains [--knobs FILE] [--queries N] [--effective N]"""
+import argparse
+import logging
+import random
+import threading
+
+from autosteer.query_span import FAILED, approximate_query_span, get_query_plan
+from connectors.connector import DBConnector
+from utils.custom_logging import logger
+
+
+class SimulatedSpanConnector(DBConnector):
+    """The plan lists the disabled knobs that change it, the workload of the simulated query is set before each approximation"""
+    knobs = []
+    effective = set()
+    dependencies = {}  # dependent knob -> knob it depends on
+    required = set()
+    lock = threading.Lock()
+    num_explains = 0
+
+    def __init__(self):
+        super().__init__()
+        self.disabled = set()
+
+    def close(self) -> None:
+        pass
+
+    def set_disabled_knobs(self, knobs: list) -> None:
+        self.disabled = set(knobs)
+
+    def explain(self, query: str) -> str:
+        with SimulatedSpanConnector.lock:
+            SimulatedSpanConnector.num_explains += 1
+        if len(self.disabled & self.required) > 0:
+            return FAILED
+        visible = [knob for knob in self.disabled if knob in self.effective or self.dependencies.get(knob) in self.disabled]
+        return f'{{"plan": "{",".join(sorted(visible))}"}}'
+
+    def execute(self, query: str) -> DBConnector.TimedResult:
+        raise NotImplementedError
+
+    @staticmethod
+    def get_knobs() -> list:
+        return SimulatedSpanConnector.knobs
+
+
+def _simulate_query(knobs: list, num_effective: int, rng: random.Random) -> None:
+    sample = rng.sample(knobs, 2 * num_effective + 1)
+    SimulatedSpanConnector.knobs = knobs
+    SimulatedSpanConnector.effective = set(sample[:num_effective])
+    SimulatedSpanConnector.dependencies = {dependent: rng.choice(sample[:num_effective]) for dependent in sample[num_effective:-1]}
+    SimulatedSpanConnector.required = {sample[-1]}
+
+
+def _explains(**kwargs) -> tuple:
+    SimulatedSpanConnector.num_explains = 0
+    query_span = approximate_query_span(SimulatedSpanConnector, 'SELECT 1;', get_query_plan, **kwargs)
+    return SimulatedSpanConnector.num_explains, [(sorted(hs.knobs), hs.required) for hs in query_span]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Count the explains of the query span approximation')
+    parser.add_argument('--knobs', help='file with one knob per line', default='knobs/presto.txt')
+    parser.add_argument('--queries', help='number of simulated queries', type=int, default=5)
+    parser.add_argument('--effective', help='number of effective knobs per query, as many knobs depend on them', type=int, default=5)
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    with open(args.knobs, encoding='utf-8') as f:
+        knobs = [line.strip() for line in f if line.strip()]
+    rng = random.Random(42)
+    modes = {'singleton': {}, 'iterative': {'find_alternative_knobs': True}, 'batch-wise': {'find_alternative_knobs': True, 'batch_wise': True}}
+    print(f'{len(knobs)} knobs, {args.effective} effective and {args.effective} dependent knobs per query, explains per query:')
+    print(f'{"mode":12s}{"per knob":>10s}' + ''.join(f'{f"group {size}":>10s}' for size in [4, 8, 16, 32]))
+    totals = {mode: [0] * 5 for mode in modes}
+    for _ in range(args.queries):
+        _simulate_query(knobs, args.effective, rng)
+        for mode, kwargs in modes.items():
+            num_explains, expected = _explains(**kwargs)
+            totals[mode][0] += num_explains
+            for i, size in enumerate([4, 8, 16, 32]):
+                num_explains, query_span = _explains(group_size=size, **kwargs)
+                assert query_span == expected
+                totals[mode][i + 1] += num_explains
+    for mode, total in totals.items():
+        print(f'{mode:12s}' + ''.join(f'{num_explains / args.queries:10.1f}' for num_explains in total))
+
+
+if __name__ == '__main__':
+    main()
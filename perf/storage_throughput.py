@@ -0,0 +1,58 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Micro-benchmark for the storage bookkeeping of the measurement loop.
+Run from the repository root: python -m perf.storage_throughput [--repetitions N]"""
+import argparse
+import logging
+import tempfile
+import time
+
+import storage
+from utils.custom_logging import logger
+
+
+def _repetition_calls(i) -> list:
+    """Mimic dp_exploration.register_query_config_and_measurement for one repetition of a hint-set, each hint-set is repeated twice"""
+    disabled_rules = f'knob_{i // 2}'
+    return [lambda: storage.register_query_fingerprint('bench/1.sql', 42),
+            lambda: storage.register_query_config('bench/1.sql', disabled_rules, '{}', i),
+            lambda: storage.register_measurement('bench/1.sql', disabled_rules, walltime=1_000, input_data_size=0, nodes=1)]
+
+
+def _calls_per_second(repetitions, offset, reuse_session) -> float:
+    num_calls = 0
+    begin = time.perf_counter()
+    for i in range(offset, offset + repetitions):
+        for call in _repetition_calls(i):
+            if not reuse_session:
+                storage.close()  # previous behaviour: a new engine and schema creation per storage call
+            call()
+            num_calls += 1
+    storage.flush()
+    return num_calls / (time.perf_counter() - begin)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure storage calls per second')
+    parser.add_argument('--repetitions', help='number of simulated repetitions', type=int, default=200)
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage.RESULTS_DIRECTORY = directory
+        storage.TESTED_DATABASE = 'storage_throughput'
+        storage.BENCHMARK_ID = storage.register_benchmark('bench')
+        storage.register_query('bench/1.sql')
+
+        before = _calls_per_second(args.repetitions, 0, reuse_session=False)
+        after = _calls_per_second(args.repetitions, args.repetitions, reuse_session=True)
+        storage.close()
+
+    print(f'engine per call:   {before:10.1f} calls/s')
+    print(f'storage session:   {after:10.1f} calls/s')
+    print(f'speedup:           {after / before:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+-- The DuckDB results database starts with version 4 of the SQLite schema (schema.sql and migrations/002-004).
+-- Ids are generated by sequences and foreign keys are not declared; secondary indexes are replaced by columnar scans.
+--------------------------------------------------------------------------------
+CREATE SEQUENCE IF NOT EXISTS benchmarks_id START 1;
+CREATE SEQUENCE IF NOT EXISTS queries_id START 1;
+CREATE SEQUENCE IF NOT EXISTS hint_sets_id START 1;
+CREATE SEQUENCE IF NOT EXISTS query_optimizer_configs_id START 1;
+CREATE SEQUENCE IF NOT EXISTS measurements_id START 1;
+--------------------------------------------------------------------------------
+CREATE TABLE benchmarks
+(
+    id                  INTEGER PRIMARY KEY DEFAULT nextval('benchmarks_id'),
+    name                VARCHAR UNIQUE NOT NULL
+);
+--------------------------------------------------------------------------------
+CREATE TABLE queries
+(
+    id                 INTEGER PRIMARY KEY DEFAULT nextval('queries_id'),
+    benchmark_id       INTEGER NOT NULL,
+    query_path         VARCHAR UNIQUE NOT NULL,
+    result_fingerprint BIGINT DEFAULT 0
+);
+--------------------------------------------------------------------------------
+CREATE TABLE query_required_optimizers
+(
+    query_id  INTEGER NOT NULL,
+    optimizer VARCHAR NOT NULL,
+    PRIMARY KEY (query_id, optimizer)
+);
+--------------------------------------------------------------------------------
+CREATE TABLE query_effective_optimizers
+(
+    query_id  INTEGER NOT NULL,
+    optimizer VARCHAR NOT NULL,
+    PRIMARY KEY (query_id, optimizer)
+);
+--------------------------------------------------------------------------------
+CREATE TABLE query_effective_optimizers_dependencies
+(
+    query_id            INTEGER NOT NULL,
+    optimizer           VARCHAR NOT NULL,
+    dependent_optimizer VARCHAR NOT NULL, -- dependency of 'optimizer'
+    PRIMARY KEY (query_id, optimizer, dependent_optimizer)
+);
+--------------------------------------------------------------------------------
+CREATE TABLE hint_sets
+(
+    id                 INTEGER PRIMARY KEY DEFAULT nextval('hint_sets_id'),
+    disabled_rules     VARCHAR UNIQUE NOT NULL, -- comma-separated and sorted knobs
+    num_disabled_rules INTEGER NOT NULL
+);
+INSERT INTO hint_sets (id, disabled_rules, num_disabled_rules) VALUES (0, 'None', 0);
+--------------------------------------------------------------------------------
+CREATE TABLE query_plans
+(
+    digest      VARCHAR PRIMARY KEY, -- sha256 of the canonical plan
+    compression VARCHAR NOT NULL, -- none, zlib, or lzma
+    plan        BLOB NOT NULL,
+    plan_size   INTEGER NOT NULL -- size of the uncompressed plan in bytes
+);
+--------------------------------------------------------------------------------
+CREATE TABLE query_optimizer_configs
+(
+    id              INTEGER PRIMARY KEY DEFAULT nextval('query_optimizer_configs_id'),
+    query_id        INTEGER NOT NULL,
+    hint_set_id     INTEGER NOT NULL,
+    plan_digest     VARCHAR NOT NULL,
+    hash            BIGINT NOT NULL, -- the hash value of the optimizer query plan
+    duplicated_plan BOOLEAN DEFAULT FALSE NOT NULL,
+    UNIQUE (query_id, hint_set_id)
+);
+--------------------------------------------------------------------------------
+CREATE TABLE measurements
+(
+    id                        BIGINT PRIMARY KEY DEFAULT nextval('measurements_id'),
+    query_optimizer_config_id INTEGER NOT NULL,
+    walltime                  BIGINT NOT NULL,
+    machine                   VARCHAR NOT NULL,
+    time                      VARCHAR NOT NULL,
+    input_data_size           BIGINT NOT NULL,
+    num_compute_nodes         INTEGER NOT NULL
+);
+--------------------------------------------------------------------------------
+-- Summary rows are replaced by deleting and inserting them in one transaction, which DuckDB does not allow for keys
+CREATE TABLE hint_set_summary
+(
+    query_optimizer_config_id INTEGER NOT NULL,
+    query_id                  INTEGER NOT NULL,
+    hint_set_id               INTEGER NOT NULL,
+    num_measurements          INTEGER NOT NULL,
+    median_walltime           DOUBLE NOT NULL,
+    baseline_median           DOUBLE, -- median walltime of the default hint-set of the query
+    savings                   DOUBLE, -- relative savings wrt. the baseline
+    rank                      INTEGER -- dense rank of the alternative hint-sets of a query by savings, 1 is the best
+);
+--------------------------------------------------------------------------------
+-- The runtime statistics of the SQLite aggregates (utils/sqlite_aggregates.py) map to DuckDB's native quantiles
+CREATE MACRO percentile_25(x) AS quantile_cont(x, 0.25);
+CREATE MACRO percentile_75(x) AS quantile_cont(x, 0.75);
+CREATE MACRO percentile_90(x) AS quantile_cont(x, 0.9);
+CREATE MACRO percentile_95(x) AS quantile_cont(x, 0.95);
+CREATE MACRO percentile_99(x) AS quantile_cont(x, 0.99);
+--------------------------------------------------------------------------------
+CREATE TABLE schema_version
+(
+    version INTEGER NOT NULL
+);
@@ -1,165 +1,736 @@
 # Copyright 2022 Intel Corporation
 # SPDX-License-Identifier: MIT
 #
-"""This module implements the connection to the SQLite3 database persisting all benchmarking data generated by AutoSteer"""
+"""This module implements the connection to the SQLite3 (or DuckDB) database persisting all benchmarking data generated by AutoSteer"""
+import atexit
+import functools
+import hashlib
 import json
-import numpy as np
+import lzma
+import math
+import zlib
 import pandas as pd
 import random
 import socket
+import sqlite3
 import sys
 import os
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
 from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.sql import text
-from sqlalchemy.exc import IntegrityError
-import unittest
+from sqlalchemy.exc import OperationalError
 
+from utils.config import read_config
 from utils.custom_logging import logger
+from utils.duckdb_engine import DuckDBEngine
+from utils.sqlite_aggregates import register_aggregates
 from utils.util import read_sql_file
 
 SCHEMA_FILE = 'schema.sql'
+MIGRATIONS_DIRECTORY = 'migrations'
+DUCKDB_SCHEMA_FILE = 'schema_duckdb.sql'
+DUCKDB_SCHEMA_VERSION = 4  # the version of the SQLite schema that schema_duckdb.sql corresponds to
+DEFAULT_HINT_SET_ID = 0
+EXTENSION_PATH = './sqlean-extensions/stats.so'
+RESULTS_DIRECTORY = 'results'
+POOL_SIZE = 5
+FLUSH_ROWS = int(read_config()['storage']['flush_rows'])
+FLUSH_INTERVAL_SECS = float(read_config()['storage']['flush_interval_secs'])
+PLAN_COMPRESSION = read_config()['storage']['plan_compression']  # none, zlib, or lzma
+AGGREGATES = read_config()['storage']['aggregates']  # auto, native, or extension
+BACKEND = read_config()['storage']['backend']  # sqlite or duckdb
+BUSY_TIMEOUT_SECS = float(read_config()['storage']['busy_timeout_secs'])  # how long SQLite waits for the write lock of other processes
+LOCK_RETRIES = int(read_config()['storage']['lock_retries'])
+ROLLUP_AFTER_DAYS = float(read_config()['storage']['rollup_after_days'])  # roll up measurements older than this
+ROLLUP_KEEP_RECENT = int(read_config()['storage']['rollup_keep_recent'])  # roll up all but this many recent measurements per config
 ENGINE = None
 TESTED_DATABASE = None
 BENCHMARK_ID = None
 
 
+class StorageBackend:
+    """The database backend of the results store, its engines and connections provide the subset of SQLAlchemy's API used by this module"""
+
+    @staticmethod
+    def database_url() -> str:
+        raise NotImplementedError()
+
+    @staticmethod
+    def create_engine(url: str):
+        """Create the process-wide engine and migrate the schema"""
+        raise NotImplementedError()
+
+    @staticmethod
+    def read_df(conn, query, params) -> pd.DataFrame:
+        raise NotImplementedError()
+
+    @staticmethod
+    def insert_or_ignore(table: str, columns: str, key: str, rows: str):
+        """Insert the rows (a VALUES clause or a SELECT) unless a row with the same key exists already"""
+        raise NotImplementedError()
+
+    @staticmethod
+    def vacuum(conn) -> None:
+        """Return the space of deleted rows to the file system"""
+        raise NotImplementedError()
+
+    @staticmethod
+    def database_file() -> str:
+        raise NotImplementedError()
+
+
+class SQLiteBackend(StorageBackend):
+    """Results are stored in results/<tested database>.sqlite, several processes can write to the same database file"""
+
+    @staticmethod
+    def database_url() -> str:
+        return f'sqlite:///{RESULTS_DIRECTORY}/{TESTED_DATABASE}.sqlite'
+
+    @staticmethod
+    def create_engine(url: str):
+        """Load the extension once per pooled connection"""
+        logger.debug('Connect to database: %s', url)
+        # File-based SQLite defaults to a NullPool, i.e. every checkout would open the database file again.
+        engine = create_engine(url, poolclass=QueuePool, pool_size=POOL_SIZE, max_overflow=0,
+                               connect_args={'check_same_thread': False, 'timeout': BUSY_TIMEOUT_SECS})
+
+        @event.listens_for(engine, 'connect')
+        def connect(dbapi_conn, _):
+            """Register the median and percentile aggregates, the (faster) sqlean extension overrides them if it is available"""
+            # Readers do not block the writer (and vice versa) in write-ahead logging mode, writers wait for each other
+            dbapi_conn.execute('PRAGMA journal_mode = WAL')
+            dbapi_conn.execute('PRAGMA synchronous = NORMAL')
+            register_aggregates(dbapi_conn)
+            # octet_length() is built in since SQLite 3.43
+            dbapi_conn.create_function('octet_length', 1, lambda value: None if value is None else len(value), deterministic=True)
+            if _use_extension():
+                dbapi_conn.enable_load_extension(True)
+                dbapi_conn.load_extension(EXTENSION_PATH)
+                dbapi_conn.enable_load_extension(False)
+
+        _migrate(engine)
+        return engine
+
+    @staticmethod
+    def read_df(conn, query, params) -> pd.DataFrame:
+        return pd.read_sql(query, conn, params=params)
+
+    @staticmethod
+    @functools.lru_cache
+    def insert_or_ignore(table: str, columns: str, key: str, rows: str):
+        # The WHERE clause resolves the ambiguity between a join constraint and ON CONFLICT
+        return text(f'INSERT INTO {table} ({columns}) SELECT * FROM ({rows}) WHERE true ON CONFLICT ({key}) DO NOTHING')
+
+    @staticmethod
+    def vacuum(conn) -> None:
+        conn.execute('VACUUM')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    @staticmethod
+    def database_file() -> str:
+        return f'{RESULTS_DIRECTORY}/{TESTED_DATABASE}.sqlite'
+
+
+class DuckDBBackend(StorageBackend):
+    """Results are stored in results/<tested database>.duckdb, aggregations run vectorized on DuckDB's columnar storage"""
+
+    @staticmethod
+    def database_url() -> str:
+        return f'duckdb:///{RESULTS_DIRECTORY}/{TESTED_DATABASE}.duckdb'
+
+    @staticmethod
+    def create_engine(url: str):
+        logger.debug('Connect to database: %s', url)
+        engine = DuckDBEngine(url)
+        _migrate_duckdb(engine)
+        return engine
+
+    @staticmethod
+    def read_df(conn, query, params) -> pd.DataFrame:
+        return conn.execute(query, params).df()
+
+    @staticmethod
+    @functools.lru_cache
+    def insert_or_ignore(table: str, columns: str, key: str, rows: str):
+        # DuckDB 0.6 does not support ON CONFLICT, the database file is locked by one process anyway
+        existing = ' AND '.join(f'{table}.{column} = new_rows.{column}' for column in key.split(', '))
+        return text(f'INSERT INTO {table} ({columns}) SELECT * FROM ({rows}) new_rows ({columns}) WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {existing})')
+
+    @staticmethod
+    def vacuum(conn) -> None:
+        conn.execute('CHECKPOINT')
+
+    @staticmethod
+    def database_file() -> str:
+        return f'{RESULTS_DIRECTORY}/{TESTED_DATABASE}.duckdb'
+
+
+BACKENDS = {'sqlite': SQLiteBackend, 'duckdb': DuckDBBackend}
+
+
+def _backend() -> type[StorageBackend]:
+    if BACKEND not in BACKENDS:
+        logger.fatal('Unknown storage backend %s, use one of %s', BACKEND, list(BACKENDS))
+        sys.exit(1)
+    return BACKENDS[BACKEND]
+
+
+def _database_url():
+    return _backend().database_url()
+
+
+def canonical_plan(plan: str) -> str:
+    """Normalize the formatting of a query plan, json plans are re-serialized with sorted keys"""
+    try:
+        return json.dumps(json.loads(plan), sort_keys=True, separators=(',', ':'))
+    except ValueError:
+        return '\n'.join(line.rstrip() for line in plan.strip().splitlines())
+
+
+def plan_digest(plan: str) -> str:
+    """The content address of a query plan in the plan store"""
+    return hashlib.sha256(canonical_plan(plan).encode()).hexdigest()
+
+
+def encode_plan(plan: str) -> tuple[str, bytes]:
+    """Compress a plan with PLAN_COMPRESSION, small plans that do not benefit from compression are stored as they are"""
+    data = plan.encode()
+    if PLAN_COMPRESSION == 'zlib':
+        compressed = zlib.compress(data)
+    elif PLAN_COMPRESSION == 'lzma':
+        compressed = lzma.compress(data)
+    else:
+        return 'none', data
+    return (PLAN_COMPRESSION, compressed) if len(compressed) < len(data) else ('none', data)
+
+
+def decompress_plan(plan: bytes, compression: str) -> str:
+    if compression == 'zlib':
+        return zlib.decompress(plan).decode()
+    elif compression == 'lzma':
+        return lzma.decompress(plan).decode()
+    return plan.decode()
+
+
+def _split_statements(script: str) -> list:
+    """Split a SQL script into its statements"""
+    statements, statement = [], ''
+    for part in script.split(';'):
+        statement += part + ';'
+        if sqlite3.complete_statement(statement):
+            statements.append(statement)
+            statement = ''
+    return statements
+
+
+def _migrate(engine):
+    """Bring the schema to the newest version; SQLite's user_version stores the version, schema.sql is version 1.
+    Every file migrations/<version>_<name>.sql runs atomically in its own transaction. The write lock is acquired before
+    the version is checked again, i.e. processes opening the database concurrently apply each migration once."""
+    connection = engine.raw_connection()
+    connection.create_function('plan_digest', 1, plan_digest, deterministic=True)
+    connection.create_function('plan_compression', 1, lambda plan: encode_plan(plan)[0], deterministic=True)
+    connection.create_function('compress_plan', 1, lambda plan: encode_plan(plan)[1], deterministic=True)
+    try:
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        migrations = [(1, SCHEMA_FILE)] + sorted((int(file.split('_')[0]), f'{MIGRATIONS_DIRECTORY}/{file}')
+                                                 for file in os.listdir(MIGRATIONS_DIRECTORY) if file.endswith('.sql'))
+        migrated = False
+        for migration_version, filename in migrations:
+            if migration_version > version:
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    if connection.execute('PRAGMA user_version').fetchone()[0] < migration_version:
+                        logger.info('Migrate results database to schema version %s (%s)', migration_version, filename)
+                        for statement in _split_statements(read_sql_file(filename)):
+                            connection.execute(statement)
+                        connection.execute(f'PRAGMA user_version = {migration_version}')
+                        migrated = True
+                    connection.commit()
+                except BaseException:
+                    connection.rollback()
+                    raise
+                version = migration_version
+        if migrated:
+            connection.execute('VACUUM')  # return the space freed by the migrations
+            logger.info('%s', plan_store_report(connection))
+    finally:
+        connection.close()
+
+
+def _migrate_duckdb(engine):
+    """DuckDB databases are created with the schema version DUCKDB_SCHEMA_VERSION, the schema_version table stores the version.
+    Later migrations provide a DuckDB variant migrations/duckdb/<version>_<name>.sql"""
+    directory = f'{MIGRATIONS_DIRECTORY}/duckdb'
+    migrations = [(DUCKDB_SCHEMA_VERSION, DUCKDB_SCHEMA_FILE)]
+    if os.path.isdir(directory):
+        migrations += sorted((int(file.split('_')[0]), f'{directory}/{file}') for file in os.listdir(directory) if file.endswith('.sql'))
+    with engine.connect() as conn:
+        stmt = "SELECT count(*) FROM information_schema.tables WHERE table_name = 'schema_version'"
+        version = conn.execute('SELECT max(version) FROM schema_version').fetchone()[0] if conn.execute(stmt).fetchone()[0] > 0 else 0
+        for migration_version, filename in migrations:
+            if migration_version > version:
+                logger.info('Migrate results database to schema version %s (%s)', migration_version, filename)
+                with conn.begin():
+                    conn.cursor.execute(read_sql_file(filename))
+                    conn.execute('DELETE FROM schema_version')
+                    conn.execute('INSERT INTO schema_version (version) VALUES (:version)', version=migration_version)
+                version = migration_version
+
+
+class PlanStoreReport:
+    """Summarizes how much space the content-addressed plan store saves"""
+
+    def __init__(self, num_configs, num_plans, plan_bytes, stored_bytes):
+        self.num_configs = num_configs
+        self.num_plans = num_plans
+        self.plan_bytes = plan_bytes  # the size of all plans if every config stored its plan
+        self.stored_bytes = stored_bytes  # the size of all distinct compressed plans
+
+    def saved_bytes(self) -> int:
+        return self.plan_bytes - self.stored_bytes
+
+    def __str__(self):
+        ratio = self.saved_bytes() / self.plan_bytes if self.plan_bytes > 0 else 0.0
+        return f'Plan store: {self.num_configs} configs reference {self.num_plans} distinct plans, ' \
+               f'{self.stored_bytes} of {self.plan_bytes} bytes stored ({self.saved_bytes()} bytes or {ratio:.1%} saved)'
+
+
+def plan_store_report(conn=None) -> PlanStoreReport:
+    stmt = """SELECT count(*), (SELECT count(*) FROM query_plans), coalesce(sum(qp.plan_size), 0),
+                     (SELECT coalesce(sum(octet_length(plan)), 0) FROM query_plans)
+              FROM query_optimizer_configs qoc, query_plans qp
+              WHERE qp.digest = qoc.plan_digest"""
+    if conn is not None:
+        return PlanStoreReport(*conn.execute(stmt).fetchone())
+    flush()
+    with _db() as connection:
+        return PlanStoreReport(*connection.execute(stmt).fetchone())
+
+
+def _use_extension() -> bool:
+    """The C implementation of the sqlean stats extension is faster than the native Python aggregates"""
+    if AGGREGATES == 'native':
+        return False
+    available = os.path.isfile(EXTENSION_PATH) and hasattr(sqlite3.Connection, 'enable_load_extension')
+    if AGGREGATES == 'extension' and not available:
+        logger.fatal('Please, first download the required sqlite3 extension using sqlean-extensions/download.sh')
+        sys.exit(1)
+    return available
+
+
+def _retry_when_locked(function):
+    """Retry a write with exponential backoff if other processes held SQLite's write lock for longer than the busy timeout"""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        for attempt in range(LOCK_RETRIES):
+            try:
+                return function(*args, **kwargs)
+            except OperationalError as err:
+                if 'locked' not in str(err) or attempt == LOCK_RETRIES - 1:
+                    raise
+                backoff = 0.1 * 2 ** attempt * random.uniform(1.0, 2.0)
+                logger.warning('Results database is locked, retry %s in %.2fs', function.__name__, backoff)
+                time.sleep(backoff)
+        return None
+
+    return wrapper
+
+
 def _db():
+    """Check out a pooled connection of the storage session; the engine is only (re-)created if the tested database changes"""
     global ENGINE
-    url = f'sqlite:///results/{TESTED_DATABASE}.sqlite'
-    logger.debug('Connect to database: %s', url)
-    ENGINE = create_engine(url)
+    url = _database_url()
+    if ENGINE is None or str(ENGINE.url) != url:
+        close()
+        ENGINE = _backend().create_engine(url)
+    return ENGINE.connect()
 
-    @event.listens_for(ENGINE, 'connect')
-    def connect(dbapi_conn, _):
-        """Load SQLite extension for median calculation"""
-        extension_path = './sqlean-extensions/stats.so'
 
-        if not os.path.isfile(extension_path):
-            logger.fatal('Please, first download the required sqlite3 extension using sqlean-extensions/download.sh')
-            sys.exit(1)
+def close():
+    """Flush pending writes and close the storage session and all pooled connections"""
+    global ENGINE
+    if ENGINE is not None:
+        with ENGINE.connect() as conn:
+            WRITE_BUFFER.write(conn)
+        ENGINE.dispose()
+        ENGINE = None
+    QUERY_IDS.clear()
+    HINT_SET_IDS.clear()
+    PLAN_DIGESTS.clear()
+    MEASUREMENT_INDEXES.clear()
 
-        dbapi_conn.enable_load_extension(True)
-        dbapi_conn.load_extension(extension_path)
-        dbapi_conn.enable_load_extension(False)
 
-    conn = ENGINE.connect()
-    schema = read_sql_file(SCHEMA_FILE)
+def flush():
+    """Write all buffered rows to the database, must be called before reading rows from the measurement loop"""
+    if len(WRITE_BUFFER) > 0:
+        with _db() as conn:
+            WRITE_BUFFER.write(conn)
 
-    for statement in schema.split(';'):
-        if len(statement.strip()) > 0:
-            try:
-                conn.execute(statement)
-            except Exception as e:
-                print(e)
-                raise e
-    return conn
 
+# Statements of the measurement loop are prepared once; SQLite caches the compiled statements per pooled connection.
+# Rows that other processes may have inserted already are upserted idempotently, see StorageBackend.insert_or_ignore().
+_INSERT_BENCHMARK = ('benchmarks', 'name', 'name', 'VALUES (:name)')
+_SELECT_BENCHMARK = text('SELECT benchmarks.id FROM benchmarks WHERE name=:name')
+_INSERT_QUERY = ('queries', 'benchmark_id, query_path, result_fingerprint', 'query_path', 'VALUES (:benchmark_id, :query_path, :result_fingerprint)')
+_SELECT_QUERY_ID = text('SELECT id FROM queries WHERE query_path = :query_path')
+_INSERT_HINT_SET = ('hint_sets', 'disabled_rules, num_disabled_rules', 'disabled_rules', 'VALUES (:disabled_rules, :num_disabled_rules)')
+_SELECT_HINT_SET_ID = text('SELECT id FROM hint_sets WHERE disabled_rules = :disabled_rules')
+_SELECT_FINGERPRINT = text('SELECT result_fingerprint FROM queries WHERE id = :query_id')
+_UPDATE_FINGERPRINT = text('UPDATE queries SET result_fingerprint = :fingerprint WHERE id = :query_id;')
+_SELECT_DUPLICATED_PLANS = text("""SELECT count(*)
+        FROM query_optimizer_configs qoc
+        WHERE qoc.query_id = :query_id
+              AND qoc.hash = :plan_hash
+              AND qoc.hint_set_id != :hint_set_id""")
+_INSERT_QUERY_PLAN = ('query_plans', 'digest, compression, plan, plan_size', 'digest', 'VALUES (:digest, :compression, :plan, :plan_size)')
+_INSERT_QUERY_CONFIG = ('query_optimizer_configs', 'query_id, hint_set_id, plan_digest, hash, duplicated_plan', 'query_id, hint_set_id',
+                        'VALUES (:query_id, :hint_set_id, :plan_digest, :plan_hash, :is_duplicate)')
+_INSERT_OPTIMIZER = ('{table}', 'query_id, optimizer', 'query_id, optimizer', 'SELECT id, :optimizer FROM queries WHERE query_path = :query_path')
+_INSERT_OPTIMIZER_DEPENDENCY = ('query_effective_optimizers_dependencies', 'query_id, optimizer, dependent_optimizer',
+                                'query_id, optimizer, dependent_optimizer', 'SELECT id, :optimizer, :dependency FROM queries WHERE query_path = :query_path')
+_INSERT_MEASUREMENT = text("""INSERT INTO measurements (query_optimizer_config_id, walltime, machine, time, input_data_size, num_compute_nodes, censored)
+        SELECT id, :walltime, :host, :time, :input_data_size, :nodes, :censored FROM query_optimizer_configs
+        WHERE query_id = :query_id AND hint_set_id = :hint_set_id""")
+# A checkpoint replaces the previous checkpoint of its query
+_DELETE_CHECKPOINT = text('DELETE FROM exploration_checkpoints WHERE query_id = :query_id')
+_INSERT_CHECKPOINT = text("""INSERT INTO exploration_checkpoints (query_id, dp_level, blacklist, pending, completed, time)
+        VALUES (:query_id, :dp_level, :blacklist, :pending, :completed, :time)""")
+# Per-config statistics of the raw measurements and the roll-ups, the number of measurements, the mean, the minimum, and the maximum are exact.
+# The median weighs the minimum and the maximum of a roll-up of n measurements once and its median n - 2 times, i.e. it is exact for
+# the raw measurements or the roll-up alone. The raw measurements are read from {measurements}, the configs are restricted by {configs}.
+# Censored measurements are left out, their walltime is the deadline of the cancelled execution, i.e. only a lower bound of the runtime.
+_CONFIG_STATISTICS = """config_points (query_optimizer_config_id, walltime, weight) AS
+  (SELECT query_optimizer_config_id, walltime, 1 FROM {measurements} WHERE NOT censored AND {configs}
+   UNION ALL
+   SELECT query_optimizer_config_id, min_walltime, 1 FROM measurement_rollups WHERE {configs}
+   UNION ALL
+   SELECT query_optimizer_config_id, max_walltime, 1 FROM measurement_rollups WHERE num_measurements > 1 AND {configs}
+   UNION ALL
+   SELECT query_optimizer_config_id, median_walltime, num_measurements - 2 FROM measurement_rollups WHERE num_measurements > 2 AND {configs}),
+     config_positions (query_optimizer_config_id, walltime, position, num_measurements) AS
+  (SELECT query_optimizer_config_id, walltime,
+          sum(weight) OVER (PARTITION BY query_optimizer_config_id ORDER BY walltime ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW),
+          sum(weight) OVER (PARTITION BY query_optimizer_config_id)
+   FROM config_points),
+     config_sums (query_optimizer_config_id, walltime) AS
+  (SELECT query_optimizer_config_id, walltime FROM {measurements} WHERE NOT censored AND {configs}
+   UNION ALL
+   SELECT query_optimizer_config_id, num_measurements * mean_walltime FROM measurement_rollups WHERE {configs}),
+     config_statistics (query_optimizer_config_id, num_measurements, median_walltime, mean_walltime, min_walltime, max_walltime) AS
+  (SELECT p.query_optimizer_config_id, p.num_measurements,
+          (min(CASE WHEN 2 * p.position >= p.num_measurements THEN p.walltime END)
+           + min(CASE WHEN 2 * p.position > p.num_measurements THEN p.walltime END)) / 2.0,
+          s.total_walltime * 1.0 / p.num_measurements, min(p.walltime), max(p.walltime)
+   FROM config_positions p,
+        (SELECT query_optimizer_config_id, sum(walltime) AS total_walltime FROM config_sums GROUP BY query_optimizer_config_id) s
+   WHERE s.query_optimizer_config_id = p.query_optimizer_config_id
+   GROUP BY p.query_optimizer_config_id, p.num_measurements, s.total_walltime)"""
+# After measurements were written, the statistics of their configs are recomputed and the savings and ranks of all hint-sets of their
+# queries are updated from the summary rows of the other configs. The rows are computed into a temporary table and replace the previous rows
+# of the queries, as DuckDB cannot update rows inserted in the same transaction.
+_CREATE_SUMMARY_CONFIGS = text('CREATE TEMP TABLE summary_configs (query_optimizer_config_id INTEGER NOT NULL)')
+_INSERT_SUMMARY_CONFIGS = text("""INSERT INTO summary_configs (query_optimizer_config_id)
+        SELECT id FROM query_optimizer_configs WHERE query_id = :query_id AND hint_set_id = :hint_set_id""")
+_REFRESH_SUMMARY = [text('CREATE TEMP TABLE summary_rows AS WITH ' + _CONFIG_STATISTICS.format(
+    measurements='measurements', configs='query_optimizer_config_id IN (SELECT query_optimizer_config_id FROM summary_configs)') + """,
+     summary_queries (query_id) AS
+  (SELECT DISTINCT qoc.query_id FROM query_optimizer_configs qoc, summary_configs c WHERE qoc.id = c.query_optimizer_config_id),
+     configs (id, query_id, hint_set_id, num_measurements, median_walltime) AS
+  (SELECT qoc.id, qoc.query_id, qoc.hint_set_id, s.num_measurements, s.median_walltime
+   FROM query_optimizer_configs qoc, config_statistics s
+   WHERE s.query_optimizer_config_id = qoc.id
+   UNION ALL
+   SELECT query_optimizer_config_id, query_id, hint_set_id, num_measurements, median_walltime FROM hint_set_summary
+   WHERE query_id IN (SELECT query_id FROM summary_queries)
+     AND query_optimizer_config_id NOT IN (SELECT query_optimizer_config_id FROM summary_configs))
+SELECT id AS query_optimizer_config_id, query_id, hint_set_id, num_measurements, median_walltime, baseline_median,
+       (baseline_median - median_walltime) / baseline_median AS savings,
+       CASE WHEN hint_set_id != 0 AND baseline_median IS NOT NULL THEN alternative_rank END AS rank
+FROM (SELECT c.*,
+             max(CASE WHEN c.hint_set_id = 0 THEN c.median_walltime END) OVER (PARTITION BY c.query_id) AS baseline_median,
+             dense_rank() OVER (PARTITION BY c.query_id, c.hint_set_id = 0 ORDER BY c.median_walltime) AS alternative_rank
+      FROM configs c) r"""),
+                    text('DELETE FROM hint_set_summary WHERE query_id IN (SELECT query_id FROM summary_rows)'),
+                    text("""INSERT INTO hint_set_summary
+            (query_optimizer_config_id, query_id, hint_set_id, num_measurements, median_walltime, baseline_median, savings, rank)
+        SELECT query_optimizer_config_id, query_id, hint_set_id, num_measurements, median_walltime, baseline_median, savings, rank FROM summary_rows"""),
+                    text('DROP TABLE summary_rows'),
+                    text('DROP TABLE summary_configs')]
+
+# In-process caches of row ids, the hot insert paths do not resolve query paths and hint-sets in SQL
+QUERY_IDS = {}  # query path -> queries.id
+HINT_SET_IDS = {}  # disabled rules -> hint_sets.id
+PLAN_DIGESTS = set()  # digests of the plans stored by this process
+MEASUREMENT_INDEXES = {}  # query path -> MeasurementIndex
+
+
+class WriteBuffer:
+    """Write-behind buffer for the measurement loop: fingerprints, plans, optimizer configs, measurements, and exploration checkpoints
+    are collected in memory and written in a single transaction once FLUSH_ROWS rows are pending or FLUSH_INTERVAL_SECS passed
+    since the last flush. A checkpoint is written together with the measurements it refers to."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fingerprints = {}  # query id -> result fingerprint
+        self.query_plans = {}  # digest -> statement parameters
+        self.query_configs = {}  # (query id, hint-set id) -> statement parameters
+        self.measurements = []
+        self.checkpoints = {}  # query id -> statement parameters of the latest checkpoint
+        self.last_flush = time.monotonic()
+
+    def __len__(self):
+        return len(self.fingerprints) + len(self.query_plans) + len(self.query_configs) + len(self.measurements) + len(self.checkpoints)
+
+    def get_fingerprint(self, query_id):
+        return self.fingerprints.get(query_id)
+
+    def has_duplicated_plan(self, query_id, plan_hash, hint_set_id) -> bool:
+        """Check the pending optimizer configs for another hint-set resulting in the same plan"""
+        return any(params['plan_hash'] == plan_hash and params['hint_set_id'] != hint_set_id
+                   for (config_query_id, _), params in self.query_configs.items() if config_query_id == query_id)
+
+    def add_fingerprint(self, query_id, fingerprint):
+        with self.lock:
+            self.fingerprints[query_id] = fingerprint
 
+    def add_query_plan(self, params):
+        with self.lock:
+            self.query_plans.setdefault(params['digest'], params)
+
+    def add_query_config(self, params):
+        with self.lock:
+            self.query_configs.setdefault((params['query_id'], params['hint_set_id']), params)
+
+    def add_measurement(self, params):
+        with self.lock:
+            self.measurements.append(params)
+
+    def add_checkpoint(self, params):
+        with self.lock:
+            self.checkpoints[params['query_id']] = params
+
+    def is_due(self) -> bool:
+        return len(self) >= FLUSH_ROWS or time.monotonic() - self.last_flush >= FLUSH_INTERVAL_SECS
+
+    def write(self, conn):
+        """Write all pending rows using one transaction; rows precede the rows referencing them.
+        The rows are taken from the buffer such that concurrent flushes do not write them twice, and put back if the transaction fails."""
+        with self.lock:
+            pending = self.fingerprints, self.query_plans, self.query_configs, self.measurements, self.checkpoints
+            self.fingerprints, self.query_plans, self.query_configs, self.measurements, self.checkpoints = {}, {}, {}, [], {}
+            self.last_flush = time.monotonic()
+        fingerprints, query_plans, query_configs, measurements, checkpoints = pending
+        if sum(len(rows) for rows in pending) == 0:
+            return
+        try:
+            _write_rows(conn, [(_UPDATE_FINGERPRINT, [{'query_id': query_id, 'fingerprint': fingerprint} for query_id, fingerprint in fingerprints.items()]),
+                               (_backend().insert_or_ignore(*_INSERT_QUERY_PLAN), list(query_plans.values())),
+                               (_backend().insert_or_ignore(*_INSERT_QUERY_CONFIG), list(query_configs.values())), (_INSERT_MEASUREMENT, measurements),
+                               (_DELETE_CHECKPOINT, list(checkpoints.values())), (_INSERT_CHECKPOINT, list(checkpoints.values()))],
+                        [{'query_id': query_id, 'hint_set_id': hint_set_id}
+                         for query_id, hint_set_id in {(m['query_id'], m['hint_set_id']) for m in measurements}])
+        except BaseException:
+            self._restore(*pending)
+            raise
+        logger.debug('Flushed %s configs and %s measurements', len(query_configs), len(measurements))
+
+    def _restore(self, fingerprints, query_plans, query_configs, measurements, checkpoints):
+        """Put the rows of a failed transaction back in front of the rows buffered meanwhile, newer fingerprints and checkpoints win"""
+        with self.lock:
+            self.fingerprints = {**fingerprints, **self.fingerprints}
+            self.query_plans = {**query_plans, **self.query_plans}
+            self.query_configs = {**query_configs, **self.query_configs}
+            self.measurements = measurements + self.measurements
+            self.checkpoints = {**checkpoints, **self.checkpoints}
+
+
+@_retry_when_locked
+def _write_rows(conn, statements, summary_configs):
+    """Execute the statements for their rows in one transaction, a transaction that failed is retried as a whole"""
+    with conn.begin():
+        for stmt, rows in statements:
+            if len(rows) > 0:
+                conn.execute(stmt, rows)
+        if len(summary_configs) > 0:
+            _refresh_summary(conn, _INSERT_SUMMARY_CONFIGS, summary_configs)
+
+
+def _refresh_summary(conn, insert_configs, rows=None):
+    """Incrementally maintain the hint-set summary: only the configs inserted by insert_configs are aggregated from their measurements"""
+    conn.execute(_CREATE_SUMMARY_CONFIGS)
+    if rows is None:
+        conn.execute(insert_configs)
+    else:
+        conn.execute(insert_configs, rows)
+    for stmt in _REFRESH_SUMMARY:
+        conn.execute(stmt)
+
+
+WRITE_BUFFER = WriteBuffer()
+atexit.register(close)
+
+
+def _flush_if_due():
+    if WRITE_BUFFER.is_due():
+        flush()
+
+
+@_retry_when_locked
 def register_benchmark(name: str) -> int:
     # Register a new benchmark and return its id
     with _db() as conn:
-        try:
-            stmt = text('INSERT INTO benchmarks (name) VALUES (:name)')
-            conn.execute(stmt, name=name)
-        except IntegrityError:
-            pass
-        return conn.execute('SELECT benchmarks.id FROM benchmarks WHERE name=:name', name=name).fetchone()[0]
+        conn.execute(_backend().insert_or_ignore(*_INSERT_BENCHMARK), name=name)
+        return conn.execute(_SELECT_BENCHMARK, name=name).fetchone()[0]
 
 
-def register_query(query_path):
-    # Register a new query
+@_retry_when_locked
+def register_query(query_path) -> int:
+    # Register a new query and return its id
     with _db() as conn:
-        try:
-            stmt = text('INSERT INTO queries (benchmark_id, query_path, result_fingerprint) VALUES (:benchmark_id, :query_path, :result_fingerprint )')
-            conn.execute(stmt, benchmark_id=BENCHMARK_ID, query_path=query_path, result_fingerprint=None)
-        except IntegrityError:
-            pass
+        conn.execute(_backend().insert_or_ignore(*_INSERT_QUERY), benchmark_id=BENCHMARK_ID, query_path=query_path, result_fingerprint=None)
+        QUERY_IDS[query_path] = conn.execute(_SELECT_QUERY_ID, query_path=query_path).fetchone()[0]
+    return QUERY_IDS[query_path]
 
 
-def register_query_fingerprint(query_path, fingerprint):
-    with _db() as conn:
-        result = conn.execute(text('SELECT result_fingerprint FROM queries WHERE query_path= :query_path'), query_path=query_path).fetchone()[0]
+def _query_id(query_path) -> int:
+    """Return the id of a query, register it if necessary"""
+    if query_path not in QUERY_IDS:
+        with _db() as conn:
+            result = conn.execute(_SELECT_QUERY_ID, query_path=query_path).fetchone()
         if result is None:
-            conn.execute(text('UPDATE queries SET result_fingerprint = :fingerprint WHERE query_path = :query_path;'),
-                         fingerprint=fingerprint, query_path=query_path)
-            return True
-        elif result != fingerprint:
-            return False  # fingerprints do not match
+            return register_query(query_path)
+        QUERY_IDS[query_path] = result[0]
+    return QUERY_IDS[query_path]
+
+
+def _hint_set_id(disabled_rules) -> int:
+    """Return the id of a hint-set (comma-separated knobs or None for the default plan), register it if necessary"""
+    if disabled_rules is None:
+        return DEFAULT_HINT_SET_ID
+    if disabled_rules not in HINT_SET_IDS:
+        with _db() as conn:
+            # Hint-sets are shared by all queries and training runs, i.e. most of them are already known
+            result = conn.execute(_SELECT_HINT_SET_ID, disabled_rules=disabled_rules).fetchone()
+            if result is None:
+                _insert_hint_set(conn, disabled_rules)
+                result = conn.execute(_SELECT_HINT_SET_ID, disabled_rules=disabled_rules).fetchone()
+            HINT_SET_IDS[disabled_rules] = result[0]
+    return HINT_SET_IDS[disabled_rules]
+
+
+@_retry_when_locked
+def _insert_hint_set(conn, disabled_rules):
+    conn.execute(_backend().insert_or_ignore(*_INSERT_HINT_SET), disabled_rules=disabled_rules, num_disabled_rules=disabled_rules.count(',') + 1)
+
+
+def register_query_fingerprint(query_path, fingerprint):
+    query_id = _query_id(query_path)
+    result = WRITE_BUFFER.get_fingerprint(query_id)
+    if result is None:
+        with _db() as conn:
+            result = conn.execute(_SELECT_FINGERPRINT, query_id=query_id).fetchone()[0]
+    if result is None:
+        WRITE_BUFFER.add_fingerprint(query_id, fingerprint)
+        _flush_if_due()
         return True
+    elif result != fingerprint:
+        return False  # fingerprints do not match
+    return True
 
 
+@_retry_when_locked
 def register_optimizer(query_path, optimizer, required: bool):
+    table = 'query_effective_optimizers' if not required else 'query_required_optimizers'
+    table_name, columns, key, rows = _INSERT_OPTIMIZER
     with _db() as conn:
-        try:
-            table = 'query_effective_optimizers' if not required else 'query_required_optimizers'
-            stmt = text(f'INSERT INTO {table} (query_id, optimizer) '
-                        'SELECT id, :optimizer FROM queries WHERE query_path = :query_path')
-            conn.execute(stmt, table=table, optimizer=optimizer, query_path=query_path)
-        except IntegrityError:
-            pass  # do not store duplicates
+        conn.execute(_backend().insert_or_ignore(table_name.format(table=table), columns, key, rows), optimizer=optimizer, query_path=query_path)
 
 
+@_retry_when_locked
 def register_optimizer_dependency(query_path, optimizer, dependency):
     with _db() as conn:
-        try:
-            stmt = text('INSERT INTO query_effective_optimizers_dependencies (query_id, optimizer, dependent_optimizer) '
-                        'SELECT id, :optimizer, :dependency FROM queries WHERE query_path = :query_path')
-            conn.execute(stmt, optimizer=optimizer, dependency=dependency, query_path=query_path)
-        except IntegrityError:
-            pass  # do not store duplicates
+        conn.execute(_backend().insert_or_ignore(*_INSERT_OPTIMIZER_DEPENDENCY), optimizer=optimizer, dependency=dependency, query_path=query_path)
 
 
 class Measurement:
-    """This class stores the measurement for a certain query and optimizer configuration"""
+    """This class stores the measurement for a certain query and optimizer configuration.
+    The plan is kept as serialized (and possibly compressed) json string and only decoded when it is accessed."""
+
+    __slots__ = ('query_path', 'query_id', 'optimizer_config', 'disabled_rules', 'num_disabled_rules', 'plan', 'walltime', 'compression')
 
-    def __init__(self, query_path, query_id, optimizer_config, disabled_rules, num_disabled_rules, plan_json, walltime):
+    def __init__(self, query_path, query_id, optimizer_config, disabled_rules, num_disabled_rules, plan_json, walltime, compression=None):
         self.query_path = query_path
         self.query_id = query_id
         self.optimizer_config = optimizer_config
         self.disabled_rules = disabled_rules
         self.num_disabled_rules = num_disabled_rules
-        self.plan_json = json.loads(plan_json)
+        self.plan = plan_json
         self.walltime = walltime
+        self.compression = compression
 
+    @property
+    def plan_json(self):
+        return json.loads(self.plan if self.compression is None else decompress_plan(self.plan, self.compression))
 
-def experience(benchmark=None, training_ratio=0.8):
-    """Get experience to train a neural network"""
-    stmt = """SELECT qu.query_path, q.query_id, q.id,  q.disabled_rules, q.num_disabled_rules, q.query_plan, median(walltime)
-            FROM measurements m, query_optimizer_configs q, queries qu
-            WHERE m.query_optimizer_config_id = q.id
-              AND q.query_plan != 'None' 
-              AND qu.id = q.query_id
-              AND qu.query_path like :benchmark
-            group by qu.query_path, q.query_id, q.id, q.disabled_rules, q.num_disabled_rules, q.query_plan"""
 
-    with _db() as conn:
-        benchmark = '%%' if benchmark is None else '%%' + benchmark + '%%'
-        df = pd.read_sql(stmt, conn, params={'benchmark': benchmark})
-    rows = [Measurement(*row) for index, row in df.iterrows()]
-
-    # Group training and test data by query
-    result = {}
-    for row in rows:
-        if row.query_id in result:
-            result[row.query_id].append(row)
-        else:
-            result[row.query_id] = [row]
+def _benchmark_pattern(benchmark):
+    return '%%' if benchmark is None else '%%' + benchmark + '%%'
 
-    keys = list(result.keys())
+
+def split_experience(benchmark=None, training_ratio=0.8):
+    """Randomly split the queries of a benchmark into the ids of training and test queries"""
+    stmt = """SELECT DISTINCT q.query_id
+            FROM query_optimizer_configs q, queries qu
+            WHERE qu.id = q.query_id
+              AND qu.query_path like :benchmark"""
+    keys = select_query(text(stmt), {'benchmark': _benchmark_pattern(benchmark)})
     random.shuffle(keys)
     split_index = int(len(keys) * training_ratio)
-    train_keys = keys[:split_index]
-    test_keys = keys[split_index:]
+    return set(keys[:split_index]), set(keys[split_index:])
+
+
+def stream_experience(benchmark=None, chunk_size=1000):
+    """Generator yielding the median runtime of all executed optimizer configs, rows are fetched from SQLite in chunks"""
+    stmt = text('WITH ' + _CONFIG_STATISTICS.format(measurements='measurements', configs='TRUE') + """
+            SELECT qu.query_path, q.query_id, q.id, hs.disabled_rules, hs.num_disabled_rules, qp.plan, r.median_walltime, qp.compression
+            FROM config_statistics r, query_optimizer_configs q, queries qu, hint_sets hs, query_plans qp
+            WHERE r.query_optimizer_config_id = q.id
+              AND qp.digest = q.plan_digest
+              AND q.plan_digest != :missing_plan
+              AND qu.id = q.query_id
+              AND hs.id = q.hint_set_id
+              AND qu.query_path like :benchmark""")
+
+    flush()
+    with _db() as conn:
+        cursor = conn.execute(stmt, benchmark=_benchmark_pattern(benchmark), missing_plan=plan_digest('None'))
+        rows = cursor.fetchmany(chunk_size)
+        while len(rows) > 0:
+            for row in rows:
+                yield Measurement(*row)
+            rows = cursor.fetchmany(chunk_size)
 
-    train_data = np.concatenate([result[key] for key in train_keys])
-    test_data = np.concatenate([result[key] for key in test_keys])
 
+def experience(benchmark=None, training_ratio=0.8):
+    """Get experience to train a neural network, training and test data are grouped by query"""
+    train_keys, _ = split_experience(benchmark, training_ratio)
+    train_data, test_data = [], []
+    for measurement in stream_experience(benchmark):
+        if measurement.query_id in train_keys:
+            train_data.append(measurement)
+        else:
+            test_data.append(measurement)
     return train_data, test_data
 
 
 def _get_optimizers(table_name, query_path, projections):
     """No SQL injections as this is a private function only called from within *this* module"""
+    flush()
     with _db() as conn:
         stmt = f"""
                SELECT {','.join(projections)}
@@ -183,14 +754,16 @@ def get_effective_optimizers_depedencies(query_path):
 
 
 def get_df(query, params):
+    flush()
     with _db() as conn:
-        df = pd.read_sql(query, conn, params=params)
+        df = _backend().read_df(conn, query, params)
         return df
 
 
 def select_query(query, params):
+    flush()
     with _db() as conn:
-        cursor = conn.execute(query, *params)
+        cursor = conn.execute(query, params)
         return [row[0] for row in cursor.fetchall()]
 
 
@@ -199,108 +772,374 @@ def register_query_config(query_path, disabled_rules, query_plan: dict, plan_has
     Store the passed query optimizer configuration in the database.
     :returns: query plan is already known and a duplicate
     """
-    check_for_duplicated_plans = """SELECT count(*)
-        FROM queries q, query_optimizer_configs qoc
-        WHERE q.id = qoc.query_id
-              AND q.query_path = :query_path
-              AND qoc.hash = :plan_hash
-              AND qoc.disabled_rules != :disabled_rules"""
-    result = select_query(check_for_duplicated_plans, {query_path: query_path, plan_hash: plan_hash, disabled_rules: disabled_rules})
-    is_duplicate = result[0] > 0
-
+    query_id = _query_id(query_path)
+    hint_set_id = _hint_set_id(disabled_rules)
+    # Read through the write buffer: the duplicated plan may not have been flushed yet
     with _db() as conn:
-        try:
-            num_disabled_rules = 0 if disabled_rules is None else disabled_rules.count(',') + 1
-            stmt = f"""INSERT INTO query_optimizer_configs
-                   (query_id, disabled_rules, query_plan, num_disabled_rules, hash, duplicated_plan) 
-                   SELECT id, :disabled_rules, :query_plan_processed , :num_disabled_rules, :plan_hash, :is_duplicate FROM queries WHERE query_path = '{query_path}'
-                   """
-            conn.execute(stmt, disabled_rules=str(disabled_rules), query_plan_processed=query_plan, num_disabled_rules=num_disabled_rules,
-                         plan_hash=plan_hash, is_duplicate=is_duplicate)
-        except IntegrityError:
-            pass  # OK! Query configuration has already been inserted
+        result = conn.execute(_SELECT_DUPLICATED_PLANS, query_id=query_id, plan_hash=plan_hash, hint_set_id=hint_set_id).fetchone()
+    is_duplicate = result[0] > 0 or WRITE_BUFFER.has_duplicated_plan(query_id, plan_hash, hint_set_id)
 
+    # Plans are stored once per digest; an already inserted plan or query configuration is ignored when the buffer is written
+    query_plan = str(query_plan)
+    digest = plan_digest(query_plan)
+    if digest not in PLAN_DIGESTS:
+        compression, data = encode_plan(query_plan)
+        WRITE_BUFFER.add_query_plan({'digest': digest, 'compression': compression, 'plan': data, 'plan_size': len(query_plan.encode())})
+        PLAN_DIGESTS.add(digest)
+    WRITE_BUFFER.add_query_config({'query_id': query_id, 'hint_set_id': hint_set_id, 'plan_digest': digest,
+                                   'plan_hash': plan_hash, 'is_duplicate': is_duplicate})
+    _flush_if_due()
     return is_duplicate
 
 
-def check_for_existing_measurements(query_path, disabled_rules):
-    query = """SELECT count(*) as num_measurements
-                FROM measurements m, query_optimizer_configs qoc, queries q
-                WHERE m.query_optimizer_config_id = qoc.id
-                AND qoc.query_id = q.id
-                AND q.query_path = :query_path
-                AND qoc.disabled_rules = :disabled_rules
-             """
-    df = get_df(query, {'query_path': query_path, 'disabled_rules': disabled_rules})
-    values = df['num_measurements']
-    return values[0] > 0
+def count_measurements(query_path, disabled_rules) -> int:
+    """The number of measurements of a hint-set of a query"""
+    return measurement_index(query_path).count(disabled_rules)
 
 
-def register_measurement(query_path, disabled_rules, walltime, input_data_size, nodes):
-    logger.info('Serialize a new measurement for query %s and the disabled knobs [%s]', query_path, disabled_rules)
+def check_for_existing_measurements(query_path, disabled_rules, num_repetitions=1):
+    return count_measurements(query_path, disabled_rules) >= num_repetitions
+
+
+class ExplorationCheckpoint:
+    """The state of the dynamic-programming exploration of a query: the DP level, the blacklisted hint-sets, and the pending hint-sets"""
+
+    def __init__(self, dp_level: int, blacklist: list, pending: list, completed=False):
+        self.dp_level = dp_level
+        self.blacklist = blacklist  # lists of knobs
+        self.pending = pending  # lists of knobs of the current DP level
+        self.completed = completed
+
+
+_SELECT_CHECKPOINT = text('SELECT dp_level, blacklist, pending, completed FROM exploration_checkpoints WHERE query_id = :query_id')
+
+
+def save_exploration_checkpoint(query_path, checkpoint: ExplorationCheckpoint):
+    """Buffer the exploration state of a query; it is written in the transaction of the buffered measurements,
+    i.e. a checkpoint never refers to lost measurements"""
+    WRITE_BUFFER.add_checkpoint({'query_id': _query_id(query_path), 'dp_level': checkpoint.dp_level, 'blacklist': json.dumps(checkpoint.blacklist),
+                                 'pending': json.dumps(checkpoint.pending), 'completed': checkpoint.completed,
+                                 'time': datetime.now().isoformat(sep=' ', timespec='seconds')})
+    _flush_if_due()
+
+
+def load_exploration_checkpoint(query_path):
+    """Return the last exploration checkpoint of a query or None"""
+    flush()
     with _db() as conn:
-        now = datetime.now()
-        query = """
-                INSERT INTO measurements (query_optimizer_config_id, walltime, machine, time, input_data_size, num_compute_nodes)
-                SELECT id, :walltime, :host, :time, :input_data_size, :nodes FROM query_optimizer_configs 
-                WHERE query_id = (SELECT id FROM queries WHERE query_path = :query_path) AND disabled_rules = :disabled_rules 
-                """
-        conn.execute(query, walltime=walltime, host=socket.gethostname(), time=now.strftime('%m/%d/%y, %h:%m:%s'), input_data_size=input_data_size, nodes=nodes,
-                     query_path=query_path, disabled_rules=str(disabled_rules))
-
-
-def median_runtimes():
-    class OptimizerConfigResult:
-        def __init__(self, path, num_disabled_rules, disabled_rules, json_plan, runtime):
-            self.path = path
-            self.num_disabled_rules = num_disabled_rules
-            self.disabled_rules = disabled_rules
-            self.json_plan = json_plan
-            self.runtime = runtime
+        result = conn.execute(_SELECT_CHECKPOINT, query_id=_query_id(query_path)).fetchone()
+    if result is None:
+        return None
+    return ExplorationCheckpoint(result[0], json.loads(result[1]), json.loads(result[2]), bool(result[3]))
+
+
+class QuerySpanVersion:
+    """The version of the approximated query span of a query: the hashes of the query and of the knobs, and the knobs that were probed"""
+
+    def __init__(self, query_hash: str, knobs_hash: str, knobs: list):
+        self.query_hash = query_hash
+        self.knobs_hash = knobs_hash
+        self.knobs = knobs
 
+    def __eq__(self, other):
+        return isinstance(other, QuerySpanVersion) and (self.query_hash, self.knobs_hash) == (other.query_hash, other.knobs_hash)
+
+
+_DELETE_QUERY_SPAN_VERSION = text('DELETE FROM query_spans WHERE query_id = :query_id')
+_INSERT_QUERY_SPAN_VERSION = text("""INSERT INTO query_spans (query_id, query_hash, knobs_hash, knobs, time)
+        VALUES (:query_id, :query_hash, :knobs_hash, :knobs, :time)""")
+_SELECT_QUERY_SPAN_VERSION = text('SELECT query_hash, knobs_hash, knobs FROM query_spans WHERE query_id = :query_id')
+_SELECT_QUERY_OPTIMIZERS = text("""SELECT optimizer FROM query_required_optimizers WHERE query_id = :query_id
+        UNION SELECT optimizer FROM query_effective_optimizers WHERE query_id = :query_id""")
+_SELECT_QUERY_DEPENDENCIES = text('SELECT optimizer, dependent_optimizer FROM query_effective_optimizers_dependencies WHERE query_id = :query_id')
+_DELETE_OPTIMIZERS = [text(f'DELETE FROM {table} WHERE query_id = :query_id AND optimizer = :optimizer')
+                      for table in ['query_required_optimizers', 'query_effective_optimizers', 'query_effective_optimizers_dependencies']]
+
+
+def save_query_span_version(query_path, version: QuerySpanVersion):
+    """Persist the version of the query span once all of its optimizers are registered"""
     with _db() as conn:
-        default_plans_stmt = """SELECT q.query_path, qoc.num_disabled_rules, qoc.disabled_rules, logical_plan_json, elapsed
-        FROM queries q,  query_optimizer_configs qoc, measurements m
-        WHERE q.id = qoc.query_id AND qoc.id = m.query_optimizer_config_id
-        """
-        df = pd.read_sql(default_plans_stmt, conn)
-        default_median_runtimes = df.groupby(['query_path', 'num_disabled_rules', 'disabled_rules', 'logical_plan_json'])['elapsed'].median().reset_index()
+        _write_query_span_version(conn, {'query_id': _query_id(query_path), 'query_hash': version.query_hash, 'knobs_hash': version.knobs_hash,
+                                         'knobs': json.dumps(version.knobs), 'time': datetime.now().isoformat(sep=' ', timespec='seconds')})
+
 
-        return [OptimizerConfigResult(*row) for index, row in default_median_runtimes.iterrows()]
+@_retry_when_locked
+def _write_query_span_version(conn, params):
+    with conn.begin():
+        conn.execute(_DELETE_QUERY_SPAN_VERSION, query_id=params['query_id'])
+        conn.execute(_INSERT_QUERY_SPAN_VERSION, params)
 
 
-def best_alternative_configuration(benchmark=None):
-    class OptimizerConfigResult:
-        def __init__(self, path, num_disabled_rules, runtime, runtime_baseline, savings, disabled_rules, rank):
-            self.path = path
-            self.num_disabled_rules = num_disabled_rules
-            self.runtime = runtime
-            self.runtime_baseline = runtime_baseline
-            self.savings = savings
-            self.disabled_rules = disabled_rules
-            self.rank = rank
+def load_query_span_version(query_path):
+    """Return the version of the query span of a query or None if it was not approximated yet"""
+    with _db() as conn:
+        result = conn.execute(_SELECT_QUERY_SPAN_VERSION, query_id=_query_id(query_path)).fetchone()
+    if result is None:
+        return None
+    return QuerySpanVersion(result[0], result[1], json.loads(result[2]))
 
-    stmt = read_sql_file('best_alternative_queries.sql')
 
+@_retry_when_locked
+def remove_optimizers(query_path, knobs: list):
+    """Remove the knobs and the optimizers depending on them from the query span, all optimizers are removed if knobs is None"""
+    query_id = _query_id(query_path)
     with _db() as conn:
-        cursor = conn.execute(stmt, path=benchmark)
-        return [OptimizerConfigResult(*row) for row in cursor.fetchall()]
+        optimizers = {row[0] for row in conn.execute(_SELECT_QUERY_OPTIMIZERS, query_id=query_id).fetchall()}
+        dependencies = conn.execute(_SELECT_QUERY_DEPENDENCIES, query_id=query_id).fetchall()
+        removed = optimizers if knobs is None else set(knobs) | {optimizer for optimizer, dependency in dependencies if dependency in knobs}
+        with conn.begin():
+            for optimizer in removed:
+                for stmt in _DELETE_OPTIMIZERS:
+                    conn.execute(stmt, query_id=query_id, optimizer=optimizer)
+
+
+def weighted_median(points) -> float:
+    """The median of (value, weight) points, like the median of a list repeating each value weight times"""
+    points = sorted(points)
+    total = sum(weight for _, weight in points)
+    lower, upper, position = None, None, 0
+    for value, weight in points:
+        position += weight
+        if lower is None and 2 * position >= total:
+            lower = value
+        if 2 * position > total:
+            upper = value
+            break
+    return (lower + upper) / 2
+
+
+class MeasurementIndex:
+    """The runtimes of all hint-sets of a query held in memory, the DP exploration aggregates them without querying the database.
+    The index is loaded once from the database and then kept up to date by register_measurement. Runtimes that were rolled up
+    only contribute to the counts and the statistics."""
 
+    def __init__(self):
+        self.runtimes = {}  # disabled rules -> runtimes
+        self.deadlines = {}  # disabled rules -> deadlines of the censored measurements
+        self.rollups = {}  # disabled rules -> (number of measurements, median, mean, min, max) of the rolled-up runtimes
+        self.num_disabled_rules = {}  # disabled rules -> number of disabled rules
 
-class TestStorage(unittest.TestCase):
-    """Test the storage class"""
+    def _register(self, disabled_rules):
+        self.num_disabled_rules.setdefault(disabled_rules, 0 if disabled_rules is None else disabled_rules.count(',') + 1)
+        self.runtimes.setdefault(disabled_rules, [])
+        self.deadlines.setdefault(disabled_rules, [])
 
-    def test_median(self):
-        with _db() as db:
-            result = db.execute('SELECT MEDIAN(a) FROM (SELECT 1 AS a) AS tab').fetchall()
-            assert len(result) == 1
+    def add(self, disabled_rules, walltime, censored=False):
+        self._register(disabled_rules)
+        (self.deadlines if censored else self.runtimes)[disabled_rules].append(walltime)
 
-    def test_queries(self):
-        with _db() as db:
-            result = db.execute('SELECT * FROM queries').fetchall()
-            print(result)
+    def add_rollup(self, disabled_rules, num_measurements, median, mean, minimum, maximum):
+        self._register(disabled_rules)
+        self.rollups[disabled_rules] = (num_measurements, median, mean, minimum, maximum)
+
+    def get_runtimes(self, disabled_rules, censored=False) -> list:
+        """The raw runtimes of a hint-set, or the deadlines of its censored measurements"""
+        return list((self.deadlines if censored else self.runtimes).get(disabled_rules, []))
+
+    def count(self, disabled_rules) -> int:
+        num_rolled_up = self.rollups[disabled_rules][0] if disabled_rules in self.rollups else 0
+        return len(self.runtimes.get(disabled_rules, [])) + len(self.deadlines.get(disabled_rules, [])) + num_rolled_up
+
+    def summary(self, disabled_rules):
+        """The median and mean runtime and the number of censored measurements of a hint-set or None if it has no measurements.
+        Like in the database, roll-ups are combined by their statistics and the deadlines of censored measurements are no runtimes,
+        the median and mean of a hint-set measured only at its deadlines are infinite."""
+        if self.count(disabled_rules) == 0:
+            return None
+        walltimes = self.runtimes[disabled_rules]
+        if len(walltimes) == 0 and disabled_rules not in self.rollups:
+            return math.inf, math.inf, len(self.deadlines[disabled_rules])
+        points = [(walltime, 1) for walltime in walltimes]
+        total, num_measurements = float(sum(walltimes)), len(walltimes)
+        if disabled_rules in self.rollups:
+            num_rolled_up, median, mean, minimum, maximum = self.rollups[disabled_rules]
+            points += [(minimum, 1)] + ([(maximum, 1)] if num_rolled_up > 1 else []) + ([(median, num_rolled_up - 2)] if num_rolled_up > 2 else [])
+            total, num_measurements = total + num_rolled_up * mean, num_measurements + num_rolled_up
+        return float(weighted_median(points)), total / num_measurements, len(self.deadlines[disabled_rules])
+
+    def statistics(self, num_disabled_rules) -> dict:
+        """The median and mean runtime and the number of censored measurements of the hint-sets disabling num_disabled_rules knobs"""
+        return {disabled_rules: self.summary(disabled_rules) for disabled_rules, n in self.num_disabled_rules.items() if n == num_disabled_rules}
+
+
+# DuckDB 0.6 fails to join a measurements table emptied by a compaction on a filter of the configs, the configs are selected by a subquery
+_SELECT_QUERY_MEASUREMENTS = text("""SELECT qoc.hint_set_id, hs.disabled_rules, m.walltime, m.censored
+              FROM measurements m, query_optimizer_configs qoc, hint_sets hs
+              WHERE m.query_optimizer_config_id = qoc.id
+                AND hs.id = qoc.hint_set_id
+                AND m.query_optimizer_config_id IN (SELECT id FROM query_optimizer_configs WHERE query_id = :query_id)""")
+_SELECT_QUERY_ROLLUPS = text("""SELECT qoc.hint_set_id, hs.disabled_rules, r.num_measurements, r.median_walltime, r.mean_walltime,
+                     r.min_walltime, r.max_walltime
+              FROM measurement_rollups r, query_optimizer_configs qoc, hint_sets hs
+              WHERE r.query_optimizer_config_id = qoc.id
+                AND hs.id = qoc.hint_set_id
+                AND qoc.query_id = :query_id""")
+
+
+def measurement_index(query_path) -> MeasurementIndex:
+    """The in-memory index of the measurements of a query, measurements written by other processes are not visible once it is loaded"""
+    if query_path not in MEASUREMENT_INDEXES:
+        query_id = _query_id(query_path)
+        flush()
+        index = MeasurementIndex()
+        with _db() as conn:
+            for hint_set_id, disabled_rules, walltime, censored in conn.execute(_SELECT_QUERY_MEASUREMENTS, query_id=query_id).fetchall():
+                index.add(None if hint_set_id == DEFAULT_HINT_SET_ID else disabled_rules, walltime, bool(censored))
+            for hint_set_id, disabled_rules, *rollup in conn.execute(_SELECT_QUERY_ROLLUPS, query_id=query_id).fetchall():
+                index.add_rollup(None if hint_set_id == DEFAULT_HINT_SET_ID else disabled_rules, *rollup)
+        MEASUREMENT_INDEXES[query_path] = index
+    return MEASUREMENT_INDEXES[query_path]
+
+
+def hint_set_runtimes(query_path, disabled_rules, censored=False) -> list:
+    """All runtimes of a hint-set of a query, or the deadlines of its censored measurements"""
+    return measurement_index(query_path).get_runtimes(disabled_rules, censored)
+
+
+def baseline_runtimes(query_path) -> list:
+    """All raw runtimes of the default plan of a query"""
+    return hint_set_runtimes(query_path, None)
+
+
+def baseline_statistics(query_path):
+    """The median and mean runtime and the number of censored measurements of the default plan of a query or None if it is not measured"""
+    return measurement_index(query_path).summary(None)
+
+
+def hint_set_statistics(query_path, num_disabled_rules) -> pd.DataFrame:
+    """The median and mean runtime and the number of censored measurements of all hint-sets of a query disabling num_disabled_rules knobs,
+    indexed and sorted by the disabled rules"""
+    statistics = sorted(measurement_index(query_path).statistics(num_disabled_rules).items(), key=lambda item: str(item[0]))
+    return pd.DataFrame([values for _, values in statistics], columns=['median', 'mean', 'num_censored'],
+                        index=pd.Index([disabled_rules for disabled_rules, _ in statistics], name='disabled_rules'))
+
+
+def register_measurement(query_path, disabled_rules, walltime, input_data_size, nodes, censored=False):
+    """Register a measurement, the walltime of a censored measurement is the deadline at which the query was cancelled"""
+    logger.info('Serialize a new measurement for query %s and the disabled knobs [%s]', query_path, disabled_rules)
+    now = datetime.now()
+    WRITE_BUFFER.add_measurement({'walltime': walltime, 'host': socket.gethostname(), 'time': now.isoformat(sep=' ', timespec='seconds'),
+                                  'input_data_size': input_data_size, 'nodes': nodes, 'censored': censored,
+                                  'query_id': _query_id(query_path), 'hint_set_id': _hint_set_id(disabled_rules)})
+    if query_path in MEASUREMENT_INDEXES:
+        MEASUREMENT_INDEXES[query_path].add(disabled_rules, walltime, censored)
+    _flush_if_due()
+
+
+# Raw measurements are rolled up once they are older than the cutoff or not among the keep_recent newest ones of their config.
+# Timestamps are ISO 8601, earlier versions stored month-first timestamps which compare as older than any ISO timestamp.
+_COMPACTION = [text("""CREATE TEMP TABLE compacted_measurements AS
+            SELECT id, query_optimizer_config_id, walltime, time, censored
+            FROM (SELECT m.*, row_number() OVER (PARTITION BY query_optimizer_config_id ORDER BY id DESC) AS recency FROM measurements m) r
+            WHERE NOT censored AND (time < :cutoff OR recency > :keep_recent)"""),
+               # A config rolled up before is rolled up again by merging the statistics of its previous roll-up
+               text('CREATE TEMP TABLE rollup_statistics AS WITH ' + _CONFIG_STATISTICS.format(
+                   measurements='compacted_measurements', configs='query_optimizer_config_id IN (SELECT query_optimizer_config_id FROM compacted_measurements)')
+                    + """, config_times (query_optimizer_config_id, last_time) AS
+              (SELECT query_optimizer_config_id, max(time) FROM compacted_measurements GROUP BY query_optimizer_config_id
+               UNION ALL
+               SELECT query_optimizer_config_id, last_time FROM measurement_rollups
+               WHERE query_optimizer_config_id IN (SELECT query_optimizer_config_id FROM compacted_measurements))
+            SELECT s.*, t.last_time
+            FROM config_statistics s, (SELECT query_optimizer_config_id, max(last_time) AS last_time FROM config_times GROUP BY query_optimizer_config_id) t
+            WHERE t.query_optimizer_config_id = s.query_optimizer_config_id"""),
+               text('DELETE FROM measurement_rollups WHERE query_optimizer_config_id IN (SELECT query_optimizer_config_id FROM rollup_statistics)'),
+               text("""INSERT INTO measurement_rollups
+                (query_optimizer_config_id, num_measurements, median_walltime, mean_walltime, min_walltime, max_walltime, last_time)
+            SELECT query_optimizer_config_id, num_measurements, median_walltime, mean_walltime, min_walltime, max_walltime, last_time
+            FROM rollup_statistics"""),
+               text('DELETE FROM measurements WHERE id IN (SELECT id FROM compacted_measurements)')]
+_INSERT_COMPACTED_CONFIGS = text('''INSERT INTO summary_configs (query_optimizer_config_id)
+        SELECT DISTINCT query_optimizer_config_id FROM compacted_measurements''')
+_SELECT_COMPACTION_COUNTS = text('SELECT count(*), count(DISTINCT query_optimizer_config_id) FROM compacted_measurements')
+
+
+class CompactionReport:
+    """Summarizes a compaction of the measurements"""
+
+    def __init__(self, num_measurements, num_configs, file_bytes_before, file_bytes_after):
+        self.num_measurements = num_measurements  # the number of rolled-up raw measurements
+        self.num_configs = num_configs
+        self.file_bytes_before = file_bytes_before
+        self.file_bytes_after = file_bytes_after
+
+    def __str__(self):
+        return f'Compaction: rolled up {self.num_measurements} measurements of {self.num_configs} configs, ' \
+               f'the results database shrank from {self.file_bytes_before} to {self.file_bytes_after} bytes'
+
+
+@_retry_when_locked
+def _compact(conn, cutoff, keep_recent):
+    with conn.begin():
+        for stmt in _COMPACTION[:2]:
+            conn.execute(stmt, cutoff=cutoff, keep_recent=keep_recent)
+        num_measurements, num_configs = conn.execute(_SELECT_COMPACTION_COUNTS).fetchone()
+        for stmt in _COMPACTION[2:]:
+            conn.execute(stmt)
+        if num_configs > 0:
+            _refresh_summary(conn, _INSERT_COMPACTED_CONFIGS)
+        conn.execute('DROP TABLE compacted_measurements')
+        conn.execute('DROP TABLE rollup_statistics')
+    return num_measurements, num_configs
+
+
+def compact_measurements(max_age_days=ROLLUP_AFTER_DAYS, keep_recent=ROLLUP_KEEP_RECENT) -> CompactionReport:
+    """Roll up old raw measurements into per-config statistics (count, median, mean, min, max), prune them, and vacuum the database.
+    Readers combine the statistics of the roll-ups with the recent raw measurements, tail latencies only cover the raw measurements."""
+    flush()
+    file_bytes_before = os.path.getsize(_backend().database_file())
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat(sep=' ', timespec='seconds')
+    with _db() as conn:
+        num_measurements, num_configs = _compact(conn, cutoff, keep_recent)
+        _backend().vacuum(conn)
+    MEASUREMENT_INDEXES.clear()  # the roll-ups replace the raw measurements
+    report = CompactionReport(num_measurements, num_configs, file_bytes_before, os.path.getsize(_backend().database_file()))
+    logger.info('%s', report)
+    return report
+
+
+RUNTIME_STATISTICS = ['median', 'percentile_90', 'percentile_95', 'percentile_99']
+
+
+class OptimizerConfigResult:
+    """The runtime of a hint-set compared to the default plan of a query"""
+
+    def __init__(self, path, num_disabled_rules, runtime, runtime_baseline, savings, disabled_rules, rank):
+        self.path = path
+        self.num_disabled_rules = num_disabled_rules
+        self.runtime = runtime
+        self.runtime_baseline = runtime_baseline
+        self.savings = savings
+        self.disabled_rules = disabled_rules
+        self.rank = rank
+
+
+_SELECT_BEST_HINT_SETS = """SELECT q.query_path, hs.num_disabled_rules, s.median_walltime, s.baseline_median, s.savings, hs.disabled_rules, s.rank
+        FROM hint_set_summary s, queries q, hint_sets hs
+        WHERE q.id = s.query_id AND hs.id = s.hint_set_id AND s.rank = 1"""
+
+
+def best_alternative_configuration(benchmark=None, statistic='median'):
+    """Find the best alternative hint-set per query, hint-sets can also be ranked by their tail latencies.
+    Medians are read from the incrementally maintained hint-set summary, tail latencies aggregate the raw measurements that were not rolled up."""
+    if statistic not in RUNTIME_STATISTICS:
+        raise ValueError(f'Unknown runtime statistic {statistic}, use one of {RUNTIME_STATISTICS}')
+    if statistic == 'median':
+        stmt = text(_SELECT_BEST_HINT_SETS + ''' AND q.query_path like '%' || :path || '%' ORDER BY s.savings DESC''')
+    else:
+        stmt = read_sql_file('best_alternative_queries.sql').format(statistic=statistic)
+
+    flush()
+    with _db() as conn:
+        cursor = conn.execute(stmt, path='' if benchmark is None else benchmark)
+        return [OptimizerConfigResult(*row) for row in cursor.fetchall()]
+
+
+def best_hint_set(query_path):
+    """Look up the best alternative hint-set of a query in the hint-set summary, returns None if there is none yet"""
+    flush()
+    with _db() as conn:
+        row = conn.execute(text(_SELECT_BEST_HINT_SETS + ' AND s.query_id = :query_id ORDER BY s.hint_set_id LIMIT 1'),
+                           query_id=_query_id(query_path)).fetchone()
+    return None if row is None else OptimizerConfigResult(*row)
 
-    def test_optimizers(self):
-        with _db() as db:
-            result = db.execute('SELECT * FROM query_effective_optimizers;')
-            print(result.fetchall())
@@ -0,0 +1,24 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Temporary results databases for the test cases"""
+import shutil
+import tempfile
+import unittest
+import storage
+
+
+class ResultsDatabaseTestCase(unittest.TestCase):
+    """Base TestCase storing the results in a temporary directory, the storage settings are restored afterwards"""
+    tested_database = 'test'
+    backend = 'sqlite'
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.previous_settings = storage.RESULTS_DIRECTORY, storage.TESTED_DATABASE, storage.BENCHMARK_ID, storage.BACKEND
+        storage.RESULTS_DIRECTORY, storage.TESTED_DATABASE, storage.BACKEND = self.directory, self.tested_database, self.backend
+
+    def tearDown(self) -> None:
+        storage.close()
+        storage.RESULTS_DIRECTORY, storage.TESTED_DATABASE, storage.BENCHMARK_ID, storage.BACKEND = self.previous_settings
+        shutil.rmtree(self.directory)
@@ -0,0 +1,115 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Test the bounded pool of connectors used to explain queries"""
+import threading
+import unittest
+from connectors.connector import DBConnector
+from connectors.connector_pool import ConnectorPool
+from autosteer.query_span import N_THREADS, approximate_query_span, get_query_plan
+
+
+class CountingConnector(DBConnector):
+    """The plan lists the disabled knobs except knob c that never changes the plan, all created connectors are counted"""
+    lock = threading.Lock()
+    num_created = 0
+    num_closed = 0
+
+    def __init__(self):
+        super().__init__()
+        with CountingConnector.lock:
+            CountingConnector.num_created += 1
+        self.knobs = []
+
+    def close(self) -> None:
+        with CountingConnector.lock:
+            CountingConnector.num_closed += 1
+
+    def set_disabled_knobs(self, knobs: list) -> None:
+        self.knobs = sorted(knobs)
+
+    def explain(self, query: str) -> str:
+        effective = [knob for knob in self.knobs if knob != 'c']
+        return f'{{"plan": "{",".join(effective)}"}}'
+
+    def execute(self, query: str) -> DBConnector.TimedResult:
+        raise NotImplementedError
+
+    @staticmethod
+    def get_knobs() -> list:
+        return ['a', 'b', 'c', 'd']
+
+
+class TargetConnector(CountingConnector):
+    """A connector to a database instance given by its target"""
+
+    def __init__(self, target: str):
+        super().__init__()
+        self.target = target
+
+    def clone(self) -> DBConnector:
+        return type(self)(self.target)
+
+
+class TestConnectorPool(unittest.TestCase):
+    """TestCase for the connector pool"""
+
+    def setUp(self) -> None:
+        CountingConnector.num_created = 0
+        CountingConnector.num_closed = 0
+
+    def test_bounded_and_reused(self):
+        checked_out, max_checked_out = [0], [0]
+        lock = threading.Lock()
+
+        def use(pool):
+            with pool.connector():
+                with lock:
+                    checked_out[0] += 1
+                    max_checked_out[0] = max(max_checked_out[0], checked_out[0])
+                with lock:
+                    checked_out[0] -= 1
+
+        with ConnectorPool(CountingConnector, 2) as pool:
+            threads = [threading.Thread(target=use, args=(pool,)) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertLessEqual(max_checked_out[0], 2)
+            self.assertLessEqual(pool.num_created, 2)
+        self.assertEqual(CountingConnector.num_closed, CountingConnector.num_created)
+
+    def test_knobs_reset_on_return(self):
+        with ConnectorPool(CountingConnector, 1) as pool:
+            with pool.connector() as connector:
+                connector.set_disabled_knobs(['b', 'a'])
+            with pool.connector() as reused:
+                self.assertIs(reused, connector)
+                self.assertEqual(reused.knobs, [])
+
+    def test_failed_connector_is_closed(self):
+        with ConnectorPool(CountingConnector, 1) as pool:
+            with self.assertRaises(RuntimeError):
+                with pool.connector() as connector:
+                    raise RuntimeError('connection lost')
+            self.assertEqual(CountingConnector.num_closed, 1)
+            with pool.connector() as replacement:
+                self.assertIsNot(replacement, connector)
+            self.assertEqual(pool.num_created, 2)
+
+    def test_factory(self):
+        with ConnectorPool(TargetConnector('replica').clone, 1) as pool:
+            with pool.connector() as connector:
+                self.assertEqual((type(connector), connector.target), (TargetConnector, 'replica'))
+
+    def test_query_span(self):
+        query_span = approximate_query_span(CountingConnector, 'SELECT 1;', get_query_plan, find_alternative_knobs=True)
+        self.assertEqual(sorted(tuple(sorted(hint_set.knobs)) for hint_set in query_span), [(), ('a',), ('b',), ('d',)])
+        # All explains share the connectors of the pool
+        self.assertLessEqual(CountingConnector.num_created, N_THREADS)
+        self.assertEqual(CountingConnector.num_closed, CountingConnector.num_created)
+
+
+if __name__ == '__main__':
+    unittest.main()
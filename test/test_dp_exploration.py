@@ -0,0 +1,271 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Test the checkpointed dynamic-programming exploration of hint-sets"""
+import time
+import unittest
+from unittest import mock
+import storage
+from connectors.connector import DBConnector, QueryTimeout
+from autosteer.dp_exploration import explore_optimizer_configs, register_hint_set_result, register_query_config_and_measurement
+from autosteer.execution_scheduler import HintSetResult
+from autosteer.model_guidance import ModelGuidance
+from autosteer.exploration_strategies import ExplorationBudget, DPStrategy, BeamSearchStrategy, GreedyForwardStrategy, UCBStrategy
+from autosteer.optimizer_config import HintSetExploration
+from autosteer.sequential_test import SequentialTest, WORSE
+from utils.config import read_config
+from test.results_database import ResultsDatabaseTestCase
+
+# Runtime changes in usecs if a knob is disabled; every hint-set results in a different plan
+KNOB_RUNTIMES = {'a': -10, 'b': -20, 'c': 150, 'd': -5}
+
+
+class Interrupted(BaseException):
+    """Simulates a killed training run"""
+
+
+class RuntimeConnector(DBConnector):
+    """Runtimes depend on the disabled knobs, the connector interrupts the training run after max_executions executions"""
+
+    def __init__(self, max_executions=None):
+        super().__init__()
+        self.knobs = []
+        self.executions = []
+        self.max_executions = max_executions
+
+    def close(self) -> None:
+        pass
+
+    def set_disabled_knobs(self, knobs: list) -> None:
+        self.knobs = sorted(knobs)
+
+    def explain(self, query: str) -> str:
+        return f'{{"plan": "{",".join(self.knobs)}"}}'
+
+    def execute(self, query: str) -> DBConnector.TimedResult:
+        if self.max_executions is not None and len(self.executions) == self.max_executions:
+            raise Interrupted()
+        self.executions.append(','.join(self.knobs))
+        return DBConnector.TimedResult('[(42,)]', 100 + sum(KNOB_RUNTIMES[knob] for knob in self.knobs))
+
+    def execute_with_timeout(self, query: str, timeout_usecs: int) -> DBConnector.TimedResult:
+        timed_result = self.execute(query)
+        if timed_result.time_usecs > timeout_usecs:
+            raise QueryTimeout()
+        return timed_result
+
+
+def _num_knobs(hint_set: str) -> int:
+    return hint_set.count(',') + 1 if hint_set else 0
+
+
+class EventLogConnector(RuntimeConnector):
+    """Logs the explains and executions of all connections"""
+    events = []
+
+    def explain(self, query: str) -> str:
+        EventLogConnector.events.append(('explain', id(self), ','.join(self.knobs)))
+        return super().explain(query)
+
+    def execute(self, query: str) -> DBConnector.TimedResult:
+        EventLogConnector.events.append(('execute', id(self), ','.join(self.knobs)))
+        return super().execute(query)
+
+
+class DuplicatePlanConnector(EventLogConnector):
+    """Disabling d does not change the plan if a is disabled as well"""
+
+    def explain(self, query: str) -> str:
+        plan = super().explain(query)
+        return plan.replace('a,d', 'a') if 'a' in self.knobs else plan
+
+
+class SlowRuntimeConnector(RuntimeConnector):
+    """Every execution takes 20 milliseconds"""
+
+    def execute(self, query: str) -> DBConnector.TimedResult:
+        time.sleep(0.02)
+        return super().execute(query)
+
+
+class PlanModel:
+    """Predicts the runtimes of the RuntimeConnector's plans, but mispredicts the plans disabling a and d together"""
+
+    def predict(self, plans):
+        knobs = [plan['plan'].split(',') if plan['plan'] else [] for plan in plans]
+        return [[1000 if 'a' in k and 'd' in k else 100 + sum(KNOB_RUNTIMES[knob] for knob in k)] for k in knobs]
+
+
+class TestDPExploration(ResultsDatabaseTestCase):
+    """TestCase for resuming an interrupted exploration"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.query_path = f'{self.directory}/1.sql'
+        with open(self.query_path, 'w', encoding='utf-8') as f:
+            f.write('SELECT 42;')
+        self.repeats = int(read_config()['autosteer']['repeats'])
+
+    def _register_query_span(self, database):
+        storage.TESTED_DATABASE = database
+        storage.BENCHMARK_ID = storage.register_benchmark(self.directory)
+        storage.register_query(self.query_path)
+        for knob in KNOB_RUNTIMES:
+            storage.register_optimizer(self.query_path, knob, required=False)
+
+    def _measurements(self):
+        df = storage.get_df("""SELECT hs.disabled_rules, count(*) AS num_measurements FROM measurements m, query_optimizer_configs qoc, hint_sets hs
+            WHERE m.query_optimizer_config_id = qoc.id AND qoc.hint_set_id = hs.id GROUP BY hs.disabled_rules""", {})
+        return sorted(zip(df['disabled_rules'], df['num_measurements']))
+
+    def test_resume_exploration(self):
+        self._register_query_span('uninterrupted')
+        connector = RuntimeConnector()
+        explore_optimizer_configs(connector, self.query_path)
+        expected_measurements = self._measurements()
+        self.assertEqual({num_measurements for _, num_measurements in expected_measurements}, {self.repeats})
+
+        for max_executions in [1, 5, 11]:
+            self._register_query_span(f'interrupted_{max_executions}')
+            interrupted_connector = RuntimeConnector(max_executions)
+            with self.assertRaises(Interrupted):
+                explore_optimizer_configs(interrupted_connector, self.query_path)
+            self.assertFalse(storage.load_exploration_checkpoint(self.query_path).completed)
+            stored_measurements = self._measurements()
+
+            resumed_connector = RuntimeConnector()
+            explore_optimizer_configs(resumed_connector, self.query_path, resume=True)
+            self.assertTrue(storage.load_exploration_checkpoint(self.query_path).completed)
+            self.assertEqual(self._measurements(), expected_measurements)
+            # Only the missing repetitions are executed, i.e. no hint-set is executed more often than in the uninterrupted exploration
+            self.assertEqual(len(resumed_connector.executions), len(connector.executions) - sum(n for _, n in stored_measurements))
+
+            completed_connector = RuntimeConnector()
+            explore_optimizer_configs(completed_connector, self.query_path, resume=True)
+            self.assertEqual(completed_connector.executions, [])
+
+    def test_adaptive_repetitions(self):
+        self._register_query_span('adaptive')
+        connector = RuntimeConnector()
+        with mock.patch('autosteer.dp_exploration.get_sequential_test', lambda baseline: SequentialTest(baseline, 2, 10, clearly_worse_factor=2.0)):
+            explore_optimizer_configs(connector, self.query_path)
+        # The runtimes do not vary: two repetitions decide, except for the clearly worse hint-set
+        self.assertEqual(connector.executions.count(''), 2)
+        self.assertEqual(connector.executions.count('c'), 1)
+        self.assertEqual(connector.executions.count('a'), 2)
+        self.assertNotIn('a,c', connector.executions)
+
+    def test_worse_decision_blacklists(self):
+        self._register_query_span('worse')
+        exploration = HintSetExploration(self.query_path)
+        connector = RuntimeConnector()
+        for disabled_rules, decision in [('a', None), ('c', WORSE)]:
+            connector.set_disabled_knobs(disabled_rules.split(','))
+            query_plan = connector.explain('SELECT 42;')
+            result = HintSetResult([connector.execute('SELECT 42;')], decision=decision)
+            register_hint_set_result(result, exploration, self.query_path, disabled_rules, query_plan, connector.plan_fingerprint(query_plan))
+        self.assertEqual(set(exploration.blacklisted_hint_sets), {frozenset(['c'])})
+
+    def test_plan_hash_width(self):
+        self._register_query_span('plan_hash')
+        # The fingerprints differ in bit 32 only
+        fingerprint, other_fingerprint = '0' * 64, '0' * 55 + '100000000'
+        self.assertFalse(register_query_config_and_measurement(self.query_path, 'a', '{"plan": "a"}', fingerprint, initial_call=True))
+        self.assertFalse(register_query_config_and_measurement(self.query_path, 'b', '{"plan": "b"}', other_fingerprint, initial_call=True))
+        self.assertTrue(register_query_config_and_measurement(self.query_path, 'c', '{"plan": "b"}', other_fingerprint, initial_call=True))
+
+    def test_timeout(self):
+        self._register_query_span('timeout')
+        connector = RuntimeConnector()
+        with mock.patch('autosteer.dp_exploration.get_timeout', lambda baseline: None if baseline is None else 2 * baseline[0]):
+            explore_optimizer_configs(connector, self.query_path)
+        # The slow hint-set is cancelled at its first execution and blacklisted
+        self.assertEqual(connector.executions.count('c'), 1)
+        self.assertEqual(storage.hint_set_runtimes(self.query_path, 'c', censored=True), [200])
+        self.assertEqual(storage.hint_set_runtimes(self.query_path, 'c'), [])
+        self.assertFalse(any('c' in hint_set.split(',') for hint_set in connector.executions if hint_set != 'c'))
+        self.assertIn(['c'], storage.load_exploration_checkpoint(self.query_path).blacklist)
+
+    def test_strategies(self):
+        strategies = {'dp': lambda exploration: DPStrategy(exploration, 3),
+                      'beam': lambda exploration: BeamSearchStrategy(exploration, 3, 1),
+                      'greedy': lambda exploration: GreedyForwardStrategy(exploration, 3),
+                      'ucb': lambda exploration: UCBStrategy(exploration, 6, 2, 1.0)}
+        executions = {}
+        for name, strategy in strategies.items():
+            self._register_query_span(name)
+            connector = RuntimeConnector()
+            with mock.patch('autosteer.optimizer_config.get_exploration_strategy', strategy):
+                report = explore_optimizer_configs(connector, self.query_path)
+            # Disabling a, b, and d saves 35 of 100 usecs
+            self.assertEqual((report.strategy, report.best_hint_set, report.savings_usecs()), (name, 'a,b,d', 35))
+            self.assertEqual(report.executions, len(connector.executions))
+            self.assertNotIn('a,c', connector.executions)
+            executions[name] = len(connector.executions)
+        self.assertLess(executions['beam'], executions['dp'])
+        self.assertLessEqual(executions['greedy'], executions['beam'])
+
+    def test_ucb_untried_arms(self):
+        self._register_query_span('ucb_duplicates')
+        EventLogConnector.events = []
+        connector = DuplicatePlanConnector()
+        with mock.patch('autosteer.optimizer_config.get_exploration_strategy', lambda exploration: UCBStrategy(exploration, 6, 2, 1.0)):
+            explore_optimizer_configs(connector, self.query_path)
+        # The hint-set with a duplicated plan never gets a runtime, but it is proposed only once
+        explains = [hint_set for event, _, hint_set in EventLogConnector.events if event == 'explain']
+        self.assertEqual(explains.count('a,d'), 1)
+        self.assertNotIn('a,d', connector.executions)
+
+    def test_budget(self):
+        self._register_query_span('budget')
+        connector = RuntimeConnector()
+        with mock.patch('autosteer.optimizer_config.get_exploration_budget', lambda: ExplorationBudget(0, 6, self.repeats)):
+            report = explore_optimizer_configs(connector, self.query_path)
+        # The budget is checked before every level, a level is truncated to the remaining executions
+        self.assertLessEqual(len(connector.executions), 6 + self.repeats)
+        self.assertEqual(report.executions, len(connector.executions))
+        self.assertTrue(storage.load_exploration_checkpoint(self.query_path).completed)
+
+    def test_time_budget_within_level(self):
+        self._register_query_span('time_budget')
+        connector = SlowRuntimeConnector()
+        with mock.patch('autosteer.optimizer_config.get_exploration_budget', lambda: ExplorationBudget(0.1, 0, self.repeats)):
+            explore_optimizer_configs(connector, self.query_path)
+        # The budget stops the level of the single knobs after the first hint-sets, not at its end
+        single_knobs = {hint_set for hint_set in connector.executions if _num_knobs(hint_set) == 1}
+        self.assertGreater(len(single_knobs), 0)
+        self.assertLess(len(single_knobs), len(KNOB_RUNTIMES))
+        self.assertEqual(max(_num_knobs(hint_set) for hint_set in connector.executions), 1)
+        self.assertTrue(storage.load_exploration_checkpoint(self.query_path).completed)
+
+    def test_model_guidance(self):
+        self._register_query_span('guided')
+        connector = RuntimeConnector()
+        retrained = []
+        guidance = ModelGuidance(PlanModel(), skip_factor=1.5, retrain_interval=4, retrain=lambda: retrained.append(True) or PlanModel())
+        with mock.patch('autosteer.dp_exploration.get_model_guidance', lambda connector, benchmark: guidance):
+            explore_optimizer_configs(connector, self.query_path)
+        # The hint-sets are executed in the predicted order, the slow and the mispredicted hint-sets are skipped
+        self.assertEqual(connector.executions[:5 * self.repeats], [hint_set for hint_set in ['', 'b', 'a', 'd', 'a,b'] for _ in range(self.repeats)])
+        self.assertNotIn('c', connector.executions)
+        self.assertNotIn('a,d', connector.executions)
+        self.assertIn('b,d', connector.executions)
+        self.assertEqual(len(retrained), len(connector.executions) // 4)
+
+    def test_explain_level_before_execution(self):
+        self._register_query_span('pre_explain')
+        connector = EventLogConnector()
+        explore_optimizer_configs(connector, self.query_path)
+        explains = [(i, hint_set) for i, (event, connection, hint_set) in enumerate(EventLogConnector.events) if event == 'explain']
+        executions = [(i, hint_set) for i, (event, connection, hint_set) in enumerate(EventLogConnector.events) if event == 'execute']
+        # The measuring connection does not explain, all plans of a DP level are known before its first execution
+        self.assertNotIn(id(connector), [connection for event, connection, _ in EventLogConnector.events if event == 'explain'])
+        self.assertEqual({hint_set for _, hint_set in executions}, {hint_set for _, hint_set in explains})
+        for level in range(4):
+            last_explain = max(i for i, hint_set in explains if _num_knobs(hint_set) == level)
+            first_execution = min(i for i, hint_set in executions if _num_knobs(hint_set) == level)
+            self.assertLess(last_explain, first_execution)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Test the parallel execution of hint-sets on several database workers"""
+import os
+import threading
+import time
+import unittest
+from connectors.connector import DBConnector
+from autosteer.execution_scheduler import ExecutionScheduler, ExecutionTarget, execute_repeatedly
+
+
+class SleepConnector(DBConnector):
+    """Executes a query by sleeping for the number of milliseconds given by the query, disabling the knob 'fail' fails the executions
+    and disabling the knob 'crash' kills the process"""
+
+    def __init__(self, target: str = 'DEFAULT'):
+        super().__init__()
+        self.target = target
+        self.knobs = []
+        self.cancelled = threading.Event()
+
+    def close(self) -> None:
+        pass
+
+    def set_disabled_knobs(self, knobs: list) -> None:
+        self.knobs = knobs
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def execute(self, query: str) -> DBConnector.TimedResult:
+        if 'fail' in self.knobs:
+            raise ValueError('cannot disable fail')
+        if 'crash' in self.knobs:
+            os._exit(1)  # pylint: disable=protected-access
+        self.cancelled.clear()
+        if self.cancelled.wait(int(query) / 1000):
+            raise InterruptedError('cancelled')
+        return DBConnector.TimedResult(f'{self.target},{os.getpid()},{",".join(self.knobs)}', int(query) * 1000)
+
+
+class TestExecutionScheduler(unittest.TestCase):
+    """TestCase for the execution scheduler"""
+
+    def setUp(self) -> None:
+        self.hint_sets = [[f'knob{i}'] for i in range(12)]
+
+    def test_results_in_order(self):
+        targets = [ExecutionTarget('a', 2), ExecutionTarget('b', 1)]
+        with ExecutionScheduler(SleepConnector(), targets) as scheduler:
+            results = list(scheduler.run('10', self.hint_sets, [2] * len(self.hint_sets)))
+        self.assertEqual(len(results), len(self.hint_sets))
+        workers = {}
+        for knobs, result in zip(self.hint_sets, results):
+            self.assertIsNone(result.error)
+            self.assertEqual(len(result.timed_results), 2)
+            for timed_result in result.timed_results:
+                target, pid, disabled_knobs = timed_result.result.split(',')
+                self.assertEqual(target, result.target)
+                self.assertEqual(disabled_knobs, knobs[0])
+                workers.setdefault(target, set()).add(pid)
+        # Every target runs at most as many workers as its concurrency allows
+        self.assertLessEqual(len(workers['a']), 2)
+        self.assertLessEqual(len(workers.get('b', set())), 1)
+        self.assertEqual(len(workers['a'].intersection(workers.get('b', set()))), 0)
+
+    def test_parallel_execution(self):
+        targets = [ExecutionTarget('a', 2), ExecutionTarget('b', 2)]
+        with ExecutionScheduler(SleepConnector(), targets) as scheduler:
+            list(scheduler.run('0', [[]] * 4, [1] * 4))  # wait for the workers to start
+            begin = time.time()
+            list(scheduler.run('200', self.hint_sets, [1] * len(self.hint_sets)))
+            # 12 hint-sets take 2.4 seconds one after another and 0.6 seconds on 4 workers
+            self.assertLess(time.time() - begin, 1.8)
+
+    def test_failed_execution(self):
+        with ExecutionScheduler(SleepConnector(), [ExecutionTarget('a', 2)]) as scheduler:
+            results = list(scheduler.run('0', [['knob'], ['fail'], ['knob']], [2, 2, 1]))
+        self.assertEqual([len(result.timed_results) for result in results], [2, 0, 1])
+        self.assertEqual([result.error for result in results], [None, 'cannot disable fail', None])
+
+    def test_crashed_worker(self):
+        with ExecutionScheduler(SleepConnector(), [ExecutionTarget('a', 2)]) as scheduler:
+            results = list(scheduler.run('0', [['knob'], ['crash'], ['knob'], ['knob']], [1] * 4))
+            # The hint-sets are lost once no worker is alive
+            results += list(scheduler.run('0', [['crash'], ['knob'], ['knob']], [1] * 3))
+        self.assertEqual([len(result.timed_results) for result in results], [1, 0, 1, 1, 0, 0, 0])
+        self.assertEqual([result.error is None for result in results], [True, False, True, True, False, False, False])
+        self.assertEqual(results[1].error, 'The worker exited with code 1')
+
+    def test_timeout(self):
+        begin = time.time()
+        result = execute_repeatedly(SleepConnector(), '10000', ['knob'], 3, timeout_usecs=100_000)
+        self.assertLess(time.time() - begin, 5)
+        self.assertEqual((len(result.timed_results), result.timeout_usecs, result.error), (0, 100_000, None))
+        result = execute_repeatedly(SleepConnector(), '10', ['knob'], 3, timeout_usecs=1_000_000)
+        self.assertEqual((len(result.timed_results), result.timeout_usecs), (3, None))
+
+    def test_single_worker_uses_connector(self):
+        connector = SleepConnector('local')
+        with ExecutionScheduler(connector, [ExecutionTarget('a', 1)]) as scheduler:
+            self.assertEqual(len(scheduler.workers), 0)
+            results = list(scheduler.run('0', self.hint_sets, [1] * len(self.hint_sets)))
+        self.assertEqual([result.timed_results[0].result for result in results],
+                         [f'local,{os.getpid()},{knobs[0]}' for knobs in self.hint_sets])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Test the persistent explain cache"""
+import unittest
+from autosteer import explain_cache
+from autosteer.explain_cache import ExplainCache, normalize_sql
+from autosteer.query_span import HintSet, get_query_plan
+from connectors.connector import DBConnector
+from connectors.connector_pool import ConnectorPool
+from test.results_database import ResultsDatabaseTestCase
+
+
+class ExplainLogConnector(DBConnector):
+    """The plan lists the disabled knobs, all explains are logged"""
+    explains = []
+
+    def __init__(self):
+        super().__init__()
+        self.knobs = []
+
+    def close(self) -> None:
+        pass
+
+    def set_disabled_knobs(self, knobs: list) -> None:
+        self.knobs = sorted(knobs)
+
+    def explain(self, query: str) -> str:
+        ExplainLogConnector.explains.append((query, self.knobs))
+        return f'{{"plan": "{",".join(self.knobs)}"}}'
+
+    def execute(self, query: str) -> DBConnector.TimedResult:
+        raise NotImplementedError
+
+    @staticmethod
+    def get_name() -> str:
+        return 'explainlog'
+
+
+class TestExplainCache(ResultsDatabaseTestCase):
+    """TestCase for the explain cache"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.filename = f'{self.directory}/cache.sqlite'
+        self.previous_cache_settings = explain_cache.MAX_ENTRIES, explain_cache.VERSION
+        ExplainLogConnector.explains = []
+
+    def tearDown(self) -> None:
+        explain_cache.close()
+        explain_cache.MAX_ENTRIES, explain_cache.VERSION = self.previous_cache_settings
+        super().tearDown()
+
+    def test_normalize_sql(self):
+        self.assertEqual(normalize_sql('SELECT *\n  FROM t\tWHERE a = 1 ;\n'), 'SELECT * FROM t WHERE a = 1')
+        self.assertEqual(normalize_sql("SELECT  'a  b'"), "SELECT 'a  b'")
+
+    def test_persistent_lru(self):
+        cache = ExplainCache(self.filename, 'db', 'v1', 2)
+        cache.put('SELECT 1;', ['b', 'a'], 'plan ab')
+        cache.put('SELECT 1;', [], 'default plan')
+        self.assertEqual(cache.get('SELECT  1', ['a', 'b']), 'plan ab')
+        # The default plan is the least recently used
+        cache.put('SELECT 2;', [], 'plan 2')
+        self.assertIsNone(cache.get('SELECT 1;', []))
+        self.assertEqual((cache.hits, cache.misses, cache.num_entries), (1, 1, 2))
+        cache.close()
+        reopened = ExplainCache(self.filename, 'db', 'v1', 2)
+        self.assertEqual(reopened.get('SELECT 2;', []), 'plan 2')
+        self.assertIsNone(ExplainCache(self.filename, 'other db', 'v1', 2).get('SELECT 2;', []))
+        reopened.close()
+
+    def test_version_invalidates(self):
+        cache = ExplainCache(self.filename, 'db', 'v1', 10)
+        cache.put('SELECT 1;', [], 'plan')
+        cache.close()
+        cache = ExplainCache(self.filename, 'db', 'v2', 10)
+        self.assertEqual(cache.num_entries, 0)
+        self.assertIsNone(cache.get('SELECT 1;', []))
+        cache.close()
+
+    def test_get_query_plan(self):
+        explain_cache.MAX_ENTRIES, explain_cache.VERSION = 10, 'v1'
+        with ConnectorPool(ExplainLogConnector, 1) as pool:
+            plans = [get_query_plan((pool, sql, HintSet({'b'}, HintSet({'a'}, None)))).plan for sql in ['SELECT 1;', 'SELECT\n1;']]
+        self.assertEqual(plans, ['{"plan": "a,b"}'] * 2)
+        self.assertEqual(ExplainLogConnector.explains, [('SELECT 1;', ['a', 'b'])])
+        # A new training run does not explain the query again unless the schema/statistics version changes
+        explain_cache.close()
+        with ConnectorPool(ExplainLogConnector, 1) as pool:
+            get_query_plan((pool, 'SELECT 1;', HintSet({'a', 'b'}, None)))
+            self.assertEqual(len(ExplainLogConnector.explains), 1)
+            explain_cache.VERSION = 'v2'
+            get_query_plan((pool, 'SELECT 1;', HintSet({'a', 'b'}, None)))
+            self.assertEqual(len(ExplainLogConnector.explains), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Test the bitmask representation of hint-sets used by the DP exploration"""
+import random
+import unittest
+from autosteer.hint_set_bitsets import KnobIndex, HintSetBlacklist, combine, dependency_masks, satisfies_dependencies
+
+
+def _combine_frozensets(promising_knobs, previous_hint_sets, blacklist):
+    """The DP combination on sets of knob names"""
+    result = set()
+    for knobs in promising_knobs:
+        for hint_set in previous_hint_sets:
+            if knobs[0] not in hint_set:
+                new_hint_set = frozenset(hint_set + knobs)
+                if not any(blacklisted.issubset(new_hint_set) for blacklisted in blacklist):
+                    result.add(new_hint_set)
+    return sorted(sorted(hint_set) for hint_set in result)
+
+
+class TestHintSetBitsets(unittest.TestCase):
+    """TestCase for the knob index, the blacklist, and the DP combination"""
+
+    def setUp(self) -> None:
+        self.knob_index = KnobIndex(['a', 'b', 'c', 'd'])
+
+    def test_knob_index(self):
+        self.assertEqual(self.knob_index.mask(['a', 'c']), 0b101)
+        self.assertEqual(self.knob_index.get_knobs(0b1010), ['b', 'd'])
+        # Knobs that are not tunable get new bits
+        self.assertEqual(self.knob_index.mask(['e']), 0b10000)
+        self.assertEqual(self.knob_index.get_knobs(self.knob_index.mask(['e', 'a'])), ['a', 'e'])
+
+    def test_blacklist(self):
+        blacklist = HintSetBlacklist(self.knob_index, [['b', 'c']])
+        self.assertTrue(blacklist.prunes(self.knob_index.mask(['a', 'b', 'c'])))
+        self.assertFalse(blacklist.prunes(self.knob_index.mask(['a', 'b', 'd'])))
+        # A blacklisted subset replaces its blacklisted supersets in the index, all of them are kept for checkpoints
+        blacklist.add(['c'])
+        self.assertEqual(sum(len(masks) for masks in blacklist.minimal.values()), 1)
+        self.assertEqual(sorted(sorted(hint_set) for hint_set in blacklist), [['b', 'c'], ['c']])
+        self.assertTrue(blacklist.prunes(self.knob_index.mask(['c', 'd'])))
+        self.assertFalse(blacklist.prunes(self.knob_index.mask(['a', 'b', 'd'])))
+
+    def test_combine_matches_frozensets(self):
+        rng = random.Random(42)
+        knobs = [f'knob_{i}' for i in range(40)]
+        knob_index = KnobIndex(knobs)
+        for level in range(2, 6):
+            promising_knobs = [[knob] for knob in rng.sample(knobs, 15)]
+            previous_hint_sets = [rng.sample(knobs, level - 1) for _ in range(30)]
+            blacklist = [rng.sample(knobs, rng.randint(1, level)) for _ in range(50)]
+            expected = _combine_frozensets(promising_knobs, previous_hint_sets, [frozenset(hint_set) for hint_set in blacklist])
+            self.assertEqual(combine(knob_index, promising_knobs, previous_hint_sets, HintSetBlacklist(knob_index, blacklist)), expected)
+
+    def test_dependencies(self):
+        dependencies = dependency_masks(self.knob_index, {'a': ['b', 'c']})
+        self.assertTrue(satisfies_dependencies(self.knob_index.mask(['a', 'b', 'c']), dependencies))
+        self.assertTrue(satisfies_dependencies(self.knob_index.mask(['b', 'd']), dependencies))
+        self.assertFalse(satisfies_dependencies(self.knob_index.mask(['a', 'b']), dependencies))
+
+
+if __name__ == '__main__':
+    unittest.main()
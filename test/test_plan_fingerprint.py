@@ -0,0 +1,55 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Test the canonical fingerprints of query plans"""
+import json
+import re
+import subprocess
+import sys
+import unittest
+from utils.util import plan_fingerprint
+
+PLAN = {'id': '9', 'name': 'Output', 'estimates': [{'rows': 1000.0, 'cpuCost': 12345.6}],
+        'children': [{'id': '253', 'name': 'TableScan', 'details': 'orders#12L', 'estimates': [{'rows': 1000.0, 'cpuCost': 1.0}], 'children': []}]}
+
+
+class TestPlanFingerprint(unittest.TestCase):
+    """TestCase for the plan fingerprints"""
+
+    def test_canonical(self):
+        reordered = json.dumps(PLAN, sort_keys=True, indent=2)
+        self.assertEqual(plan_fingerprint(json.dumps(PLAN)), plan_fingerprint(reordered))
+        self.assertEqual(plan_fingerprint(json.dumps(PLAN)), plan_fingerprint(PLAN))
+        self.assertEqual(plan_fingerprint('  Project\n    Scan  \n'), plan_fingerprint('Project\nScan'))
+
+    def test_volatile_fields(self):
+        other = json.loads(json.dumps(PLAN))
+        other['id'] = '10'
+        other['children'][0]['details'] = 'orders#57L'
+        other['estimates'][0]['cpuCost'] = 12351.0  # within the tolerance of two significant digits
+        self.assertNotEqual(plan_fingerprint(json.dumps(PLAN)), plan_fingerprint(json.dumps(other)))
+        options = {'volatile_keys': {'id'}, 'volatile_pattern': re.compile(r'#\d+L?'), 'estimate_keys': {'estimates'}}
+        self.assertEqual(plan_fingerprint(json.dumps(PLAN), **options), plan_fingerprint(json.dumps(other), **options))
+        self.assertNotEqual(plan_fingerprint(json.dumps(PLAN), volatile_keys={'id'}, volatile_pattern=re.compile(r'#\d+L?')),
+                            plan_fingerprint(json.dumps(other), volatile_keys={'id'}, volatile_pattern=re.compile(r'#\d+L?')))
+        other['children'][0]['name'] = 'IndexScan'
+        self.assertNotEqual(plan_fingerprint(json.dumps(PLAN), volatile_keys={'id'}), plan_fingerprint(json.dumps(other), volatile_keys={'id'}))
+        self.assertNotEqual(plan_fingerprint('{"a": ["b", "c"]}'), plan_fingerprint('{"a": ["bc"]}'))
+
+    def test_exact_numbers(self):
+        limit = {'name': 'Limit', 'count': 1234, 'estimates': [{'rows': 1234.0}], 'children': [PLAN]}
+        other = json.loads(json.dumps(limit))
+        other['count'] = 1239
+        self.assertNotEqual(plan_fingerprint(limit, estimate_keys={'estimates'}), plan_fingerprint(other, estimate_keys={'estimates'}))
+        other['count'] = 1234
+        other['estimates'][0]['rows'] = 1239.0
+        self.assertEqual(plan_fingerprint(limit, estimate_keys={'estimates'}), plan_fingerprint(other, estimate_keys={'estimates'}))
+
+    def test_stable_across_processes(self):
+        command = 'from utils.util import plan_fingerprint; print(plan_fingerprint("Project\\nScan"))'
+        fingerprints = {subprocess.run([sys.executable, '-c', command], capture_output=True, text=True, check=True).stdout.strip() for _ in range(2)}
+        self.assertEqual(fingerprints, {plan_fingerprint('Project\nScan')})
+
+
+if __name__ == '__main__':
+    unittest.main()
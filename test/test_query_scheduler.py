@@ -0,0 +1,117 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Test the interleaved exploration of the queries of a benchmark"""
+import configparser
+import time
+import unittest
+from unittest import mock
+import storage
+from connectors.connector import DBConnector
+from autosteer.model_guidance import ModelGuidance, get_model_guidance
+from autosteer.query_scheduler import QueryScheduler, expected_savings
+from test.results_database import ResultsDatabaseTestCase
+
+# Relative runtime changes if a knob is disabled
+KNOB_FACTORS = {'a': 0.9, 'b': 1.5}
+
+
+class QueryRuntimeConnector(DBConnector):
+    """The runtime of the default plan is the number selected by the query, all executions of all connections are logged"""
+    executions = []
+
+    def __init__(self):
+        super().__init__()
+        self.knobs = []
+
+    def close(self) -> None:
+        pass
+
+    def set_disabled_knobs(self, knobs: list) -> None:
+        self.knobs = sorted(knobs)
+
+    def explain(self, query: str) -> str:
+        return f'{{"plan": "{",".join(self.knobs)}"}}'
+
+    def execute(self, query: str) -> DBConnector.TimedResult:
+        runtime = int(query.split()[1].rstrip(';'))
+        for knob in self.knobs:
+            runtime *= KNOB_FACTORS[knob]
+        QueryRuntimeConnector.executions.append((query, ','.join(self.knobs)))
+        return DBConnector.TimedResult(f'[({query},)]', int(runtime))
+
+
+class SlowQueryRuntimeConnector(QueryRuntimeConnector):
+    """Every execution takes some milliseconds"""
+
+    def execute(self, query: str) -> DBConnector.TimedResult:
+        time.sleep(0.005)
+        return super().execute(query)
+
+
+class TestQueryScheduler(ResultsDatabaseTestCase):
+    """TestCase for the cross-query scheduler"""
+    tested_database = 'scheduler'
+
+    def setUp(self) -> None:
+        super().setUp()
+        storage.BENCHMARK_ID = storage.register_benchmark(self.directory)
+        self.query_paths = []
+        for name, runtime in [('short', 1_000), ('long', 100_000)]:
+            query_path = f'{self.directory}/{name}.sql'
+            with open(query_path, 'w', encoding='utf-8') as f:
+                f.write(f'SELECT {runtime};')
+            storage.register_query(query_path)
+            for knob in KNOB_FACTORS:
+                storage.register_optimizer(query_path, knob, required=False)
+            self.query_paths.append(query_path)
+        QueryRuntimeConnector.executions = []
+
+    def test_interleaved_by_expected_savings(self):
+        scheduler = QueryScheduler(QueryRuntimeConnector(), self.query_paths, interleave_hint_sets=1)
+        reports = scheduler.run()
+        queries = [query for query, _ in QueryRuntimeConnector.executions]
+        # The default plans come first, then the long query with the higher expected savings is explored before the short one
+        self.assertEqual([queries[0], queries[2]], ['SELECT 1000;', 'SELECT 100000;'])
+        self.assertEqual(queries[4:], ['SELECT 100000;'] * 4 + ['SELECT 1000;'] * 4)
+        self.assertEqual([report.best_hint_set for report in reports], ['a', 'a'])
+        self.assertTrue(all(storage.load_exploration_checkpoint(query_path).completed for query_path in self.query_paths))
+        self.assertGreater(expected_savings(self.query_paths[1]), expected_savings(self.query_paths[0]))
+        progress = scheduler.progress()
+        self.assertEqual((progress.num_completed, progress.num_executed, progress.num_scheduled), (2, 6, 0))
+
+    def test_shared_model_guidance(self):
+        guidance, benchmarks = ModelGuidance(None), []
+        with mock.patch('autosteer.query_scheduler.get_model_guidance', lambda connector, benchmark: benchmarks.append(benchmark) or guidance):
+            scheduler = QueryScheduler(QueryRuntimeConnector(), self.query_paths)
+            scheduler.run()
+        # One guidance per benchmark run observes the measurements of all queries
+        self.assertEqual(benchmarks, [self.directory])
+        self.assertTrue(all(exploration.model_guidance is guidance for exploration in scheduler.explorations))
+        self.assertEqual(guidance.new_measurements, len(QueryRuntimeConnector.executions))
+
+    def test_model_guidance_without_preprocessor(self):
+        config = configparser.ConfigParser()
+        config.read_dict({'autosteer': {'model_guidance': 'true'}})
+        with mock.patch('autosteer.model_guidance.read_config', lambda: config):
+            self.assertIsNone(get_model_guidance(QueryRuntimeConnector(), self.directory))
+
+    def test_time_per_query(self):
+        scheduler = QueryScheduler(SlowQueryRuntimeConnector(), self.query_paths)
+        reports = scheduler.run()
+        # Each query is charged for its own steps only, not for the time spent on the other query
+        self.assertTrue(all(report.seconds > 0 for report in reports))
+        self.assertLessEqual(sum(report.seconds for report in reports), scheduler.elapsed_secs())
+
+    def test_budget(self):
+        scheduler = QueryScheduler(QueryRuntimeConnector(), self.query_paths, budget_secs=1e-9)
+        scheduler.run()
+        self.assertEqual(QueryRuntimeConnector.executions, [])
+        # The queries are not explored completely and continue in the next training run
+        resumed = QueryScheduler(QueryRuntimeConnector(), self.query_paths, resume=True)
+        self.assertEqual(len(resumed.run()), 2)
+        self.assertTrue(all(storage.load_exploration_checkpoint(query_path).completed for query_path in self.query_paths))
+
+
+if __name__ == '__main__':
+    unittest.main()
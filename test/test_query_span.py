@@ -0,0 +1,136 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Test the approximation of the query span"""
+import threading
+import unittest
+import storage
+from autosteer.query_span import FAILED, approximate_query_span, get_query_plan, run_get_query_span
+from connectors.connector import DBConnector
+from test.results_database import ResultsDatabaseTestCase
+
+
+class SpanConnector(DBConnector):
+    """The plan lists the disabled knobs that change it: the effective knobs and the dependent knobs whose dependency is disabled as well.
+    Disabling a required knob fails, all explains are counted."""
+    knobs = [f'k{i}' for i in range(20)]
+    effective = {'k3', 'k11'}
+    dependencies = {'k7': 'k3', 'k15': 'k7'}  # dependent knob -> knob it depends on
+    required = {'k18'}
+    lock = threading.Lock()
+    num_explains = 0
+
+    def __init__(self):
+        super().__init__()
+        self.disabled = set()
+
+    def close(self) -> None:
+        pass
+
+    def set_disabled_knobs(self, knobs: list) -> None:
+        self.disabled = set(knobs)
+
+    def explain(self, query: str) -> str:
+        with SpanConnector.lock:
+            SpanConnector.num_explains += 1
+        if len(self.disabled & self.required) > 0:
+            return FAILED
+        visible = [knob for knob in self.disabled if knob in self.effective or self.dependencies.get(knob) in self.disabled]
+        return f'{{"plan": "{",".join(sorted(visible))}"}}'
+
+    def execute(self, query: str) -> DBConnector.TimedResult:
+        raise NotImplementedError
+
+    @staticmethod
+    def get_knobs() -> list:
+        return SpanConnector.knobs
+
+
+def _query_span(**kwargs) -> tuple:
+    SpanConnector.num_explains = 0
+    query_span = approximate_query_span(SpanConnector, 'SELECT 1;', get_query_plan, **kwargs)
+    hint_sets = [(sorted(hs.knobs), sorted(hs.dependencies.get_all_knobs()) if hs.dependencies is not None else [], hs.required) for hs in query_span]
+    return hint_sets, SpanConnector.num_explains
+
+
+class TestQuerySpan(unittest.TestCase):
+    """TestCase for the query span approximation"""
+
+    def test_iterative(self):
+        query_span, _ = _query_span(find_alternative_knobs=True)
+        self.assertEqual(query_span, [([], [], False), (['k18'], [], True), (['k3'], [], False), (['k11'], [], False),
+                                      (['k7'], ['k3'], False), (['k15'], ['k3', 'k7'], False)])
+
+    def test_group_testing(self):
+        for kwargs in [{}, {'find_alternative_knobs': True}, {'find_alternative_knobs': True, 'batch_wise': True}]:
+            query_span, num_explains = _query_span(**kwargs)
+            group_query_span, num_group_explains = _query_span(group_size=8, **kwargs)
+            self.assertEqual(group_query_span, query_span)
+            self.assertLess(num_group_explains, num_explains)
+
+
+class TestIncrementalQuerySpan(ResultsDatabaseTestCase):
+    """TestCase for updating stored query spans when the knobs or the queries change"""
+    tested_database = 'span'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.previous_workload = SpanConnector.knobs, SpanConnector.effective, SpanConnector.dependencies
+        storage.BENCHMARK_ID = storage.register_benchmark(self.directory)
+        for query in ['1.sql', '2.sql']:
+            self._write_query(query, 'SELECT 1;')
+
+    def tearDown(self) -> None:
+        SpanConnector.knobs, SpanConnector.effective, SpanConnector.dependencies = self.previous_workload
+        super().tearDown()
+
+    def _write_query(self, query, sql):
+        with open(f'{self.directory}/{query}', 'w', encoding='utf-8') as f:
+            f.write(sql)
+
+    def _run(self, query) -> int:
+        SpanConnector.num_explains = 0
+        run_get_query_span(SpanConnector, self.directory, query)
+        return SpanConnector.num_explains
+
+    def _stored_span(self, query) -> tuple:
+        query_path = f'{self.directory}/{query}'
+        return (sorted(storage.get_effective_optimizers(query_path)), sorted(storage.get_required_optimizers(query_path)),
+                sorted(storage.get_effective_optimizers_depedencies(query_path)))
+
+    def test_unchanged(self):
+        self.assertGreater(self._run('1.sql'), 0)
+        self.assertEqual(self._run('1.sql'), 0)
+        self._write_query('1.sql', 'SELECT\n  1;\n')  # only the formatting changed
+        self.assertEqual(self._run('1.sql'), 0)
+
+    def test_changed_knobs(self):
+        self._run('1.sql')
+        # New knobs that change the plan alone, together with a new knob, and together with a known knob; k5 is known but inert so far
+        SpanConnector.knobs = SpanConnector.knobs + ['k20', 'k21', 'k22']
+        SpanConnector.effective = SpanConnector.effective | {'k20'}
+        SpanConnector.dependencies = dict(SpanConnector.dependencies, k21='k20', k22='k11', k5='k20')
+        num_update_explains = self._run('1.sql')
+        self.assertLess(num_update_explains, self._run('2.sql'))
+        self.assertEqual(self._stored_span('1.sql'), self._stored_span('2.sql'))
+        self.assertIn(['k5', 'k20'], self._stored_span('1.sql')[2])
+        # Removing k3 removes the knobs depending on it
+        SpanConnector.knobs = [knob for knob in SpanConnector.knobs if knob != 'k3']
+        SpanConnector.effective = SpanConnector.effective - {'k3'}
+        self._write_query('3.sql', 'SELECT 1;')
+        self._run('1.sql')
+        self._run('3.sql')
+        self.assertEqual(self._stored_span('1.sql'), self._stored_span('3.sql'))
+        self.assertNotIn('k7', self._stored_span('1.sql')[0])
+
+    def test_changed_query(self):
+        self._run('1.sql')
+        self.assertEqual(self._run('1.sql'), 0)
+        SpanConnector.effective = {'k4'}
+        self._write_query('1.sql', 'SELECT 2;')
+        self.assertGreater(self._run('1.sql'), 0)
+        self.assertEqual(self._stored_span('1.sql'), (['k4'], ['k18'], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Test the sequential test deciding on the number of repetitions of a hint-set"""
+import importlib.util
+import random
+import unittest
+from autosteer.sequential_test import SequentialTest, spent_alpha, t_quantile, BETTER, WORSE, EQUAL, PRECISE
+
+HAS_SCIPY = importlib.util.find_spec('scipy') is not None
+
+
+class TestSequentialTest(unittest.TestCase):
+    """TestCase for the early stopping of repetitions"""
+
+    def setUp(self) -> None:
+        self.random = random.Random(42)
+        self.baseline = [self.random.gauss(1_000_000, 20_000) for _ in range(5)]
+
+    def _repetitions(self, test: SequentialTest, mean, stddev):
+        runtimes = []
+        for _ in range(test.max_repeats):
+            runtimes.append(self.random.gauss(mean, stddev))
+            decision = test.decide(runtimes)
+            if decision is not None:
+                return decision, len(runtimes)
+        return None, len(runtimes)
+
+    @unittest.skipUnless(HAS_SCIPY, 'scipy is not installed')
+    def test_t_quantile(self):
+        for df, expected in [(1, 12.706), (2, 4.303), (5, 2.571), (30, 2.042), (1000, 1.962)]:
+            self.assertAlmostEqual(t_quantile(0.975, df), expected, places=3)
+
+    def test_alpha_spending(self):
+        self.assertAlmostEqual(spent_alpha(0.05, 1.0), 0.05)
+        test = SequentialTest(self.baseline, 2, 10, confidence=0.95)
+        levels = [2 * (1 - test.quantile(n)) for n in range(2, 11)]
+        # The looks share the error probability, the first look has the largest share
+        self.assertAlmostEqual(sum(levels), 0.05)
+        self.assertEqual(levels, sorted(levels, reverse=True))
+        self.assertEqual(test.quantile(12), test.quantile(10))
+
+    @unittest.skipUnless(HAS_SCIPY, 'scipy is not installed')
+    def test_decisions(self):
+        test = SequentialTest(self.baseline, 2, 10)
+        self.assertEqual(self._repetitions(test, 500_000, 10_000), (BETTER, 2))
+        self.assertEqual(self._repetitions(test, 1_500_000, 20_000), (WORSE, 2))
+        self.assertEqual(self._repetitions(test, 1_000_000, 5_000)[0], EQUAL)
+
+    def test_clearly_worse_stops_immediately(self):
+        test = SequentialTest(self.baseline, 2, 10)
+        self.assertEqual(self._repetitions(test, 3_000_000, 20_000), (WORSE, 1))
+
+    @unittest.skipUnless(HAS_SCIPY, 'scipy is not installed')
+    def test_noisy_runtimes_take_more_repetitions(self):
+        test = SequentialTest(self.baseline, 2, 10)
+        quiet_repetitions = [self._repetitions(test, 900_000, 1_000)[1] for _ in range(20)]
+        noisy_repetitions = [self._repetitions(test, 900_000, 150_000)[1] for _ in range(20)]
+        self.assertLess(sum(quiet_repetitions), sum(noisy_repetitions))
+        self.assertLessEqual(max(noisy_repetitions), 10)
+
+    @unittest.skipUnless(HAS_SCIPY, 'scipy is not installed')
+    def test_baseline_precision(self):
+        test = SequentialTest(None, 2, 10)
+        self.assertEqual(self._repetitions(test, 1_000_000, 1_000), (PRECISE, 2))
+        self.assertEqual(self._repetitions(test, 1_000_000, 500_000), (None, 10))
+
+    @unittest.skipUnless(HAS_SCIPY, 'scipy is not installed')
+    def test_previous_runtimes(self):
+        test = SequentialTest(self.baseline, 2, 10)
+        self.assertIsNone(test.decide([]))
+        test.previous = [500_000, 510_000]
+        self.assertEqual(test.decide([]), BETTER)
+
+
+if __name__ == '__main__':
+    unittest.main()
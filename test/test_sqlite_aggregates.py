@@ -0,0 +1,45 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Test the native SQLite median and percentile aggregates"""
+import random
+import sqlite3
+import statistics
+import unittest
+import numpy as np
+from utils.sqlite_aggregates import register_aggregates
+
+
+class TestSqliteAggregates(unittest.TestCase):
+    """TestCase for the aggregates replacing the sqlean stats extension"""
+
+    def setUp(self) -> None:
+        self.connection = sqlite3.connect(':memory:')
+        register_aggregates(self.connection)
+        self.connection.execute('CREATE TABLE measurements (config INTEGER, walltime INTEGER)')
+        self.values = [random.randint(0, 10_000) for _ in range(1001)]
+        self.connection.executemany('INSERT INTO measurements VALUES (?, ?)', [(i % 2, value) for i, value in enumerate(self.values)])
+
+    def tearDown(self) -> None:
+        self.connection.close()
+
+    def test_median(self):
+        result = self.connection.execute('SELECT config, median(walltime) FROM measurements GROUP BY config ORDER BY config').fetchall()
+        self.assertEqual(result, [(0, statistics.median(self.values[0::2])), (1, statistics.median(self.values[1::2]))])
+        self.assertEqual(self.connection.execute('SELECT median(walltime) FROM measurements WHERE config = 2').fetchone()[0], None)
+
+    def test_percentiles(self):
+        for name, percent in [('percentile_25', 25), ('percentile_90', 90), ('percentile_95', 95), ('percentile_99', 99)]:
+            result = self.connection.execute(f'SELECT {name}(walltime), percentile(walltime, {percent}) FROM measurements').fetchone()
+            self.assertAlmostEqual(result[0], np.percentile(self.values, percent))
+            self.assertAlmostEqual(result[1], np.percentile(self.values, percent))
+
+    def test_trimmed_mean(self):
+        result = self.connection.execute('SELECT trimmed_mean(walltime, 10), trimmed_mean(walltime, 0) FROM measurements').fetchone()
+        values = sorted(self.values)
+        self.assertAlmostEqual(result[0], statistics.mean(values[100:-100]))
+        self.assertAlmostEqual(result[1], statistics.mean(values))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,385 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Test AutoSteer's storage of benchmarking data"""
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import unittest
+from unittest import mock
+import storage
+from migrate_results import copy_results
+from utils.util import read_sql_file
+from test.results_database import ResultsDatabaseTestCase
+
+
+def _write_results(directory, worker, num_queries, num_repetitions):
+    """An exploration process of the stress test, all processes share the benchmark, the hint-sets, and the plans"""
+    storage.RESULTS_DIRECTORY = directory
+    storage.TESTED_DATABASE = 'test'
+    storage.BACKEND = 'sqlite'
+    storage.FLUSH_ROWS = 4  # many small transactions
+    storage.BENCHMARK_ID = storage.register_benchmark('benchmark')
+    for query in range(num_queries):
+        query_path = f'benchmark/{worker}_{query}.sql'
+        storage.register_query(query_path)
+        storage.register_query('benchmark/shared.sql')
+        for disabled_rules in [None, 'a', 'b', 'a,b']:
+            storage.register_query_config(query_path, disabled_rules, f'{{"rules": "{disabled_rules}"}}', hash(disabled_rules))
+            for walltime in range(num_repetitions):
+                storage.register_measurement(query_path, disabled_rules, walltime=walltime, input_data_size=0, nodes=1)
+        storage.register_optimizer(query_path, 'a', required=False)
+    storage.close()
+
+
+class TestStorage(ResultsDatabaseTestCase):
+    """TestCase for the SQLite storage session"""
+    backend = 'sqlite'
+
+    def setUp(self) -> None:
+        super().setUp()
+        storage.BENCHMARK_ID = storage.register_benchmark('benchmark')
+        storage.register_query('benchmark/1.sql')
+
+    def test_session_is_reused(self):
+        engine = storage.ENGINE
+        storage.register_query_fingerprint('benchmark/1.sql', 42)
+        storage.get_required_optimizers('benchmark/1.sql')
+        self.assertIs(engine, storage.ENGINE)
+
+    def test_median_aggregate(self):
+        self.assertEqual(storage.select_query('SELECT MEDIAN(a) FROM (SELECT 1 AS a UNION ALL SELECT 3 AS a) AS tab', {}), [2])
+
+    def test_session_follows_tested_database(self):
+        engine = storage.ENGINE
+        storage.TESTED_DATABASE = 'other'
+        storage.register_benchmark('benchmark')
+        self.assertIsNot(engine, storage.ENGINE)
+        self.assertTrue(os.path.isfile(f'{self.directory}/other.{self.backend}'))
+
+    def test_register_config_and_measurement(self):
+        self.assertFalse(storage.register_query_config('benchmark/1.sql', None, '{}', 1))
+        self.assertFalse(storage.register_query_config('benchmark/1.sql', 'a', '{"a": 1}', 2))
+        self.assertTrue(storage.register_query_config('benchmark/1.sql', 'b', '{}', 1))
+        storage.register_measurement('benchmark/1.sql', 'a', walltime=10, input_data_size=0, nodes=1)
+        self.assertTrue(storage.check_for_existing_measurements('benchmark/1.sql', 'a'))
+        self.assertFalse(storage.check_for_existing_measurements('benchmark/1.sql', 'b'))
+        self.assertFalse(storage.check_for_existing_measurements('benchmark/1.sql', 'a', num_repetitions=2))
+        self.assertEqual(storage.count_measurements('benchmark/1.sql', 'a'), 1)
+
+    def test_exploration_checkpoint(self):
+        self.assertIsNone(storage.load_exploration_checkpoint('benchmark/1.sql'))
+        storage.register_query_config('benchmark/1.sql', 'a', '{}', 1)
+        storage.register_measurement('benchmark/1.sql', 'a', walltime=10, input_data_size=0, nodes=1)
+        storage.save_exploration_checkpoint('benchmark/1.sql', storage.ExplorationCheckpoint(2, [['b']], [['a'], ['c']]))
+        # the checkpoint is buffered and written in the transaction of the measurements, a later checkpoint replaces it
+        self.assertEqual(len(storage.WRITE_BUFFER), 4)
+        storage.save_exploration_checkpoint('benchmark/1.sql', storage.ExplorationCheckpoint(2, [['b']], [['c']]))
+        self.assertEqual(len(storage.WRITE_BUFFER), 4)
+        checkpoint = storage.load_exploration_checkpoint('benchmark/1.sql')
+        self.assertEqual((checkpoint.dp_level, checkpoint.blacklist, checkpoint.pending, checkpoint.completed), (2, [['b']], [['c']], False))
+        storage.save_exploration_checkpoint('benchmark/1.sql', storage.ExplorationCheckpoint(3, [], [], completed=True))
+        self.assertTrue(storage.load_exploration_checkpoint('benchmark/1.sql').completed)
+        self.assertEqual(storage.select_query('SELECT count(*) FROM exploration_checkpoints', {}), [1])
+
+    def test_write_buffer(self):
+        storage.register_query_config('benchmark/1.sql', None, '{}', 1)
+        storage.register_measurement('benchmark/1.sql', None, walltime=10, input_data_size=0, nodes=1)
+        storage.register_measurement('benchmark/1.sql', None, walltime=12, input_data_size=0, nodes=1)
+        self.assertEqual(len(storage.WRITE_BUFFER), 4)  # plan, config, and two measurements
+        self.assertTrue(storage.register_query_fingerprint('benchmark/1.sql', 42))
+        self.assertFalse(storage.register_query_fingerprint('benchmark/1.sql', 43))
+
+        # reads flush the buffer first
+        df = storage.get_df('SELECT walltime FROM measurements ORDER BY walltime', {})
+        self.assertEqual(df['walltime'].to_list(), [10, 12])
+        self.assertEqual(len(storage.WRITE_BUFFER), 0)
+        self.assertFalse(storage.register_query_fingerprint('benchmark/1.sql', 43))
+
+    def test_failed_flush_keeps_rows(self):
+        storage.register_query_config('benchmark/1.sql', 'a', '{}', 1)
+        storage.register_measurement('benchmark/1.sql', 'a', walltime=10, input_data_size=0, nodes=1)
+        with mock.patch('storage._refresh_summary', side_effect=RuntimeError('disk full')):
+            self.assertRaises(RuntimeError, storage.flush)
+        self.assertEqual(len(storage.WRITE_BUFFER), 3)
+        storage.register_measurement('benchmark/1.sql', 'a', walltime=12, input_data_size=0, nodes=1)
+        self.assertEqual(storage.select_query('SELECT walltime FROM measurements ORDER BY id', {}), [10, 12])
+
+    def test_close_flushes_buffer(self):
+        storage.register_query_config('benchmark/1.sql', 'a', '{}', 1)
+        storage.register_measurement('benchmark/1.sql', 'a', walltime=10, input_data_size=0, nodes=1)
+        storage.close()
+        self.assertEqual(len(storage.WRITE_BUFFER), 0)
+        self.assertTrue(storage.check_for_existing_measurements('benchmark/1.sql', 'a'))
+
+    def test_hint_set_ids_are_cached(self):
+        storage.register_query_config('benchmark/1.sql', None, '{}', 1)
+        storage.register_query_config('benchmark/1.sql', 'a,b', '{}', 2)
+        self.assertEqual(storage.HINT_SET_IDS, {'a,b': 1})
+        storage.flush()
+        df = storage.get_df('SELECT hs.disabled_rules, hs.num_disabled_rules FROM query_optimizer_configs qoc, hint_sets hs '
+                            'WHERE hs.id = qoc.hint_set_id ORDER BY hs.id', {})
+        self.assertEqual(df.values.tolist(), [['None', 0], ['a,b', 2]])
+
+    def test_best_alternative_configuration(self):
+        for disabled_rules, walltimes in [(None, [10, 12, 14]), ('a', [5, 6, 7]), ('b', [20, 22])]:
+            storage.register_query_config('benchmark/1.sql', disabled_rules, '{}', hash(disabled_rules))
+            for walltime in walltimes:
+                storage.register_measurement('benchmark/1.sql', disabled_rules, walltime=walltime, input_data_size=0, nodes=1)
+        best = storage.best_alternative_configuration('benchmark')
+        self.assertEqual(len(best), 1)
+        self.assertEqual((best[0].path, best[0].disabled_rules, best[0].runtime, best[0].runtime_baseline), ('benchmark/1.sql', 'a', 6, 12))
+        self.assertEqual(storage.best_alternative_configuration('other'), [])
+        tail_latency = storage.best_alternative_configuration('benchmark', statistic='percentile_99')
+        self.assertAlmostEqual(tail_latency[0].runtime, 6.98)
+
+    def test_hint_set_summary(self):
+        self.assertIsNone(storage.best_hint_set('benchmark/1.sql'))
+        for disabled_rules, walltimes in [(None, [10, 12, 14]), ('a', [5, 6, 7]), ('b', [20, 22])]:
+            storage.register_query_config('benchmark/1.sql', disabled_rules, '{}', hash(disabled_rules))
+            for walltime in walltimes:
+                storage.register_measurement('benchmark/1.sql', disabled_rules, walltime=walltime, input_data_size=0, nodes=1)
+        best = storage.best_hint_set('benchmark/1.sql')
+        self.assertEqual((best.disabled_rules, best.runtime, best.runtime_baseline, best.savings, best.rank), ('a', 6, 12, 0.5, 1))
+
+        # new measurements update the summary of the affected config and the ranks of its query
+        for walltime in [1, 1, 1, 1]:
+            storage.register_measurement('benchmark/1.sql', 'b', walltime=walltime, input_data_size=0, nodes=1)
+        best = storage.best_hint_set('benchmark/1.sql')
+        self.assertEqual((best.disabled_rules, best.runtime, best.rank), ('b', 1, 1))
+        expected = storage.get_df('''SELECT hs.disabled_rules, median(m.walltime) AS median_walltime
+                                     FROM measurements m, query_optimizer_configs qoc, hint_sets hs
+                                     WHERE m.query_optimizer_config_id = qoc.id AND hs.id = qoc.hint_set_id
+                                     GROUP BY hs.disabled_rules ORDER BY hs.disabled_rules''', {})
+        summary = storage.get_df('''SELECT hs.disabled_rules, s.median_walltime FROM hint_set_summary s, hint_sets hs
+                                    WHERE hs.id = s.hint_set_id ORDER BY hs.disabled_rules''', {})
+        self.assertEqual(summary.values.tolist(), expected.values.tolist())
+        self.assertEqual(storage.select_query('SELECT rank FROM hint_set_summary WHERE hint_set_id > 0 ORDER BY hint_set_id', {}), [2, 1])
+
+        # only the configs having new measurements are aggregated, the savings and ranks of the other configs follow the new baseline
+        with storage._db() as conn:  # pylint: disable=protected-access
+            conn.execute('UPDATE hint_set_summary SET median_walltime = 0.5 WHERE hint_set_id = 1')
+        storage.register_measurement('benchmark/1.sql', None, walltime=100, input_data_size=0, nodes=1)
+        summary = storage.get_df('SELECT median_walltime, baseline_median, savings, rank FROM hint_set_summary WHERE hint_set_id > 0 ORDER BY hint_set_id', {})
+        self.assertEqual(summary.values.tolist(), [[0.5, 13, 12.5 / 13, 1], [1, 13, 12 / 13, 2]])
+
+    def test_hint_set_statistics(self):
+        for disabled_rules, walltimes in [(None, [10, 12, 14]), ('a', [5, 6, 10]), ('b', [20, 22]), ('a,b', [1])]:
+            storage.register_query_config('benchmark/1.sql', disabled_rules, '{}', hash(disabled_rules))
+            for walltime in walltimes:
+                storage.register_measurement('benchmark/1.sql', disabled_rules, walltime=walltime, input_data_size=0, nodes=1)
+        self.assertEqual(sorted(storage.baseline_runtimes('benchmark/1.sql')), [10, 12, 14])
+        statistics = storage.hint_set_statistics('benchmark/1.sql', 1)
+        self.assertEqual(statistics.index.tolist(), ['a', 'b'])
+        self.assertEqual(statistics['median'].tolist(), [6, 21])
+        self.assertEqual(statistics['mean'].tolist(), [7, 21])
+        self.assertEqual(statistics['num_censored'].tolist(), [0, 0])
+
+    def test_censored_measurements(self):
+        for disabled_rules, walltimes in [(None, [10, 12, 14]), ('a', [5, 6])]:
+            storage.register_query_config('benchmark/1.sql', disabled_rules, '{}', hash(disabled_rules))
+            for walltime in walltimes:
+                storage.register_measurement('benchmark/1.sql', disabled_rules, walltime=walltime, input_data_size=0, nodes=1)
+        storage.register_query_config('benchmark/1.sql', 'b', '{"b": 1}', 2)
+        storage.register_measurement('benchmark/1.sql', 'b', walltime=24, input_data_size=0, nodes=1, censored=True)
+        storage.register_measurement('benchmark/1.sql', 'a', walltime=100, input_data_size=0, nodes=1, censored=True)
+        statistics = storage.hint_set_statistics('benchmark/1.sql', 1)
+        self.assertEqual(statistics['num_censored'].tolist(), [1, 1])
+        # Deadlines are no runtimes, a hint-set measured only at its deadline is infinitely slow
+        self.assertEqual(statistics['median'].tolist(), [5.5, math.inf])
+        self.assertEqual(statistics['mean'].tolist(), [5.5, math.inf])
+        self.assertEqual(storage.hint_set_runtimes('benchmark/1.sql', 'b'), [])
+        self.assertEqual(storage.hint_set_runtimes('benchmark/1.sql', 'b', censored=True), [24])
+        # Neither the summary and the rankings nor the training data contain deadlines
+        summary = storage.get_df('SELECT hint_set_id, median_walltime FROM hint_set_summary ORDER BY hint_set_id', {})
+        self.assertEqual(summary['median_walltime'].tolist(), [12, 5.5])
+        tail_latency = storage.best_alternative_configuration('benchmark', statistic='percentile_99')
+        self.assertEqual([row.disabled_rules for row in tail_latency], ['a'])
+        self.assertAlmostEqual(tail_latency[0].runtime, 5.99)
+        self.assertEqual(sorted(m.walltime for m in storage.stream_experience('benchmark')), [5.5, 12])
+        # Censored measurements are kept when the others are rolled up
+        storage.compact_measurements(max_age_days=-1, keep_recent=0)
+        self.assertEqual(storage.select_query('SELECT walltime FROM measurements ORDER BY walltime', {}), [24, 100])
+        self.assertEqual(storage.hint_set_runtimes('benchmark/1.sql', 'b', censored=True), [24])
+
+    def test_measurement_index(self):
+        for disabled_rules, walltimes in [(None, [10, 12]), ('a', [5, 6])]:
+            storage.register_query_config('benchmark/1.sql', disabled_rules, '{}', hash(disabled_rules))
+            for walltime in walltimes:
+                storage.register_measurement('benchmark/1.sql', disabled_rules, walltime=walltime, input_data_size=0, nodes=1)
+        index = storage.measurement_index('benchmark/1.sql')
+        self.assertEqual(index.statistics(1), {'a': (5.5, 5.5, 0)})
+        # The index is fed by register_measurement, it does not read the database again
+        storage.register_measurement('benchmark/1.sql', 'a', walltime=10, input_data_size=0, nodes=1)
+        storage.register_measurement('benchmark/1.sql', 'a', walltime=30, input_data_size=0, nodes=1, censored=True)
+        self.assertIs(storage.measurement_index('benchmark/1.sql'), index)
+        self.assertEqual(index.statistics(1), {'a': (6.0, 7.0, 1)})
+        self.assertEqual(storage.hint_set_runtimes('benchmark/1.sql', 'a'), [5, 6, 10])
+        self.assertEqual(storage.count_measurements('benchmark/1.sql', 'a'), 4)
+        # A new session loads the same index from the database
+        storage.close()
+        self.assertEqual(storage.measurement_index('benchmark/1.sql').statistics(1), index.statistics(1))
+        self.assertEqual(sorted(storage.baseline_runtimes('benchmark/1.sql')), [10, 12])
+
+    def test_compaction(self):
+        for disabled_rules, walltimes in [(None, [10, 12, 14, 16, 18]), ('a', [5, 6, 7, 100])]:
+            storage.register_query_config('benchmark/1.sql', disabled_rules, '{}', hash(disabled_rules))
+            for walltime in walltimes:
+                storage.register_measurement('benchmark/1.sql', disabled_rules, walltime=walltime, input_data_size=0, nodes=1)
+        best = storage.best_hint_set('benchmark/1.sql')
+
+        report = storage.compact_measurements(max_age_days=365, keep_recent=2)
+        self.assertEqual((report.num_measurements, report.num_configs), (5, 2))
+        self.assertEqual(sorted(storage.select_query('SELECT walltime FROM measurements', {})), [7, 16, 18, 100])
+        rollup = storage.get_df('SELECT num_measurements, median_walltime, mean_walltime, min_walltime, max_walltime FROM measurement_rollups '
+                                'ORDER BY num_measurements DESC', {})
+        self.assertEqual(rollup.values.tolist(), [[3, 12, 12, 10, 14], [2, 5.5, 5.5, 5, 6]])
+        # the roll-ups keep the number of measurements, the medians, and the means
+        self.assertEqual(sorted(storage.baseline_runtimes('benchmark/1.sql')), [16, 18])
+        self.assertEqual(storage.baseline_statistics('benchmark/1.sql'), (14.0, 14.0, 0))
+        self.assertEqual(storage.count_measurements('benchmark/1.sql', None), 5)
+        statistics = storage.hint_set_statistics('benchmark/1.sql', 1)
+        self.assertEqual((statistics['median'].tolist(), statistics['mean'].tolist()), ([6.5], [29.5]))
+        after_compaction = storage.best_hint_set('benchmark/1.sql')
+        self.assertEqual((after_compaction.runtime, after_compaction.runtime_baseline), (best.runtime, best.runtime_baseline))
+
+        # roll-ups are merged with older roll-ups by their statistics, all measurements of the past are rolled up
+        report = storage.compact_measurements(max_age_days=-1, keep_recent=100)
+        self.assertEqual((report.num_measurements, report.num_configs), (4, 2))
+        self.assertEqual(storage.select_query('SELECT count(*) FROM measurements', {}), [0])
+        rollup = storage.get_df('SELECT num_measurements, median_walltime, mean_walltime, min_walltime, max_walltime FROM measurement_rollups '
+                                'ORDER BY num_measurements DESC', {})
+        self.assertEqual(rollup.values.tolist(), [[5, 14, 14, 10, 18], [4, 6.5, 29.5, 5, 100]])
+        self.assertEqual(storage.best_hint_set('benchmark/1.sql').runtime_baseline, 14)
+        self.assertEqual(storage.hint_set_statistics('benchmark/1.sql', 1)['mean'].tolist(), [29.5])
+        self.assertTrue(storage.check_for_existing_measurements('benchmark/1.sql', 'a'))
+
+    def test_experience(self):
+        for query_path in ['benchmark/1.sql', 'benchmark/2.sql', 'other/1.sql']:
+            for disabled_rules, walltimes in [(None, [10, 12, 14]), ('a', [5, 6])]:
+                storage.register_query_config(query_path, disabled_rules, f'{{"rules": "{disabled_rules}"}}', hash(disabled_rules))
+                for walltime in walltimes:
+                    storage.register_measurement(query_path, disabled_rules, walltime=walltime, input_data_size=0, nodes=1)
+
+        measurements = list(storage.stream_experience('benchmark', chunk_size=1))
+        self.assertEqual(len(measurements), 4)
+        default_plan = [m for m in measurements if m.num_disabled_rules == 0][0]
+        self.assertEqual((default_plan.walltime, default_plan.plan_json), (12, {'rules': 'None'}))
+        self.assertFalse(hasattr(default_plan, '__dict__'))
+
+        training_data, test_data = storage.experience('benchmark', training_ratio=0.5)
+        self.assertEqual((len(training_data), len(test_data)), (2, 2))
+        self.assertTrue({m.query_id for m in training_data}.isdisjoint({m.query_id for m in test_data}))
+
+    def test_plan_store(self):
+        plan = json.dumps({'operator': 'join', 'children': [{'operator': 'scan', 'table': f't{i}'} for i in range(50)]})
+        storage.register_query_config('benchmark/1.sql', None, plan, 1)
+        storage.register_query_config('benchmark/1.sql', 'a', json.dumps(json.loads(plan), indent=2), 1)
+        storage.register_query_config('benchmark/1.sql', 'b', 'Scan', 2)
+        storage.register_measurement('benchmark/1.sql', 'a', walltime=10, input_data_size=0, nodes=1)
+
+        report = storage.plan_store_report()
+        self.assertEqual((report.num_configs, report.num_plans), (3, 2))
+        self.assertEqual(report.plan_bytes, 2 * len(plan) + len('Scan'))
+        self.assertGreater(report.saved_bytes(), len(plan))
+        self.assertEqual(storage.select_query('SELECT compression FROM query_plans ORDER BY plan_size', {}), ['none', 'zlib'])
+        self.assertEqual(next(storage.stream_experience('benchmark')).plan_json, json.loads(plan))
+
+    def test_copy_results(self):
+        if self.backend != 'sqlite':
+            self.skipTest('copies SQLite results databases')
+        for disabled_rules, walltimes in [(None, [10, 12, 14]), ('a', [5, 6, 7]), ('b', [20, 22])]:
+            storage.register_query_config('benchmark/1.sql', disabled_rules, f'{{"rules": "{disabled_rules}"}}', 2 ** 62 + len(walltimes))
+            for walltime in walltimes:
+                storage.register_measurement('benchmark/1.sql', disabled_rules, walltime=walltime, input_data_size=0, nodes=1)
+        storage.register_query('benchmark/2.sql')
+        storage.register_query_fingerprint('benchmark/2.sql', 2 ** 63 - 1)
+        storage.close()
+
+        num_rows = copy_results('test', chunk_size=2)
+        self.assertEqual((num_rows['queries'], num_rows['hint_sets'], num_rows['measurements']), (2, 3, 8))
+        storage.BACKEND = 'duckdb'
+        best = storage.best_alternative_configuration('benchmark')
+        self.assertEqual((best[0].disabled_rules, best[0].runtime, best[0].runtime_baseline, best[0].rank), ('a', 6, 12, 1))
+        self.assertEqual(sorted(m.plan_json['rules'] for m in storage.stream_experience('benchmark')), ['None', 'a', 'b'])
+        self.assertFalse(storage.register_query_fingerprint('benchmark/2.sql', 42))
+        self.assertEqual(storage.select_query('SELECT hash FROM query_optimizer_configs ORDER BY hash', {})[0], 2 ** 62 + 2)
+        # ids of new rows follow the copied ones
+        self.assertGreater(storage.register_query('benchmark/3.sql'), 2)
+        storage.register_query_config('benchmark/1.sql', 'c', '{}', 1)
+        storage.flush()
+        self.assertEqual(storage.HINT_SET_IDS['c'], 3)
+        with self.assertRaises(FileExistsError):
+            copy_results('test')
+
+
+class TestDuckDBStorage(TestStorage):
+    """TestCase for the DuckDB storage session"""
+    backend = 'duckdb'
+
+
+class TestConcurrentWriters(ResultsDatabaseTestCase):
+    """Stress test for several exploration processes sharing one SQLite results database"""
+    num_processes = 4
+    num_queries = 5
+    num_repetitions = 3
+
+    def test_no_rows_are_lost_or_duplicated(self):
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=_write_results, args=(self.directory, worker, self.num_queries, self.num_repetitions))
+                     for worker in range(self.num_processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual([process.exitcode for process in processes], [0] * self.num_processes)
+
+        num_configs = self.num_processes * self.num_queries * 4
+        self.assertEqual(storage.select_query('PRAGMA journal_mode', {}), ['wal'])
+        self.assertEqual(storage.select_query('SELECT count(*) FROM benchmarks', {}), [1])
+        self.assertEqual(storage.select_query('SELECT count(*) FROM queries', {}), [self.num_processes * self.num_queries + 1])
+        self.assertEqual(storage.select_query('SELECT count(*) FROM hint_sets', {}), [4])
+        self.assertEqual(storage.select_query('SELECT count(*) FROM query_plans', {}), [4])
+        self.assertEqual(storage.select_query('SELECT count(DISTINCT query_id || \'_\' || hint_set_id) FROM query_optimizer_configs', {}), [num_configs])
+        self.assertEqual(storage.select_query('SELECT count(*) FROM query_optimizer_configs', {}), [num_configs])
+        self.assertEqual(storage.select_query('SELECT count(*) FROM measurements', {}), [num_configs * self.num_repetitions])
+        self.assertEqual(storage.select_query('SELECT count(*) FROM hint_set_summary', {}), [num_configs])
+        self.assertEqual(storage.select_query('SELECT count(*) FROM query_effective_optimizers', {}), [self.num_processes * self.num_queries])
+
+
+class TestStorageMigration(ResultsDatabaseTestCase):
+    """TestCase for migrating results databases created by previous versions"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        with sqlite3.connect(f'{self.directory}/test.sqlite') as conn:
+            conn.executescript(read_sql_file(storage.SCHEMA_FILE))
+            # previous versions registered each query once per training run
+            conn.executescript("""
+                INSERT INTO benchmarks (id, name) VALUES (1, 'benchmark');
+                INSERT INTO queries (id, benchmark_id, query_path, result_fingerprint) VALUES (1, 1, 'benchmark/1.sql', NULL), (2, 1, 'benchmark/1.sql', 42);
+                INSERT INTO query_effective_optimizers VALUES (1, 'a'), (2, 'a'), (2, 'b');
+                INSERT INTO query_optimizer_configs (id, query_id, disabled_rules, query_plan, num_disabled_rules, hash)
+                VALUES (1, 1, 'None', '{}', 0, 1), (2, 2, 'None', '{}', 0, 1), (3, 2, 'a', '{}', 1, 2);
+                INSERT INTO measurements (query_optimizer_config_id, walltime, machine, time, input_data_size, num_compute_nodes)
+                VALUES (1, 10, 'host', 'now', 0, 1), (3, 5, 'host', 'now', 0, 1);
+                """)
+
+    def test_migration(self):
+        self.assertEqual(storage.select_query('PRAGMA user_version', {}), [9])
+        self.assertEqual(storage.select_query('SELECT id FROM queries', {}), [1])
+        self.assertEqual(storage.select_query('SELECT result_fingerprint FROM queries', {}), [42])
+        self.assertEqual(sorted(storage.get_effective_optimizers('benchmark/1.sql')), ['a', 'b'])
+        df = storage.get_df('SELECT qoc.query_id, hs.disabled_rules, m.walltime FROM measurements m, query_optimizer_configs qoc, hint_sets hs '
+                            'WHERE m.query_optimizer_config_id = qoc.id AND hs.id = qoc.hint_set_id ORDER BY m.walltime', {})
+        self.assertEqual(df.values.tolist(), [[1, 'a', 5], [1, 'None', 10]])
+        self.assertEqual(storage.plan_store_report().num_plans, 1)
+        self.assertEqual(set(storage.select_query('SELECT plan_digest FROM query_optimizer_configs', {})), {storage.plan_digest('{}')})
+        self.assertEqual(storage.select_query('SELECT median_walltime FROM hint_set_summary ORDER BY hint_set_id', {}), [10, 5])
+        self.assertEqual(storage.best_hint_set('benchmark/1.sql').savings, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
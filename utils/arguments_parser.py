@@ -14,5 +14,7 @@ def get_parser():
     parser.add_argument('--database', help='Which database connector should be used', type=str)
     parser.add_argument('--benchmark', help='path to a directory with SQL files', type=str)
     parser.add_argument('--explain', help='explain the query', action='store_true')
+    parser.add_argument('--resume', help='continue an interrupted training run, skip explored queries and measured hint-sets', action='store_true',
+                        default=False)
     parser.add_argument('--repeats', help='repeat benchmark', type=int, default=1)
     return parser
@@ -0,0 +1,102 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""A minimal engine for DuckDB results databases providing the subset of SQLAlchemy's engine and connection API used by storage.py"""
+import re
+import threading
+import duckdb
+from sqlalchemy.exc import IntegrityError
+
+# Named parameters (:name) but no casts (::type)
+_NAMED_PARAMETER = re.compile(r'(?<![:\w]):(\w+)')
+
+
+def positional_statement(statement: str) -> tuple[str, list]:
+    """Translate named parameters to DuckDB's positional parameters, returns the statement and the order of the parameter names"""
+    names = []
+
+    def replace(match):
+        names.append(match.group(1))
+        return '?'
+
+    return _NAMED_PARAMETER.sub(replace, statement), names
+
+
+class DuckDBResult:
+    """The result of a statement, rows are fetched from DuckDB's columnar result in chunks"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self.cursor.fetchmany(size)
+
+    def df(self):
+        return self.cursor.df()
+
+
+class DuckDBTransaction:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __enter__(self):
+        self.cursor.execute('BEGIN TRANSACTION')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cursor.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+
+
+class DuckDBConnection:
+    """A cursor of the engine's database connection, cursors can be used concurrently by different threads"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def begin(self) -> DuckDBTransaction:
+        return DuckDBTransaction(self.cursor)
+
+    def execute(self, statement, *multiparams, **params) -> DuckDBResult:
+        """Execute a statement with named parameters, a list of parameter dicts executes the statement once per dict"""
+        sql, names = positional_statement(str(statement))
+        try:
+            if len(multiparams) > 0 and isinstance(multiparams[0], list):
+                self.cursor.executemany(sql, [[row[name] for name in names] for row in multiparams[0]])
+            else:
+                values = multiparams[0] if len(multiparams) > 0 else params
+                self.cursor.execute(sql, [values[name] for name in names])
+        except duckdb.ConstraintException as err:
+            raise IntegrityError(sql, params, err) from err
+        return DuckDBResult(self.cursor)
+
+    def close(self):
+        self.cursor.close()
+
+
+class DuckDBEngine:
+    """Opens the database file once per process, every checked out connection uses its own cursor"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.path = url[len('duckdb:///'):]
+        self.connection = duckdb.connect(self.path)
+        self.lock = threading.Lock()
+
+    def connect(self) -> DuckDBConnection:
+        with self.lock:
+            return DuckDBConnection(self.connection.cursor())
+
+    def dispose(self):
+        self.connection.close()
@@ -0,0 +1,91 @@
+# Copyright 2022 Intel Corporation
+# SPDX-License-Identifier: MIT
+#
+"""Median, percentile, and trimmed mean aggregates for SQLite. They replace the sqlean stats extension if it is not available."""
+from array import array
+import numpy as np
+
+
+class _SelectionAggregate:
+    """Collects the values of a group in a typed array (amortized preallocation) and selects order statistics in linear time"""
+
+    def __init__(self):
+        self.values = array('d')
+
+    def step(self, value, *_):
+        if value is not None:
+            self.values.append(value)
+
+    def _percentile(self, percent):
+        """Linearly interpolated percentile, numpy.partition is a selection and does not sort all values"""
+        n = len(self.values)
+        if n == 0:
+            return None
+        values = np.frombuffer(self.values, dtype=np.float64)
+        position = percent / 100.0 * (n - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, n - 1)
+        partitioned = np.partition(values, [lower, upper])
+        return float(partitioned[lower] + (partitioned[upper] - partitioned[lower]) * (position - lower))
+
+
+def _fixed_percentile(percent):
+    class FixedPercentile(_SelectionAggregate):
+        def finalize(self):
+            return self._percentile(percent)
+
+    return FixedPercentile
+
+
+class Percentile(_SelectionAggregate):
+    """percentile(value, percent) with 0 <= percent <= 100"""
+
+    def __init__(self):
+        super().__init__()
+        self.percent = None
+
+    def step(self, value, *args):
+        self.percent = args[0]
+        super().step(value)
+
+    def finalize(self):
+        return None if self.percent is None else self._percentile(self.percent)
+
+
+class TrimmedMean(_SelectionAggregate):
+    """trimmed_mean(value, percent) discards percent of the values at each tail before averaging"""
+
+    def __init__(self):
+        super().__init__()
+        self.percent = 0
+
+    def step(self, value, *args):
+        self.percent = args[0]
+        super().step(value)
+
+    def finalize(self):
+        n = len(self.values)
+        cut = int(n * self.percent / 100.0)
+        if n == 0 or 2 * cut >= n:
+            return None
+        partitioned = np.partition(np.frombuffer(self.values, dtype=np.float64), [cut, n - cut - 1])
+        return float(np.mean(partitioned[cut:n - cut]))
+
+
+# Same names as the sqlean stats extension, which overrides them when it is loaded
+AGGREGATES = {
+    ('median', 1): _fixed_percentile(50),
+    ('percentile_25', 1): _fixed_percentile(25),
+    ('percentile_75', 1): _fixed_percentile(75),
+    ('percentile_90', 1): _fixed_percentile(90),
+    ('percentile_95', 1): _fixed_percentile(95),
+    ('percentile_99', 1): _fixed_percentile(99),
+    ('percentile', 2): Percentile,
+    ('trimmed_mean', 2): TrimmedMean,
+}
+
+
+def register_aggregates(dbapi_conn) -> None:
+    """Register all aggregates on a sqlite3 connection"""
+    for (name, num_args), aggregate in AGGREGATES.items():
+        dbapi_conn.create_aggregate(name, num_args, aggregate)
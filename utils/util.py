@@ -6,6 +6,7 @@
 import operator
 from functools import reduce
 import hashlib
+import json
 
 
 def read_sql_file(filename, encoding='utf-8') -> str:
@@ -30,14 +31,43 @@ def hash_sql_result(s):
     return int.from_bytes(sha256.digest()[:4], 'big')
 
 
-def hash_query_plan(s):
-    """Generate a hash fingerprint for the result retrieved from the connector to assert that results are (probably) identical.
-    Its important to round floats here, e.g. using 2 decimal places."""
-    flattened_result = reduce(operator.concat, s)
-    normalized_result = tuple(map(lambda item: round(item, 2) if isinstance(item, float) else item, flattened_result))
+def plan_fingerprint(plan, volatile_keys=frozenset(), volatile_pattern=None, estimate_keys=frozenset(), significant_digits=2) -> str:
+    """Generate a fingerprint of the structure of a query plan that is stable across processes, unlike Python's salted hash().
+    Json plans are hashed node by node with sorted keys and volatile keys are skipped. The numbers below estimate keys are rounded to
+    significant digits, i.e. estimates within this tolerance do not change the fingerprint, all other numbers (e.g. limits or constants)
+    are hashed exactly. Matches of the volatile pattern (e.g. generated ids) are removed from strings and text plans.
+    The plan is hashed in a single pass over its nodes."""
+    if isinstance(plan, str):
+        try:
+            plan = json.loads(plan)
+        except ValueError:
+            plan = '\n'.join(line.strip() for line in plan.strip().splitlines())  # a text plan
     sha256 = hashlib.sha256()
-    for item in normalized_result:
-        sha256.update(str(item).encode())
+
+    def update(node, is_estimate: bool) -> None:
+        if isinstance(node, dict):
+            sha256.update(b'{')
+            for key in sorted(node):
+                if key not in volatile_keys:
+                    update(key, False)
+                    update(node[key], is_estimate or key in estimate_keys)
+            sha256.update(b'}')
+        elif isinstance(node, (list, tuple)):
+            sha256.update(b'[')
+            for child in node:
+                update(child, is_estimate)
+            sha256.update(b']')
+        else:
+            if isinstance(node, str):
+                token = 's' + (volatile_pattern.sub('', node) if volatile_pattern is not None else node)
+            elif isinstance(node, (int, float)) and not isinstance(node, bool):
+                token = f'n{float(node):.{significant_digits}g}' if is_estimate else f'n{node!r}'
+            else:
+                token = f'v{node}'
+            # The length prefix keeps adjacent tokens apart
+            sha256.update(f'{len(token)}:{token}'.encode())
+
+    update(plan, False)
     return sha256.hexdigest()
 
 